@@ -0,0 +1,78 @@
+#!/bin/env python3
+
+"""Checks that binary IR reproduces the Unit obtained from textual IR"""
+
+import io
+import unittest
+
+from BE.Base import ir
+from BE.Base import serialize
+from IR import binary_ir
+
+_STDLIB64 = ["../StdLib/syscall.extern64.asm", "../StdLib/std_lib.64.asm"]
+
+
+def _RoundTrip(text: str):
+    expected = serialize.UnitRenderToASM(
+        serialize.UnitParseFromAsm(io.StringIO(text)))
+    buf = io.BytesIO()
+    writer = binary_ir.Writer(buf)
+    writer.write(text)
+    writer.Close()
+    buf.seek(0)
+    unit = ir.Unit("module")
+    serialize.UnitAddParseFromBinary(unit, buf)
+    serialize.UnitSanityCheckAfterParse(unit)
+    return expected, serialize.UnitRenderToASM(unit), len(buf.getvalue())
+
+
+class TestBinaryIr(unittest.TestCase):
+
+    def _CheckFiles(self, filenames):
+        text = ""
+        for fn in filenames:
+            with open(fn) as fin:
+                text += fin.read()
+        expected, actual, size = _RoundTrip(text)
+        self.assertEqual(expected, actual)
+        self.assertLess(size, len(text))
+
+    def testNanoJpeg(self):
+        self._CheckFiles(_STDLIB64 + ["../TestData/nano_jpeg.64.asm"])
+
+    def testSwitch(self):
+        self._CheckFiles(_STDLIB64 + ["../TestData/switch.asm"])
+
+    def testReals(self):
+        self._CheckFiles(["../TestData/parse_real_test.64.asm"])
+
+    def testOperandEncodings(self):
+        expected, actual, _ = _RoundTrip("""
+.mem counter 8 RW
+.data 2 [1 2 0x3 -1:s8 7:u32]
+.data 1 "a\\x01b"
+.mem table 8 RO
+.addr.mem 8 counter 8
+
+.fun foo NORMAL [S64] = [S64 R64]
+.stk buf 4 32
+.bbl entry
+  poparg x:S64
+  poparg f:R64
+  add y:S64 = x -5
+  and z:S64 = y 0xffffffffffffffff
+  mov u:U8 = 255:U8
+  add g:R64 = f 0x1.8p1
+  add g = g -inf:R64
+  lea p:A64 = counter
+  lea.mem q:A64 = table 0
+  lea.stk s:A64 = buf 16
+  st s 4 = y
+  pusharg z
+  ret
+""")
+        self.assertEqual(expected, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -81,13 +81,13 @@ _EVALUATORS_ALU1 = {
 def EvaluatateALU(opcode: o.Opcode, op1: ir.Const, op2: ir.Const) -> ir.Const:
     evaluator = _EVALUATORS_ALU.get(opcode)
     assert evaluator, f"Evaluator NYI for: {opcode}"
-    return ir.Const(op1.kind, _truncate(op1.kind, evaluator(op1.value, op2.value)))
+    return ir.InternConst(op1.kind, _truncate(op1.kind, evaluator(op1.value, op2.value)))
 
 
 def EvaluatateALU1(opcode: o.Opcode, op: ir.Const) -> Optional[ir.Const]:
     evaluator = _EVALUATORS_ALU1.get(opcode)
     assert evaluator, f"Evaluator NYI for: {opcode}"
-    return ir.Const(op.kind, _truncate(op.kind, evaluator(op.kind, op.value)))
+    return ir.InternConst(op.kind, _truncate(op.kind, evaluator(op.kind, op.value)))
 
 
 def EvaluatateCondBra(opcode: o.Opcode, op1: ir.Const, op2: ir.Const) -> bool:
@@ -106,13 +106,13 @@ def ConvertIntValue(kind_dst: o.DK, val: ir.Const) -> ir.Const:
     width_src = kind_src.bitwidth()
     masked = val.value & ((1 << width_dst) - 1)
     if kind_dst.flavor() == o.DK_FLAVOR_U:
-        return ir.Const(kind_dst, val.value & masked)
+        return ir.InternConst(kind_dst, val.value & masked)
     # print ("@@@", kind_dst.name, width_dst, kind_src, width_src, num_kind, x)
     elif width_dst > width_src:
-        return ir.Const(kind_dst, val.value)
+        return ir.InternConst(kind_dst, val.value)
     else:
         # dst is ACS and width_dst <= width_src
         will_be_negative = val.value & (1 << (width_dst - 1))
         if will_be_negative:
-            return ir.Const(kind_dst, masked - (1 << width_dst))
-        return ir.Const(kind_dst, masked)
+            return ir.InternConst(kind_dst, masked - (1 << width_dst))
+        return ir.InternConst(kind_dst, masked)
@@ -14,7 +14,7 @@ Mod: Module
 import dataclasses
 import enum
 import struct
-from typing import List, Dict, Set, Optional, Any
+from typing import AbstractSet, List, Dict, Set, Optional, Any
 
 from IR import opcode_tab as o
 from Util import parse
@@ -56,9 +56,13 @@ _NUM_CONVERSION_STR = {
 }
 
 
-@dataclasses.dataclass(init=True)
+@dataclasses.dataclass(init=True, slots=True)
 class Const:
-    """Constant Number (arbitrary precision int or float)"""
+    """Constant Number (arbitrary precision int or float)
+
+    Consts may be shared between instructions (see InternConst), so they must not
+    be modified after creation. Create a new one instead.
+    """
 
     kind: o.DK
     value: Any
@@ -117,17 +121,33 @@ class Const:
         return self.value == other.value
 
 
+# Pool of shared Consts so that the (very common) small constants like zero offsets
+# are not duplicated for every instruction using them.
+# Reals are keyed by their bit pattern to keep 0.0 and -0.0 apart.
+_CONST_POOL: Dict[Any, Const] = {}
+
+
+def InternConst(kind: o.DK, value: Any) -> Const:
+    """Returns a shared Const with the given kind and value"""
+    key = (kind, struct.pack("<d", value)) if kind in (o.DK.R32, o.DK.R64) else (kind, value)
+    out = _CONST_POOL.get(key)
+    if out is None:
+        out = Const(kind, value)
+        _CONST_POOL[key] = out
+    return out
+
+
 def ParseConst(value_str: str, kind: o.DK) -> Const:
     flavor = kind.flavor()
     if flavor is o.DK_FLAVOR_R:
-        return Const(kind, parse.ParseReal(value_str))
+        return InternConst(kind, parse.ParseReal(value_str))
 
     bit_width = kind.bitwidth()
     x = int(value_str, 0)
     if flavor is o.DK_FLAVOR_U:
         assert x >= 0
         assert x < (1 << bit_width)
-        return Const(kind, x)
+        return InternConst(kind, x)
 
     # unsigned hex numbers may represent signed values
     if value_str.startswith("0x") and x >= (1 << (bit_width - 1)):
@@ -139,7 +159,7 @@ def ParseConst(value_str: str, kind: o.DK) -> Const:
     else:
         assert -x <= (1 << (bit_width - 1))
 
-    return Const(kind, x)
+    return InternConst(kind, x)
 
 
 def OffsetConst(value: int) -> Const:
@@ -155,7 +175,7 @@ def OffsetConst(value: int) -> Const:
         kind = o.DK.S64 if value < 0 else o.DK.U64
     else:
         assert False
-    return Const(kind, value)
+    return InternConst(kind, value)
 
 
 def ParseOffsetConst(value_str: str) -> Const:
@@ -266,9 +286,12 @@ CPU_REG_SPILL = CpuReg("CPU_REG_SPILL", -1, 1000)
 # The bot lattice element is represented by not being in the REG_DEG_MAP
 
 
-@dataclasses.dataclass()
+@dataclasses.dataclass(slots=True)
 class Ins:
-    """Instruction"""
+    """Instruction
+
+    Note: Ins are very numerous so we use slots to keep them small
+    """
 
     opcode: o.Opcode
     operands: List[Any]
@@ -317,7 +340,7 @@ class Bbl:
     edge_out: List["Bbl"] = dataclasses.field(default_factory=list)
     edge_in: List["Bbl"] = dataclasses.field(default_factory=list)
     # set of reg live at the end of the Bbl
-    live_out: Set[Reg] = dataclasses.field(default_factory=set)
+    live_out: AbstractSet[Reg] = dataclasses.field(default_factory=set)
     defs_in: Dict[Reg, Ins] = dataclasses.field(default_factory=dict)
 
     def AddIns(self, ins: Ins):
@@ -731,22 +754,84 @@ def UnitCheckCompatibility(
 # the Ins will be dropped
 
 
-def BblGenericRewrite(bbl: Bbl, fun: Fun,
-                      ins_transformer, **extra) -> int:
-    """Ins at a time rewriter for Bbls"""
+def _BblRewriteInPlace(bbl: Bbl, ins_transformer, args, extra) -> int:
+    """Applies ins_transformer(ins, *args, **extra) to every Ins of the Bbl
+
+    The Ins list is updated in place. A new list is only allocated once an Ins
+    expands into more Ins than there is room for.
+    """
     count = 0
-    inss: List[Ins] = []
-    for ins in bbl.inss:
-        new_inss = ins_transformer(ins, fun, **extra)
+    inss = bbl.inss
+    w = 0
+    out: Optional[List[Ins]] = None  # set once we ran out of room
+    for r in range(len(inss)):
+        ins = inss[r]
+        new_inss = ins_transformer(ins, *args, **extra)
         if new_inss is None:
-            new_inss = [ins]
-        else:
-            count += 1
-        inss += new_inss
-    bbl.inss = inss
+            if out is None:
+                inss[w] = ins
+                w += 1
+            else:
+                out.append(ins)
+            continue
+        count += 1
+        if out is None:
+            if w + len(new_inss) <= r + 1:
+                # we only ever write slots that have been consumed already
+                inss[w:w + len(new_inss)] = new_inss
+                w += len(new_inss)
+                continue
+            out = inss[:w]
+        out += new_inss
+    if out is None:
+        del inss[w:]
+    else:
+        bbl.inss = out
+    return count
+
+
+def _BblRewriteInPlaceReverse(bbl: Bbl, ins_transformer, args, extra) -> int:
+    """Like _BblRewriteInPlace but processes the Ins last to first
+
+    Note: the Ins returned by the ins_transformer are also in reverse order.
+    """
+    count = 0
+    inss = bbl.inss
+    w = len(inss)
+    out: Optional[List[Ins]] = None  # set once we ran out of room, in reverse order
+    for r in range(len(inss) - 1, -1, -1):
+        ins = inss[r]
+        new_inss = ins_transformer(ins, *args, **extra)
+        if new_inss is None:
+            if out is None:
+                w -= 1
+                inss[w] = ins
+            else:
+                out.append(ins)
+            continue
+        count += 1
+        if out is None:
+            if w - len(new_inss) >= r:
+                # we only ever write slots that have been consumed already
+                inss[w - len(new_inss):w] = new_inss[::-1]
+                w -= len(new_inss)
+                continue
+            out = inss[w:][::-1]
+        out += new_inss
+    if out is None:
+        del inss[:w]
+    else:
+        out.reverse()
+        bbl.inss = out
     return count
 
 
+def BblGenericRewrite(bbl: Bbl, fun: Fun,
+                      ins_transformer, **extra) -> int:
+    """Ins at a time rewriter for Bbls"""
+    return _BblRewriteInPlace(bbl, ins_transformer, (fun,), extra)
+
+
 def FunGenericRewrite(fun: Fun, ins_transformer, **extra) -> int:
     """Ins at a time rewriter for Funs"""
     count = 0
@@ -757,17 +842,7 @@ def FunGenericRewrite(fun: Fun, ins_transformer, **extra) -> int:
 
 def BblGenericRewriteWithBbl(bbl: Bbl, fun: Fun, ins_transformer, **extra) -> int:
     """Ins at a time rewriter for Bbls"""
-    count = 0
-    inss: List[Ins] = []
-    for ins in bbl.inss:
-        new_inss = ins_transformer(ins, bbl, fun, **extra)
-        if new_inss is None:
-            new_inss = [ins]
-        else:
-            count += 1
-        inss += new_inss
-    bbl.inss = inss
-    return count
+    return _BblRewriteInPlace(bbl, ins_transformer, (bbl, fun), extra)
 
 
 def FunGenericRewriteWithBbl(fun: Fun, ins_transformer, **extra) -> int:
@@ -781,17 +856,7 @@ def FunGenericRewriteWithBbl(fun: Fun, ins_transformer, **extra) -> int:
 def BblGenericRewriteReverse(bbl: Bbl, fun: Fun,
                              ins_transformer, **extra) -> int:
     """Ins at a time rewriter for Bbls"""
-    count = 0
-    inss: List[Ins] = []
-    for ins in reversed(bbl.inss):
-        new_inss = ins_transformer(ins, fun, **extra)
-        if new_inss is None:
-            new_inss = [ins]
-        else:
-            count += 1
-        inss += new_inss
-    bbl.inss = list(reversed(inss))
-    return count
+    return _BblRewriteInPlaceReverse(bbl, ins_transformer, (fun,), extra)
 
 
 def FunGenericRewriteReverse(
@@ -820,3 +885,18 @@ def FunIsLeaf(fun) -> bool:
             if ins.opcode is o.BSR or ins.opcode is o.JSR:
                 return False
     return True
+
+
+def FunSizeCounters(fun: Fun) -> Dict[str, int]:
+    """Size metrics recorded by the timing instrumentation (see Util/timing.py)"""
+    return {"inss": sum(len(bbl.inss) for bbl in fun.bbls),
+            "bbls": len(fun.bbls),
+            "regs": len(fun.regs)}
+
+
+def UnitSizeCounters(unit: Unit) -> Dict[str, int]:
+    out = {"inss": 0, "bbls": 0, "regs": 0, "funs": len(unit.funs)}
+    for fun in unit.funs:
+        for k, v in FunSizeCounters(fun).items():
+            out[k] += v
+    return out
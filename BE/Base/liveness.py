@@ -2,8 +2,11 @@
 
 the LiveRange computation using it"""
 
+import array
+import collections
+import collections.abc
 import dataclasses
-from typing import List, Tuple, Set, Dict
+from typing import AbstractSet, Any, List, Tuple, Set, Dict, Iterator
 import enum
 
 from BE.Base import ir
@@ -11,20 +14,57 @@ from BE.Base import cfg
 from IR import opcode_tab as o
 
 
-@dataclasses.dataclass()
-class Liveness:
-    """Liveness summary for Bbl
+class RegBits(dict):
+    """Dense numbering of the Regs of a Fun
+
+    Maps each Reg to an int with a single bit set so that sets of Regs can be
+    represented as (arbitrary precision) ints. Regs not known at construction time
+    get the next free bit on first lookup.
+    """
+
+    def __init__(self, regs: List[ir.Reg]):
+        super().__init__((reg, 1 << n) for n, reg in enumerate(regs))
+        self.regs: List[ir.Reg] = list(regs)
+
+    def __missing__(self, reg: ir.Reg) -> int:
+        bit = 1 << len(self.regs)
+        self[reg] = bit
+        self.regs.append(reg)
+        return bit
+
 
-    Only `live_out` is persisted for the use by optimizations.
-    `live_in`, `live_def`, `live_use` are used  only during the analysis phase.
+class RegSetView(collections.abc.Set):
+    """Read-only set of Regs backed by a bit vector
+
+    This is what FunComputeLivenessInfo stores in bbl.live_out. Membership tests
+    and len() do not require a real set to be built.
+    Use copy() to obtain a regular (mutable) set.
     """
+    __slots__ = ("bits", "reg_bits")
+
+    def __init__(self, bits: int, reg_bits: RegBits):
+        self.bits = bits
+        self.reg_bits = reg_bits
+
+    def __contains__(self, reg: Any) -> bool:
+        return (self.reg_bits.get(reg, 0) & self.bits) != 0
+
+    def __iter__(self) -> Iterator[ir.Reg]:
+        bits = self.bits
+        regs = self.reg_bits.regs
+        while bits:
+            low = bits & -bits
+            yield regs[low.bit_length() - 1]
+            bits ^= low
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def copy(self) -> Set[ir.Reg]:
+        return set(self)
 
-    live_in: Set[ir.Reg] = dataclasses.field(default_factory=set)
-    live_out: Set[ir.Reg] = dataclasses.field(default_factory=set)
-    # defined
-    live_def: Set[ir.Reg] = dataclasses.field(default_factory=set)
-    # used before defined
-    live_use: Set[ir.Reg] = dataclasses.field(default_factory=set)
+    def __repr__(self):
+        return repr(self.copy())
 
 
 def InsMaybeReplaceDefReg(ins: ir.Ins, reg_old: ir.Reg, reg_new: ir.Reg) -> int:
@@ -52,44 +92,48 @@ def InsMaybeReplaceUseReg(ins: ir.Ins, reg_old: ir.Reg, reg_new: ir.Reg) -> int:
     return count
 
 
-def _InsUpdateDefUse(ins: ir.Ins, fun: ir.Fun, defs: Set[ir.Reg], uses: Set[ir.Reg]):
-    """Compute the set of defined and used registers for each instruction"""
-    if ins.opcode.is_call():
-        # note: a call instruction may have at most one used reg if opcode is JSR
-        callee: ir.Fun = cfg.InsCallee(ins)
-        assert isinstance(callee, ir.Fun)
-        for cpu_reg in callee.cpu_live_out:
-            # we intentionally iterate overall regs here
-            for reg in fun.regs:
-                if reg.cpu_reg is cpu_reg:
-                    defs.add(reg)
-                    uses.discard(reg)
-        # for cpu_reg in callee.cpu_live_clobber:
-        #     defs.add(cpu_reg)
-        #     uses.discard(cpu_reg)
-        # for cpu_reg in callee.cpu_live_in:
-        #     uses.add(cpu_reg)
-
-    num_defs = ins.opcode.def_ops_count()
-    for n, reg in enumerate(ins.operands):
-        if not isinstance(reg, ir.Reg): continue
-        if n < num_defs:
-            defs.add(reg)
-            uses.discard(reg)
-        else:
-            uses.add(reg)
+def _CpuRegBits(fun: ir.Fun, reg_bits: RegBits) -> Dict[int, int]:
+    """Maps the id of a cpu_reg to the bits of all the Regs assigned to it"""
+    out: Dict[int, int] = collections.defaultdict(int)
+    for reg in fun.regs:
+        if reg.cpu_reg is not None:
+            out[id(reg.cpu_reg)] |= reg_bits[reg]
+    return out
 
 
-def _BblDefUse(bbl: ir.Bbl, fun: ir.Fun) -> Tuple[Set[ir.Reg], Set[ir.Reg]]:
-    bbl_def: Set[ir.Reg] = set()
-    bbl_use: Set[ir.Reg] = set()
+def _BblDefUse(bbl: ir.Bbl, reg_bits: RegBits, cpu_reg_bits: Dict[int, int]) -> Tuple[int, int]:
+    """Compute the set of defined and used (before defined) registers for a Bbl"""
+    defs = 0
+    uses = 0
     for ins in reversed(bbl.inss):
-        _InsUpdateDefUse(ins, fun, bbl_def, bbl_use)
-    return bbl_def, bbl_use
+        if ins.opcode.is_call():
+            # note: a call instruction may have at most one used reg if opcode is JSR
+            callee: ir.Fun = cfg.InsCallee(ins)
+            assert isinstance(callee, ir.Fun)
+            for cpu_reg in callee.cpu_live_out:
+                bits = cpu_reg_bits.get(id(cpu_reg), 0)
+                defs |= bits
+                uses &= ~bits
+            # for cpu_reg in callee.cpu_live_clobber:
+            #     defs.add(cpu_reg)
+            #     uses.discard(cpu_reg)
+            # for cpu_reg in callee.cpu_live_in:
+            #     uses.add(cpu_reg)
+
+        num_defs = ins.opcode.def_ops_count()
+        for n, reg in enumerate(ins.operands):
+            if not isinstance(reg, ir.Reg): continue
+            if n < num_defs:
+                bit = reg_bits[reg]
+                defs |= bit
+                uses &= ~bit
+            else:
+                uses |= reg_bits[reg]
+    return defs, uses
 
 
 def _InsUpdateLiveness(ins: ir.Ins, fun: ir.Fun, live_out: Set[ir.Reg]) -> bool:
-    """Similar to _InsUpdateDefUse but also checks if the instruction is useless"""
+    """Similar to _BblDefUse (for a single instruction) but also checks if the instruction is useless"""
     if ins.opcode.is_call():
         # note: a call instruction may have at most one used reg if opcode is JSR
         callee: ir.Fun = cfg.InsCallee(ins)
@@ -126,7 +170,7 @@ def _InsUpdateLiveness(ins: ir.Ins, fun: ir.Fun, live_out: Set[ir.Reg]) -> bool:
 
 
 def _BblRemoveUselessInstructions(bbl: ir.Bbl, fun: ir.Fun) -> int:
-    live_out = bbl.live_out.copy()
+    live_out = set(bbl.live_out)
     old_count = len(bbl.inss)
     keep = []
     for ins in reversed(bbl.inss):
@@ -141,48 +185,88 @@ def FunRemoveUselessInstructions(fun: ir.Fun) -> int:
     return ir.FunGenericRewriteBbl(fun, _BblRemoveUselessInstructions)
 
 
-def _FunLivenessFixpoint(fun: ir.Fun,
-                         all_liveness: Dict[str, Liveness]) -> int:
-    """ Standard backward flow liveness computation"""
+def _FunBblPostOrder(fun: ir.Fun, bbl_index: Dict[int, int]) -> List[int]:
+    """Returns the indices of the Bbls in post order of the CFG
+
+    Bbls unreachable from the entry are appended as well.
+    """
+    out: List[int] = []
+    bbls = fun.bbls
+    visited = [False] * len(bbls)
+    for root in range(len(bbls)):
+        if visited[root]:
+            continue
+        visited[root] = True
+        stack = [(root, iter(bbls[root].edge_out))]
+        while stack:
+            n, it = stack[-1]
+            for succ in it:
+                m = bbl_index[id(succ)]
+                if not visited[m]:
+                    visited[m] = True
+                    stack.append((m, iter(succ.edge_out)))
+                    break
+            else:
+                stack.pop()
+                out.append(n)
+    return out
+
+
+def _FunLivenessFixpoint(fun: ir.Fun, bbl_index: Dict[int, int],
+                         live_def: List[int], live_use: List[int], live_out: List[int]) -> int:
+    """ Standard backward flow liveness computation
+
+    All sets are bit vectors indexed by Bbl number. The worklist starts out in
+    reverse post order of the reversed CFG (i.e. post order) so that most
+    successors are processed before their predecessors.
+    """
     count = 0
-    active = fun.bbls[:]
+    bbls = fun.bbls
+    live_in = [0] * len(bbls)
+    active = collections.deque(_FunBblPostOrder(fun, bbl_index))
+    is_active = [True] * len(bbls)
     while active:
         count += 1
-        bbl = active.pop(-1)
-        # print(f"@@ processing {bbl.name}")
-        liveness = all_liveness[bbl.name]
-        live_in = liveness.live_out.copy()
-        live_in.difference_update(liveness.live_def)
-        live_in.update(liveness.live_use)
-        if len(live_in) <= len(liveness.live_in):
+        n = active.popleft()
+        is_active[n] = False
+        new_live_in = live_use[n] | (live_out[n] & ~live_def[n])
+        if new_live_in == live_in[n]:
             continue
-        liveness.live_in = live_in
-
-        for pred in bbl.edge_in:
-            pred_liveness = all_liveness[pred.name]
-            old_len = len(pred_liveness.live_out)
-            pred_liveness.live_out.update(liveness.live_in)
-            if len(pred_liveness.live_out) > old_len:
-                if pred not in active:
-                    active.append(pred)
-
+        live_in[n] = new_live_in
+        for pred in bbls[n].edge_in:
+            m = bbl_index[id(pred)]
+            new_live_out = live_out[m] | new_live_in
+            if new_live_out != live_out[m]:
+                live_out[m] = new_live_out
+                if not is_active[m]:
+                    is_active[m] = True
+                    active.append(m)
     return count
 
 
 def FunComputeLivenessInfo(fun: ir.Fun) -> int:
-    """Assumes that cfg.funInitCFG has been called"""
+    """Assumes that cfg.funInitCFG has been called
+
+    Sets bbl.live_out for all Bbls to a RegSetView.
+    """
     if len(fun.bbls) > 1:
         assert len(fun.bbls[0].edge_out) > 0, f"you must run cfg.FunInitCFG"
-    all_liveness: Dict[str, Liveness] = {}
-    for bbl in fun.bbls:
-        liveness = Liveness()
-        liveness.live_def, liveness.live_use = _BblDefUse(bbl, fun)
+    reg_bits = RegBits(fun.regs)
+    cpu_reg_bits = _CpuRegBits(fun, reg_bits)
+    bbl_index: Dict[int, int] = {}
+    live_def: List[int] = []
+    live_use: List[int] = []
+    for n, bbl in enumerate(fun.bbls):
+        bbl_index[id(bbl)] = n
+        defs, uses = _BblDefUse(bbl, reg_bits, cpu_reg_bits)
+        live_def.append(defs)
+        live_use.append(uses)
         # if bbl.IsReturn():
         #     liveness.live_out = set(fun.cpu_live_out)
-        all_liveness[bbl.name] = liveness
-    rounds = _FunLivenessFixpoint(fun, all_liveness)
-    for bbl in fun.bbls:
-        bbl.live_out = all_liveness[bbl.name].live_out
+    live_out = [0] * len(fun.bbls)
+    rounds = _FunLivenessFixpoint(fun, bbl_index, live_def, live_use, live_out)
+    for n, bbl in enumerate(fun.bbls):
+        bbl.live_out = RegSetView(live_out[n], reg_bits)
     fun.flags |= ir.FUN_FLAG.LIVENESS_VALID
     return rounds
 
@@ -282,39 +366,54 @@ class LiveRange:
         return f"LR {render_pos(self.def_pos)} - {render_pos(self.last_use_pos)}{flags_str}{extra_str}"
 
 
-def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: Set[ir.Reg]) -> List[LiveRange]:
-    """ Compute LiveRanges for one BBL (e.g. for use with register allocation)
+def _BblScanLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: AbstractSet[ir.Reg]):
+    """Yields the LiveRanges of one Bbl as plain tuples in the order they were created
+
+    (def_pos, last_use_pos, reg, num_uses, is_lac, uses)
+
+    For "use" LRs `reg` is REG_INVALID and `uses` lists the (Bbl relative)
+    indices of the LRs used, otherwise `uses` is None.
+    This is the scan shared by BblGetLiveRanges() and FunGetLiveRangeTable().
 
     Note: function call handling is quite adhoc and likely has bugs.
-    Besides regular LRs, the output contains the following special LiveRanges
-    * LRs without a last_use if the register is used outside the Bbl (based on live_out)
-    * LRs without a def of the register is defined outside the Bbl
-    * "use" LRs: contain the LRs of all the used regs in the instruction at point p.
-                 (def=p last_use=p,  reg=REG_INVALID)
-    The last catagory helps with LR spilling
     """
-    out = []
     bbl_size = len(bbl.inss)
-
-    last_use: Dict[ir.Reg, LiveRange] = {}
+    # one entry per LR (see tuple above), def_pos and is_lac are only known
+    # once the LR is finalized
+    def_pos_col: List[int] = []
+    last_use_pos_col: List[int] = []
+    reg_col: List[ir.Reg] = []
+    num_uses_col: List[int] = []
+    lac_col: List[bool] = []
+    uses_col: List[Any] = []
+
+    last_use: Dict[ir.Reg, int] = {}
     last_call_pos = -1
     # these cpu registers are also live because they are inputs to function call
     # or being returned
     last_call_cpu_live_in = []
 
-    def initialize_lr(last_use_pos: int, reg: ir.Reg) -> LiveRange:
+    def add_lr(def_pos: int, last_use_pos: int, reg: ir.Reg, num_uses: int, uses) -> int:
+        def_pos_col.append(def_pos)
+        last_use_pos_col.append(last_use_pos)
+        reg_col.append(reg)
+        num_uses_col.append(num_uses)
+        lac_col.append(False)
+        uses_col.append(uses)
+        return len(def_pos_col) - 1
+
+    def initialize_lr(last_use_pos: int, reg: ir.Reg) -> int:
         # note: the def_pos=-1 will be updated in finalize_lr() below
-        lr = LiveRange(-1, last_use_pos, reg, 1)
+        lr = add_lr(-1, last_use_pos, reg, 1, None)
         last_use[reg] = lr
-        out.append(lr)
         return lr
 
-    def finalize_lr(lr: LiveRange, def_pos: int):
-        lr.def_pos = def_pos
+    def finalize_lr(lr: int, reg: ir.Reg, def_pos: int):
+        def_pos_col[lr] = def_pos
         if (last_call_pos != -1 and last_call_pos != AFTER_BBL and
-                last_call_pos < lr.last_use_pos):
-            lr.flags |= LiveRangeFlag.LAC
-        del last_use[lr.reg]
+                last_call_pos < last_use_pos_col[lr]):
+            lac_col[lr] = True
+        del last_use[reg]
 
     # handle live ranges that extend passed the bbl
     for reg in live_out:
@@ -340,14 +439,14 @@ def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: Set[ir.Reg]) -> List[Li
                 # Note, destructive list iteration -> `list(...)` is necessary
                 # go through all pending live-ragnes and finalize those that
                 # consume results from the function call.
-                for reg, lr in list(last_use.items()):
+                for reg, pending_lr in list(last_use.items()):
                     if reg.HasCpuReg() and reg.cpu_reg in callee.cpu_live_out:
-                        finalize_lr(lr, pos)
+                        finalize_lr(pending_lr, reg, pos)
             last_call_cpu_live_in = callee.cpu_live_in
             last_call_pos = pos  # setting this after dealing with cpu_live_out seems right
 
         num_defs = ins.opcode.def_ops_count()
-        uses = []
+        uses: List[int] = []
         for n, reg in enumerate(ins.operands):
             if not isinstance(reg, ir.Reg): continue
             if reg.IsSpilled(): continue
@@ -356,8 +455,8 @@ def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: Set[ir.Reg]) -> List[Li
                 if n == 0 and ir.REG_FLAG.TWO_ADDRESS in reg.flags and reg == ins.operands[1]:
                     continue
                 lr = last_use.get(reg)
-                if lr:
-                    finalize_lr(lr, pos)
+                if lr is not None:
+                    finalize_lr(lr, reg, pos)
                 else:
                     last_use_pos = NO_USE
                     # Note: likely this makes some assumptions about the adjacency
@@ -367,12 +466,12 @@ def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: Set[ir.Reg]) -> List[Li
                     #elif ins.opcode is o.NOP1:
                     #    # assert False, f"found nop1 {ins.operands}"
                     #    last_use_pos = n - 1
-                    out.append(LiveRange(pos, last_use_pos, reg, 0))
+                    add_lr(pos, last_use_pos, reg, 0, None)
             else:  # used reg
                 lr = last_use.get(reg)
-                if lr:
+                if lr is not None:
                     # make meaning of num_uses more precise
-                    lr.num_uses += 1
+                    num_uses_col[lr] += 1
                 else:
                     # last use
                     lr = initialize_lr(pos, reg)
@@ -381,13 +480,166 @@ def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: Set[ir.Reg]) -> List[Li
         if uses:
             # Note "pos, pos" ensure that this record will come before
             #       a regular record after sorting
-            out.append(LiveRange(pos, pos, ir.REG_INVALID, 0, uses))
+            add_lr(pos, pos, ir.REG_INVALID, 0, uses)
+
+    for reg, lr in list(last_use.items()):
+        finalize_lr(lr, reg, BEFORE_BBL)
+    yield from zip(def_pos_col, last_use_pos_col, reg_col, num_uses_col, lac_col, uses_col)
+
+
+def BblGetLiveRanges(bbl: ir.Bbl, fun: ir.Fun, live_out: AbstractSet[ir.Reg]) -> List[LiveRange]:
+    """ Compute LiveRanges for one BBL (e.g. for use with register allocation)
 
-    for lr in list(last_use.values()):
-        finalize_lr(lr, BEFORE_BBL)
+    Note: function call handling is quite adhoc and likely has bugs.
+    Besides regular LRs, the output contains the following special LiveRanges
+    * LRs without a last_use if the register is used outside the Bbl (based on live_out)
+    * LRs without a def of the register is defined outside the Bbl
+    * "use" LRs: contain the LRs of all the used regs in the instruction at point p.
+                 (def=p last_use=p,  reg=REG_INVALID)
+    The last catagory helps with LR spilling
+    """
+    out: List[LiveRange] = []
+    for def_pos, last_use_pos, reg, num_uses, is_lac, uses in _BblScanLiveRanges(bbl, fun, live_out):
+        if uses is None:
+            out.append(LiveRange(def_pos, last_use_pos, reg, num_uses,
+                                 flags=LiveRangeFlag.LAC if is_lac else LiveRangeFlag(0)))
+        else:
+            out.append(LiveRange(def_pos, last_use_pos, reg, 0, [out[x] for x in uses]))
     return out
 
 
+_LAC = LiveRangeFlag.LAC.value
+
+# Positions read back from an array are fresh ints but client code checks for
+# the special positions with `is`
+_CANONICAL_POS = {BEFORE_BBL: BEFORE_BBL, AFTER_BBL: AFTER_BBL, NO_USE: NO_USE}
+
+_FLAGS = [LiveRangeFlag(n) for n in range(8)]
+
+
+class LiveRangeTable:
+    """Columnar representation of the LiveRanges of (a subset of) the Bbls of a Fun
+
+    Row n describes one LiveRange, see LiveRange for the meaning of the columns.
+    `reg` is an index into `regs` or -1 for "use" LRs whose uses are stored as
+    row numbers in use_rows[uses_start[n]:uses_start[n + 1]].
+    The rows of the i-th Bbl processed are bbl_start[i]:bbl_start[i + 1].
+
+    LiveRange objects are only created on demand via BblLiveRanges().
+    """
+
+    def __init__(self):
+        self.def_pos = array.array("i")
+        self.last_use_pos = array.array("i")
+        self.reg = array.array("i")
+        self.num_uses = array.array("i")
+        self.flags = array.array("B")
+        self.uses_start = array.array("i", [0])
+        self.use_rows = array.array("i")
+        self.bbl_start = array.array("i", [0])
+        self.regs: List[ir.Reg] = []
+        self.reg_index: Dict[ir.Reg, int] = {}
+        # reg.cpu_reg at the time the table was computed, parallel to regs
+        self.cpu_regs: List[Any] = []
+
+    def __len__(self):
+        return len(self.def_pos)
+
+    def num_bbls(self):
+        return len(self.bbl_start) - 1
+
+    def IsStale(self, bbl_no: int) -> bool:
+        """True if the cpu_reg of a reg used by the bbl_no-th Bbl changed since"""
+        regs = self.regs
+        cpu_regs = self.cpu_regs
+        reg_col = self.reg
+        for n in range(self.bbl_start[bbl_no], self.bbl_start[bbl_no + 1]):
+            index = reg_col[n]
+            if index >= 0 and regs[index].cpu_reg is not cpu_regs[index]:
+                return True
+        return False
+
+    def BblLiveRanges(self, bbl_no: int) -> List[LiveRange]:
+        """Materializes the LiveRanges of the bbl_no-th Bbl in row order"""
+        start = self.bbl_start[bbl_no]
+        end = self.bbl_start[bbl_no + 1]
+        canonical = _CANONICAL_POS.get
+        regs = self.regs
+        out: List[LiveRange] = []
+        for n in range(start, end):
+            d = self.def_pos[n]
+            u = self.last_use_pos[n]
+            index = self.reg[n]
+            if index < 0:
+                uses = self.use_rows[self.uses_start[n]:self.uses_start[n + 1]]
+                out.append(LiveRange(d, u, ir.REG_INVALID, 0,
+                                     [out[x - start] for x in uses], _FLAGS[self.flags[n]]))
+            else:
+                out.append(LiveRange(canonical(d, d), canonical(u, u), regs[index],
+                                     self.num_uses[n], [], _FLAGS[self.flags[n]]))
+        return out
+
+
+def _BblAddLiveRanges(table: LiveRangeTable, bbl: ir.Bbl, fun: ir.Fun, live_out: AbstractSet[ir.Reg]):
+    """Appends the LiveRanges of one Bbl to table"""
+    first_row = len(table)
+    reg_index = table.reg_index
+    regs = table.regs
+    append_def_pos = table.def_pos.append
+    append_last_use_pos = table.last_use_pos.append
+    append_reg = table.reg.append
+    append_num_uses = table.num_uses.append
+    append_flags = table.flags.append
+    append_uses_start = table.uses_start.append
+    use_rows = table.use_rows
+    for def_pos, last_use_pos, reg, num_uses, is_lac, uses in _BblScanLiveRanges(bbl, fun, live_out):
+        if uses is None:
+            index = reg_index.get(reg)
+            if index is None:
+                index = reg_index[reg] = len(regs)
+                regs.append(reg)
+                table.cpu_regs.append(reg.cpu_reg)
+        else:
+            index = -1
+            use_rows.extend(first_row + x for x in uses)
+        append_def_pos(def_pos)
+        append_last_use_pos(last_use_pos)
+        append_reg(index)
+        append_num_uses(num_uses)
+        append_flags(_LAC if is_lac else 0)
+        append_uses_start(len(use_rows))
+    table.bbl_start.append(len(table))
+
+
+def FunGetLiveRangeTable(fun: ir.Fun) -> LiveRangeTable:
+    """Computes the LiveRanges for all Bbls of fun in one go without creating
+    LiveRange objects
+
+    The i-th Bbl of the table is fun.bbls[i]. Requires liveness (bbl.live_out).
+    """
+    table = LiveRangeTable()
+    for bbl in fun.bbls:
+        _BblAddLiveRanges(table, bbl, fun, bbl.live_out)
+    return table
+
+
+def FunBblLiveRanges(fun: ir.Fun) -> Iterator[Tuple[ir.Bbl, List[LiveRange]]]:
+    """Yields the (unsorted) LiveRanges of each Bbl of fun
+
+    The ranges are computed for the whole Fun up front (see FunGetLiveRangeTable).
+    Callers like the local register allocators assign cpu regs (or spill) between
+    Bbls. This influences the LiveRanges of Bbls which reference the same regs,
+    so those are recomputed.
+    Requires liveness (bbl.live_out).
+    """
+    table = FunGetLiveRangeTable(fun)
+    for n, bbl in enumerate(fun.bbls):
+        if table.IsStale(n):
+            yield bbl, BblGetLiveRanges(bbl, fun, bbl.live_out)
+        else:
+            yield bbl, table.BblLiveRanges(n)
+
+
 def FindDefRange(reg_name: str, def_pos: int, ranges: List[LiveRange]):
     for lr in ranges:
         if lr.reg.name == reg_name and lr.def_pos == def_pos:
@@ -296,6 +296,62 @@ class TestRanges(unittest.TestCase):
         for lr in ranges:
             print(lr)
 
+    def testLiveRangeTable(self):
+        """FunGetLiveRangeTable() must agree with BblGetLiveRanges()"""
+        text = ""
+        for fn in ["../StdLib/syscall.extern64.asm", "../StdLib/std_lib.64.asm",
+                   "../TestData/nano_jpeg.64.asm"]:
+            with open(fn) as fin:
+                text += fin.read()
+        unit = serialize.UnitParseFromAsm(io.StringIO(text))
+        for fun in unit.funs:
+            if fun.kind is not o.FUN_KIND.NORMAL:
+                continue
+            optimize.FunCfgInit(fun, unit)
+            liveness.FunComputeLivenessInfo(fun)
+            table = liveness.FunGetLiveRangeTable(fun)
+            self.assertEqual(len(fun.bbls), table.num_bbls())
+            for n, bbl in enumerate(fun.bbls):
+                expected = liveness.BblGetLiveRanges(bbl, fun, bbl.live_out)
+                actual = table.BblLiveRanges(n)
+                self.assertEqual([repr(lr) for lr in expected], [repr(lr) for lr in actual])
+                for e, a in zip(expected, actual):
+                    self.assertEqual(e.num_uses, a.num_uses)
+                    self.assertEqual(e.is_cross_bbl(), a.is_cross_bbl())
+
+    def testFunBblLiveRangesRecomputesStaleBbls(self):
+        code = io.StringIO(r"""
+.fun foo NORMAL [U32] = [U32]
+.bbl start
+    poparg a:U32
+    add b:U32 = a 1
+    bne a 0 other
+.bbl done
+    add c:U32 = a 2
+    pusharg c
+    ret
+.bbl other
+    add d:U32 = a 3
+    pusharg d
+    ret
+""")
+        unit = serialize.UnitParseFromAsm(code, False)
+        fun = unit.fun_syms["foo"]
+        optimize.FunCfgInit(fun, unit)
+        liveness.FunComputeLivenessInfo(fun)
+        seen = []
+        for bbl, ranges in liveness.FunBblLiveRanges(fun):
+            seen.append(bbl.name)
+            self.assertEqual([repr(lr) for lr in ranges],
+                             [repr(lr) for lr in liveness.BblGetLiveRanges(bbl, fun, bbl.live_out)])
+            # pretend an allocator assigned a cpu reg to the reg live across all Bbls
+            fun.reg_syms["a"].cpu_reg = ir.CpuReg("r0", 0)
+        self.assertEqual(seen, ["start", "done", "other"])
+        table = liveness.FunGetLiveRangeTable(fun)
+        self.assertFalse(table.IsStale(1))
+        fun.reg_syms["a"].cpu_reg = ir.CpuReg("r1", 1)
+        self.assertTrue(table.IsStale(1))
+
 
 if __name__ == '__main__':
     unittest.main()
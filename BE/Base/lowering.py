@@ -77,9 +77,12 @@ def _InsStrengthReduction(
     opc = ins.opcode
     ops = ins.operands
 
+    changed = False
     if opc in (o.SHR, o.SHL) and isinstance(ops[2], ir.Const):
         mask = ops[0].kind.bitwidth() - 1
-        ops[2].value = ops[2].value & mask
+        if ops[2].value & mask != ops[2].value:
+            changed = True
+        ops[2] = ir.InternConst(ops[2].kind, ops[2].value & mask)
 
     if _InsIsNop1(ins):
         ops.pop(2)
@@ -108,7 +111,7 @@ def _InsStrengthReduction(
 
     # TODO: DIV for unsigned int
 
-    return None
+    return [ins] if changed else None
 
 
 def FunStrengthReduction(fun: ir.Fun) -> int:
@@ -461,8 +464,7 @@ def _NarrowOperand(op, fun: ir.Fun, narrow_kind: o.DK, inss: List) -> ir.Reg:
         val = op.value & eval.MakeAllOnesMask(narrow_kind.bitwidth())
         if narrow_kind.flavor() is o.DK_FLAVOR_S:
             val = eval.SignedIntFromBits(val, narrow_kind.bitwidth())
-        op.value = val
-        return op
+        return ir.InternConst(op.kind, val)
     else:
         assert isinstance(op, ir.Reg)
         # TODO: C++ version is using marking - why?
@@ -498,8 +500,12 @@ def FunRegWidthWidening(fun: ir.Fun, narrow_kind: o.DK, wide_kind: o.DK):
       The invariant we are maintaining is this one:
       if reg a gets widened into reg b with bitwidth(a) = w then
       the lower w bits of reg b will always contain the same data as reg a would have.
+
+      Returns the number of changes (widened regs, signature types and Ins).
       """
     assert ir.FUN_FLAG.STACK_FINALIZED not in fun.flags
+    count = (fun.input_types.count(narrow_kind) +
+             fun.output_types.count(narrow_kind))
     fun.input_types = [wide_kind if x ==
                        narrow_kind else x for x in fun.input_types]
     fun.output_types = [wide_kind if x ==
@@ -514,8 +520,8 @@ def FunRegWidthWidening(fun: ir.Fun, narrow_kind: o.DK, wide_kind: o.DK):
 
     for reg in narrow_regs:
         reg.kind = wide_kind
+    count += len(narrow_regs)
 
-    count = 0
     for bbl in fun.bbls:
         inss = []
 
@@ -534,6 +540,7 @@ def FunRegWidthWidening(fun: ir.Fun, narrow_kind: o.DK, wide_kind: o.DK):
             if not changed:
                 inss.append(ins)
                 continue
+            count += 1
             kind = ins.opcode.kind
             if ins.opcode is o.SHL or ins.opcode is o.SHR:
                 # deal with the shift amount which is subject to an implicit modulo "bitwidth -1"
@@ -589,7 +596,6 @@ def FunRegWidthWidening(fun: ir.Fun, narrow_kind: o.DK, wide_kind: o.DK):
             else:
                 inss.append(ins)
 
-        count += len(inss) - len(bbl.inss)
         bbl.inss = inss
     return count
 
@@ -2,7 +2,7 @@
 
 import collections
 import sys
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Tuple
 
 from BE.Base import cfg
 from BE.Base import ir
@@ -120,33 +120,107 @@ def UnitCfgExit(unit: ir.Unit):
             FunCfgExit(fun, unit)
 
 
-def FunOptBasic(fun: ir.Fun, opt_stats: Dict[str, int],
-                allow_conv_conversion: bool):
-    opt_stats["merge_move"] += reaching_defs.FunMergeMoveWithSrcDef(fun)
+# names of the analyses tracked by FunPassManager
+_REACHING_DEFS = "reaching_defs"
+_LIVENESS = "liveness"
+_REG_STATS = "reg_stats"
+_REG_STATS_LAC = "reg_stats_lac"
+
+
+class FunPassManager:
+    """Runs optimization passes on a Fun while skipping work which cannot make progress
+
+    Every transformation reports the number of changes it made. We keep a
+    modification count for the Fun which is bumped whenever a transformation
+    changed something.
+
+    * An analysis is skipped if the Fun has not been modified since it was last computed.
+    * A transformation is skipped if its last run with the same arguments made no
+      changes and neither the Fun nor any of the analyses it depends on have changed
+      since. Passes are deterministic so the result would be zero changes again.
 
-    opt_stats["canonicalized"] += canonicalize.FunCanonicalize(fun)
-    opt_stats["strength_red"] += lowering.FunStrengthReduction(fun)
-    opt_stats["empty_bbls"] = cfg.FunRemoveEmptyBbls(fun)
-    opt_stats["unreachable_bbls"] = cfg.FunRemoveUnreachableBbls(fun)
+    Note, this relies on the change counts being accurate, i.e. a transformation
+    must not report zero changes when it modified the IR.
+    """
 
-    reaching_defs.FunComputeReachingDefs(fun)
+    def __init__(self, fun: ir.Fun, opt_stats: Dict[str, int]):
+        self.fun = fun
+        self.opt_stats = opt_stats
+        self.modifications = 0
+        # analysis name -> value of self.modifications when it was last computed
+        self._analysis_version: Dict[str, int] = {}
+        # (transformation, args) -> input state of the last run which made no changes
+        self._quiescent: Dict[Tuple[Any, ...], Tuple[int, ...]] = {}
+        self.skipped = 0
+
+    def Invalidate(self):
+        """Must be called after the Fun was changed outside of Transform()"""
+        self.modifications += 1
+        self.fun.flags &= ~ir.FUN_FLAG.LIVENESS_VALID
+
+    def Analyze(self, name: str, analysis: Callable):
+        if self._analysis_version.get(name) == self.modifications:
+            self.skipped += 1
+            return
+        analysis(self.fun)
+        self._analysis_version[name] = self.modifications
+
+    def Transform(self, stat: str, transformation: Callable, *args,
+                  deps: Tuple[str, ...] = (), accumulate=True) -> int:
+        key = (transformation,) + args
+        state = (self.modifications,) + tuple(self._analysis_version.get(d, -1) for d in deps)
+        if self._quiescent.get(key) == state:
+            self.skipped += 1
+            count = 0
+        else:
+            count = transformation(self.fun, *args)
+            if count:
+                self.Invalidate()
+            else:
+                self._quiescent[key] = state
+        if accumulate:
+            self.opt_stats[stat] += count
+        else:
+            self.opt_stats[stat] = count
+        return count
+
+
+def _FunOptBasic(pm: FunPassManager, allow_conv_conversion: bool):
+    pm.Transform("merge_move", reaching_defs.FunMergeMoveWithSrcDef)
+
+    pm.Transform("canonicalized", canonicalize.FunCanonicalize)
+    pm.Transform("strength_red", lowering.FunStrengthReduction)
+    pm.Transform("empty_bbls", cfg.FunRemoveEmptyBbls, accumulate=False)
+    pm.Transform("unreachable_bbls", cfg.FunRemoveUnreachableBbls, accumulate=False)
+
+    pm.Analyze(_REACHING_DEFS, reaching_defs.FunComputeReachingDefs)
     #     reaching_defs.FunCheckReachingDefs(fun)
-    opt_stats["reg_prop"] = reaching_defs.FunPropagateRegsAndConsts(fun)
-    opt_stats["const_fold"] += reaching_defs.FunConstantFold(
-        fun, allow_conv_conversion)
+    pm.Transform("reg_prop", reaching_defs.FunPropagateRegsAndConsts,
+                 deps=(_REACHING_DEFS,), accumulate=False)
+    pm.Transform("const_fold", reaching_defs.FunConstantFold, allow_conv_conversion,
+                 deps=(_REACHING_DEFS,))
+
+    pm.Transform("canonicalized", canonicalize.FunCanonicalize)
+    pm.Transform("strength_red", lowering.FunStrengthReduction)
+    pm.Transform("ls_st_simplify", reaching_defs.FunLoadStoreSimplify,
+                 deps=(_REACHING_DEFS,))
+    pm.Transform("move_elim", lowering.FunMoveElimination)
+    pm.Analyze(_LIVENESS, liveness.FunComputeLivenessInfo)
+
+    pm.Transform("useless", liveness.FunRemoveUselessInstructions,
+                 deps=(_LIVENESS,), accumulate=False)
+    pm.Analyze(_REG_STATS, reg_stats.FunComputeRegStatsExceptLAC)
+    pm.Analyze(_REG_STATS_LAC, reg_stats.FunComputeRegStatsLAC)
 
-    opt_stats["canonicalized"] += canonicalize.FunCanonicalize(fun)
-    opt_stats["strength_red"] += lowering.FunStrengthReduction(fun)
-    opt_stats["ls_st_simplify"] += reaching_defs.FunLoadStoreSimplify(fun)
-    opt_stats["move_elim"] += lowering.FunMoveElimination(fun)
-    liveness.FunComputeLivenessInfo(fun)
+    pm.Transform("dropped_regs", reg_stats.FunDropUnreferencedRegs,
+                 deps=(_REG_STATS,))
+    pm.Transform("separated_regs", reg_stats.FunSeparateLocalRegUsage,
+                 deps=(_REG_STATS, _REG_STATS_LAC))
 
-    opt_stats["useless"] = liveness.FunRemoveUselessInstructions(fun)
-    reg_stats.FunComputeRegStatsExceptLAC(fun)
-    reg_stats.FunComputeRegStatsLAC(fun)
 
-    opt_stats["dropped_regs"] += reg_stats.FunDropUnreferencedRegs(fun)
-    opt_stats["separated_regs"] += reg_stats.FunSeparateLocalRegUsage(fun)
+def FunOptBasic(fun: ir.Fun, opt_stats: Dict[str, int],
+                allow_conv_conversion: bool):
+    _FunOptBasic(FunPassManager(fun, opt_stats), allow_conv_conversion)
 
 
 def UnitOptBasic(unit: ir.Unit, dump_reg_stats) -> Dict[str, int]:
@@ -166,13 +240,16 @@ def UnitOptBasic(unit: ir.Unit, dump_reg_stats) -> Dict[str, int]:
 
 
 def FunOpt(fun: ir.Fun, opt_stats: Dict[str, int]):
-    FunOptBasic(fun, opt_stats, allow_conv_conversion=True)
-    lowering.FunRegWidthWidening(fun, o.DK.U8, o.DK.U32)
-    lowering.FunRegWidthWidening(fun, o.DK.S8, o.DK.S32)
-    lowering.FunRegWidthWidening(fun, o.DK.U16, o.DK.U32)
-    lowering.FunRegWidthWidening(fun, o.DK.S16, o.DK.S32)
-
-    FunOptBasic(fun, opt_stats, allow_conv_conversion=False)
+    pm = FunPassManager(fun, opt_stats)
+    _FunOptBasic(pm, allow_conv_conversion=True)
+    for narrow, wide in [(o.DK.U8, o.DK.U32), (o.DK.S8, o.DK.S32),
+                         (o.DK.U16, o.DK.U32), (o.DK.S16, o.DK.S32)]:
+        if lowering.FunRegWidthWidening(fun, narrow, wide):
+            pm.Invalidate()
+
+    # passes which did not make progress in the first round are skipped unless
+    # the widening or the other passes changed their input
+    _FunOptBasic(pm, allow_conv_conversion=False)
 
     # non_scratch = set()
     # for reg in fun.regs:
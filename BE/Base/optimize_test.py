@@ -0,0 +1,102 @@
+#!/bin/env python3
+
+import collections
+import io
+import unittest
+
+from BE.Base import cfg
+from BE.Base import ir
+from BE.Base import optimize
+from BE.Base import reaching_defs
+from BE.Base import serialize
+
+
+def _MakeFun(name="foo") -> ir.Fun:
+    code = io.StringIO(f"""
+.fun {name} NORMAL [U32] = [U32]
+.bbl start
+    poparg a:U32
+    mov b:U32 = a
+    mov c:U32 = b
+    add d:U32 = c 1
+    pusharg d
+    ret
+""")
+    unit = serialize.UnitParseFromAsm(code, False)
+    fun = unit.fun_syms[name]
+    cfg.FunInitCFG(fun)
+    return fun
+
+
+class TestFunPassManager(unittest.TestCase):
+
+    def testOrderAndSkipping(self):
+        log = []
+        changes = collections.deque([1, 0, 0])
+
+        def analysis(fun):
+            log.append("analysis")
+
+        def rewrite(fun):
+            log.append("rewrite")
+            return changes.popleft()
+
+        def other(fun, arg):
+            log.append(f"other {arg}")
+            return 0
+
+        stats = collections.defaultdict(int)
+        pm = optimize.FunPassManager(_MakeFun(), stats)
+        for _ in range(3):
+            pm.Analyze("a", analysis)
+            pm.Transform("rewrite", rewrite, deps=("a",))
+            pm.Transform("other", other, 1)
+            pm.Transform("other", other, 2)
+        self.assertEqual(log, [
+            # round 1: everything runs, rewrite makes a change,
+            # the "other"s run after that change and make none
+            "analysis", "rewrite", "other 1", "other 2",
+            # round 2: the analysis is stale and rewrite depends on it
+            "analysis", "rewrite",
+            # round 3: nothing changed in round 2 so everything is skipped
+        ])
+        self.assertEqual(pm.skipped, 6)
+        self.assertEqual(stats["rewrite"], 1)
+        self.assertEqual(pm.modifications, 1)
+
+        # changes made outside of the manager re-enable everything
+        pm.Invalidate()
+        changes.append(0)
+        pm.Analyze("a", analysis)
+        pm.Transform("rewrite", rewrite, deps=("a",))
+        self.assertEqual(log[-2:], ["analysis", "rewrite"])
+
+    def testReachingDefsRecomputedAfterRewrite(self):
+        fun = _MakeFun()
+        log = []
+
+        def compute_reaching_defs(f):
+            log.append("reaching_defs")
+            reaching_defs.FunComputeReachingDefs(f)
+
+        def propagate(f):
+            n = reaching_defs.FunPropagateRegsAndConsts(f)
+            log.append(f"reg_prop {n}")
+            return n
+
+        pm = optimize.FunPassManager(fun, collections.defaultdict(int))
+        for _ in range(3):
+            pm.Analyze("reaching_defs", compute_reaching_defs)
+            pm.Transform("reg_prop", propagate, deps=("reaching_defs",))
+        self.assertEqual(log[0], "reaching_defs")
+        self.assertNotEqual(log[1], "reg_prop 0")
+        # the rewrite invalidated the reaching defs which must be recomputed
+        # before reg_prop runs again
+        self.assertEqual(log[2:], ["reaching_defs", "reg_prop 0"])
+        # the operand of the add now refers to the original def
+        add = [ins for ins in fun.bbls[0].inss if ins.opcode.name == "add"][0]
+        self.assertEqual(add.operands[1].name, "a")
+
+
+if __name__ == '__main__':
+    unittest.main()
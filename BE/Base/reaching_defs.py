@@ -58,6 +58,7 @@ def _InsConstantFold(
             ins.Init(o.MOV, [ops[0], ops[1]], ins.is_only_def)
         else:
             ins.Init(o.MOV, [ops[0], ops[2]], ins.is_only_def)
+        return [ins]
     elif kind is o.OPC_KIND.ALU1:
         if not isinstance(ops[1], ir.Const):
             return None
@@ -96,9 +97,10 @@ def FunConstantFold(fun: ir.Fun, allow_conv_conversion) -> int:
                                        allow_conv_conversion=allow_conv_conversion)
 
 
-def _CombinedOffset(ins: ir.Ins, base_ins: ir.Ins) -> Tuple[Any, Any]:
-    """Returns the combine offset, where it was defined and its original type
-     The second is relevant if the offset is a Reg and allows us
+def _CombinedOffset(ins: ir.Ins, base_ins: ir.Ins) -> Tuple[Any, Any, Any]:
+    """Returns the combine offset, where it was defined and the instruction
+     using it (ins or base_ins).
+     The last two are relevant if the offset is a Reg and allows us
      to check that Reg's content is still available at the location
      using the combined offset.
      """
@@ -106,19 +108,19 @@ def _CombinedOffset(ins: ir.Ins, base_ins: ir.Ins) -> Tuple[Any, Any]:
     offset1 = ins.operands[off_pos]
 
     if base_ins.opcode is o.MOV:
-        return offset1, ins.operand_defs[off_pos]
+        return offset1, ins.operand_defs[off_pos], ins
     if base_ins.opcode.kind != o.OPC_KIND.LEA:
-        return None, None
+        return None, None, None
 
     offset2 = base_ins.operands[2]
 
     if isinstance(offset1, ir.Const) and offset1.IsZero():
-        return offset2, base_ins.operand_defs[2]
+        return offset2, base_ins.operand_defs[2], base_ins
     if isinstance(offset2, ir.Const) and offset2.IsZero():
-        return offset1, ins.operand_defs[off_pos]
+        return offset1, ins.operand_defs[off_pos], ins
     if isinstance(offset1, ir.Const) and isinstance(offset2, ir.Const):
-        return eval.AddOffsets(offset1, offset2), None
-    return None, None
+        return eval.AddOffsets(offset1, offset2), None, None
+    return None, None, None
 
 
 _LOAD_STORE_BASE_REWRITE = {
@@ -140,21 +142,29 @@ _LOAD_STORE_BASE_REWRITE = {
 }
 
 
-def _DefAvailable(op: Any, op_def: Any, bbl, def_map: ir.REG_DEF_MAP) -> bool:
+def _DefAvailable(op: Any, op_def: Any, user_in_bbl: bool, bbl, def_map: ir.REG_DEF_MAP) -> bool:
+    """Does `op` at the current position of bbl still have the value it had
+    at an earlier instruction (the user) where its reaching def was `op_def`
+
+    def_map contains the defs made inside bbl up to the current position.
+
+    Note, that the same def reaching both places does not mean that the value
+    is the same: in a loop the def may be executed again in between.
+    So unless op has only one def, the user must be inside bbl.
+    """
     if isinstance(op, (ir.Const, ir.Mem, ir.Stk)):
         return True
     if isinstance(op_def, ir.Ins) and op_def.is_only_def:
         return True
 
     assert isinstance(op, ir.Reg), f"unexpected operand {op}"
+    if not user_in_bbl:
+        return False
 
-    if def_map.get(op) is op_def:
-        return True
+    if op in def_map:
+        return def_map[op] is op_def
     # we defined outside bbl and has not beem clobbered inside BBL
-    if op_def is bbl and op not in def_map:
-        return True
-
-    return False
+    return op_def is bbl or bbl.defs_in.get(op) is op_def
 
 
 def _InsTryLoadStoreSimplify(ins: ir.Ins, bbl, defs: ir.REG_DEF_MAP) -> int:
@@ -174,13 +184,15 @@ def _InsTryLoadStoreSimplify(ins: ir.Ins, bbl, defs: ir.REG_DEF_MAP) -> int:
     # is the original base still available at the ld/st
     base_op = ins_base.operands[1]
     base_def = ins_base.operand_defs[1]
-    if not _DefAvailable(base_op, base_def, bbl, defs):
+    base_in_bbl = defs.get(ins_base.operands[0]) is ins_base
+    if not _DefAvailable(base_op, base_def, base_in_bbl, bbl, defs):
         # print ("#base not avail ", base, base_def)
         return 0
 
     # can the new offset be determined and is it available
-    offset, offset_def = _CombinedOffset(ins, ins_base)
-    if offset is None or not _DefAvailable(offset, offset_def, bbl, defs):
+    offset, offset_def, offset_user = _CombinedOffset(ins, ins_base)
+    if offset is None or not _DefAvailable(offset, offset_def,
+                                           offset_user is ins or base_in_bbl, bbl, defs):
         return 0
 
     if base_pos == 0:  # store
@@ -298,7 +310,78 @@ def FunMergeMoveWithSrcDef(fun: ir.Fun) -> int:
     return ir.FunGenericRewriteBbl(fun, _BblMergeMoveWithSrcDef)
 
 
+def _FunComputeBblDefsIn(fun: ir.Fun, defs: ir.REG_DEF_MAP):
+    """Global reaching definitions for regs with more than one def
+
+    Classic forward dataflow: every instruction defining such a reg gets a bit
+    and the per bbl sets are bit vectors (python ints). Regs with a single def
+    do not need any of this (SSA like shortcut), they are handled via `defs`.
+
+    Afterwards bbl.defs_in contains the regs with exactly one def reaching
+    the beginning of bbl together with that def.
+    """
+    def_inss: List[ir.Ins] = []
+    reg_mask: Dict[ir.Reg, int] = {}
+    gen: List[int] = []
+    defined: List[List[ir.Reg]] = []
+    for bbl in fun.bbls:
+        last_def: Dict[ir.Reg, int] = {}
+        for ins in bbl.inss:
+            if ins.opcode.def_ops_count() == 0:
+                continue
+            def_reg = ins.operands[0]
+            if defs[def_reg] is not ir.INS_INVALID:
+                continue
+            bit = 1 << len(def_inss)
+            def_inss.append(ins)
+            reg_mask[def_reg] = reg_mask.get(def_reg, 0) | bit
+            last_def[def_reg] = bit
+        gen.append(sum(last_def.values()))
+        defined.append(list(last_def.keys()))
+    if not def_inss:
+        for bbl in fun.bbls:
+            bbl.defs_in.clear()
+        return
+
+    # Bbls are not hashable so we work with their positions
+    pos: Dict[int, int] = {id(bbl): n for n, bbl in enumerate(fun.bbls)}
+    preds: List[List[int]] = [[pos[id(p)] for p in bbl.edge_in] for bbl in fun.bbls]
+    # now that all defs are numbered the kill sets can be materialized
+    keep: List[int] = [~sum(reg_mask[reg] for reg in regs) for regs in defined]
+
+    bits_in: List[int] = [0] * len(fun.bbls)
+    bits_out: List[int] = list(gen)
+    changed = True
+    while changed:
+        changed = False
+        for n in range(len(fun.bbls)):
+            x = 0
+            for p in preds[n]:
+                x |= bits_out[p]
+            bits_in[n] = x
+            out = gen[n] | (x & keep[n])
+            if out != bits_out[n]:
+                bits_out[n] = out
+                changed = True
+
+    for bbl, x in zip(fun.bbls, bits_in):
+        bbl.defs_in.clear()
+        if x == 0:
+            continue
+        for reg, mask in reg_mask.items():
+            bits = x & mask
+            # exactly one bit set
+            if bits and bits & (bits - 1) == 0:
+                bbl.defs_in[reg] = def_inss[bits.bit_length() - 1]
+
+
 def FunComputeReachingDefs(fun: ir.Fun):
+    """Fills in ins.operand_defs, ins.is_only_def and bbl.defs_in
+
+    An operand_def is the unique Ins defining the operand at that point if
+    there is one and the Bbl containing the Ins otherwise,
+    meaning: "whatever was live at the beginning of the Bbl".
+    """
     # Phase 1: build map
     defs: ir.REG_DEF_MAP = {}
     for bbl in fun.bbls:
@@ -312,11 +395,13 @@ def FunComputeReachingDefs(fun: ir.Fun):
             else:
                 defs[def_reg] = ins
 
+    _FunComputeBblDefsIn(fun, defs)
+
     # phase 2: fill in all the ins.operand_def fields
-    # Note: we could do this for extended BBLs
     bbl_defs: ir.REG_DEF_MAP = {}
     for bbl in fun.bbls:
         bbl_defs.clear()
+        bbl_defs.update(bbl.defs_in)
         for ins in bbl.inss:
             num_defs = ins.opcode.def_ops_count()
             for n, op in enumerate(ins.operands):
@@ -343,7 +428,7 @@ def _BblPropagateRegAndConstOperands(bbl: ir.Bbl, _fun: ir.Fun) -> int:
     """
     This transformation will make certain MOVs obsolete.
 
-    Requires FunSimplifiedReachingDefs()
+    Requires FunComputeReachingDefs()
     """
     count = 0
     def_map: ir.REG_DEF_MAP = {}
@@ -362,7 +447,7 @@ def _BblPropagateRegAndConstOperands(bbl: ir.Bbl, _fun: ir.Fun) -> int:
             if isinstance(src_op, ir.Reg) and src_op.cpu_reg:
                 continue
             # constant propagation is done by another pass
-            if _DefAvailable(src_op, src_def, bbl, def_map):
+            if _DefAvailable(src_op, src_def, def_map.get(mov.operands[0]) is mov, bbl, def_map):
                 ins.operands[n] = src_op
                 ins.operand_defs[n] = src_def
                 count += 1
@@ -236,6 +236,107 @@ class TestConversion(unittest.TestCase):
         liveness.FunRemoveUselessInstructions(fun)
         print("\n".join(serialize.FunRenderToAsm(fun)))
 
+    def testGlobalReachingDefs(self):
+        code = io.StringIO(r"""
+.fun foo NORMAL [S32] = [S32]
+    .reg S32 x
+    .reg S32 y
+    .reg S32 z
+
+.bbl start
+    poparg z
+    mov x = 5
+    blt z 0 neg
+.bbl pos
+    add y = x z
+    bra join
+.bbl neg
+    mov x = 6
+.bbl join
+    add z = x 1
+    pusharg z
+    ret
+    """)
+
+        unit = serialize.UnitParseFromAsm(code, False)
+        fun = unit.fun_syms["foo"]
+        cfg.FunInitCFG(fun)
+        reaching_defs.FunComputeReachingDefs(fun)
+        reaching_defs.FunCheckReachingDefs(fun)
+        start, pos, neg, join = fun.bbls
+        x = fun.reg_syms["x"]
+        self.assertIs(start.inss[1], pos.defs_in[x])
+        self.assertNotIn(x, join.defs_in)
+        self.assertIs(start.inss[0], pos.inss[0].operand_defs[2])
+        # two defs of x reach join
+        self.assertIs(join, join.inss[0].operand_defs[1])
+
+        reaching_defs.FunPropagateRegsAndConsts(fun)
+        self.assertEqual("add y 5 z", serialize.InsRenderToAsm(pos.inss[0]).strip())
+        self.assertEqual("add z x 1", serialize.InsRenderToAsm(join.inss[0]).strip())
+
+    def testNoCopyPropagationAcrossLoopIteration(self):
+        code = io.StringIO(r"""
+.fun foo NORMAL [U32] = []
+    .reg U32 x
+    .reg U32 y
+
+.bbl start
+    mov y = 0
+.bbl loop
+    add y = y 1
+    bne y 1 done
+.bbl body
+    mov x = y
+    bra loop
+.bbl done
+    pusharg x
+    ret
+    """)
+
+        unit = serialize.UnitParseFromAsm(code, False)
+        fun = unit.fun_syms["foo"]
+        cfg.FunInitCFG(fun)
+        reaching_defs.FunComputeReachingDefs(fun)
+        reaching_defs.FunCheckReachingDefs(fun)
+        start, loop, body, done = fun.bbls
+        y = fun.reg_syms["y"]
+        # the same def of y reaches body and done but y was incremented in between
+        self.assertIs(loop.inss[0], body.defs_in[y])
+        self.assertIs(loop.inss[0], done.defs_in[y])
+        self.assertEqual(0, reaching_defs.FunPropagateRegsAndConsts(fun))
+        self.assertEqual("pusharg x", serialize.InsRenderToAsm(done.inss[0]).strip())
+
+    def testLoadStoreBaseNotPropagatedAcrossLoopIteration(self):
+        code = io.StringIO(r"""
+.fun foo NORMAL [U32] = [A64]
+    .reg A64 a
+    .reg A64 b
+    .reg U32 x
+
+.bbl start
+    poparg a
+.bbl loop
+    lea a = a 4
+    ld x = a 0
+    bne x 0 done
+.bbl body
+    mov b = a
+    bra loop
+.bbl done
+    ld x = b 0
+    pusharg x
+    ret
+    """)
+
+        unit = serialize.UnitParseFromAsm(code, False)
+        fun = unit.fun_syms["foo"]
+        cfg.FunInitCFG(fun)
+        reaching_defs.FunComputeReachingDefs(fun)
+        done = fun.bbls[3]
+        reaching_defs.FunLoadStoreSimplify(fun)
+        self.assertEqual("ld x b 0", serialize.InsRenderToAsm(done.inss[0]).strip())
+
 
 if __name__ == '__main__':
     unittest.main()
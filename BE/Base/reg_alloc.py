@@ -1,5 +1,6 @@
 """This file contains code for Register Allocation/Assignment """
-from typing import List, Dict, Optional
+import heapq
+from typing import Callable, List, Dict, Optional, Tuple
 
 from BE.Base import ir
 from BE.Base import liveness
@@ -69,6 +70,10 @@ class RegPool:
 PRE_ALLOC = liveness.LiveRangeFlag.PRE_ALLOC
 IGNORE = liveness.LiveRangeFlag.IGNORE
 
+# Bbls with more LiveRanges than this should use RegisterAssignerLinearScanHeap
+# instead of RegisterAssignerLinearScanFancy
+MAX_LIVE_RANGES_FOR_BACKWARD_SCAN = 2000
+
 
 def _HandleUseLiveRange(lr_use: LiveRange, pool, debug):
     for lr in lr_use.uses:
@@ -162,8 +167,12 @@ def _SpillEarlierLiveRange(reg: ir.Reg, pos: int, i: int, live_ranges: List[Live
 #         return i + 1
 
 
-def _HandleDefLiveRangeFancy(i: int, lr: LiveRange, live_ranges: List[LiveRange], pool,
-                             debug):
+# spill(reg, pos, do_not_spill) frees up a cpu reg suitable for reg by spilling an
+# earlier LiveRange
+SPILL_FUN = Callable[[ir.Reg, int, List[LiveRange]], None]
+
+
+def _HandleDefLiveRangeFancy(i: int, lr: LiveRange, spill: SPILL_FUN, pool, debug):
     _HandleDefLiveRange(lr, pool, debug)
     if lr.cpu_reg is ir.CPU_REG_SPILL:
         # we need to spill but we still need a tmp reg
@@ -173,17 +182,17 @@ def _HandleDefLiveRangeFancy(i: int, lr: LiveRange, live_ranges: List[LiveRange]
             if debug:
                 debug(lr, "no spill scratch reg for def")
             # backtracking provides better allocation but is slow (potentially exponentially so)
-            _SpillEarlierLiveRange(lr.reg, lr.def_pos, i - 1, live_ranges, pool, [], debug)
-            tmp_reg = pool.get_available_reg(tmp_lr)
-            assert tmp_reg is not ir.CPU_REG_SPILL
+            # the freed up reg may be reserved later on, so we may need more than one
+            while tmp_reg is ir.CPU_REG_SPILL:
+                spill(lr.reg, lr.def_pos, [])
+                tmp_reg = pool.get_available_reg(tmp_lr)
         if debug:
             debug(lr, f"spill scratch reg for def: {tmp_reg.name}")
         pool.give_back_available_reg(tmp_reg)
     return i + 1
 
 
-def _HandleUseLiveRangeFancy(i: int, lr_use: LiveRange, live_ranges: List[LiveRange], pool,
-                             debug):
+def _HandleUseLiveRangeFancy(i: int, lr_use: LiveRange, spill: SPILL_FUN, pool, debug):
     """return are reg """
     spill_tmp_regs: List[ir.CpuReg] = []
     do_not_spill = []
@@ -203,9 +212,9 @@ def _HandleUseLiveRangeFancy(i: int, lr_use: LiveRange, live_ranges: List[LiveRa
             # backtracking provides better allocation but is slow (potentially exponentially so)
             # TODO: make a second pass to maybe undo some spilling
             # TODO: the earlier spilled reg may be a "lac" but we may request a non_lac
-            _SpillEarlierLiveRange(lr.reg, lr.def_pos, i - 1, live_ranges, pool, do_not_spill, debug)
-            tmp_reg = pool.get_available_reg(tmp_lr)
-            assert tmp_reg is not ir.CPU_REG_SPILL
+            while tmp_reg is ir.CPU_REG_SPILL:
+                spill(lr.reg, lr.def_pos, do_not_spill)
+                tmp_reg = pool.get_available_reg(tmp_lr)
 
         spill_tmp_regs.append(tmp_reg)
         if debug:
@@ -235,16 +244,92 @@ def RegisterAssignerLinearScanFancy(live_ranges: List[LiveRange], pool: RegPool,
     have lr.cpu_reg is ir.CPU_REG_INVALID
     """
     live_ranges.sort()
+
+    def spill(reg: ir.Reg, pos: int, do_not_spill: List[LiveRange]):
+        _SpillEarlierLiveRange(reg, pos, i - 1, live_ranges, pool, do_not_spill, debug)
+
+    i = 0
+    while i < len(live_ranges):
+        lr = live_ranges[i]
+        if lr.uses:
+            i = _HandleUseLiveRangeFancy(i, lr, spill, pool, debug)
+        else:
+            if PRE_ALLOC in lr.flags or IGNORE in lr.flags:
+                i += 1
+                continue
+            i = _HandleDefLiveRangeFancy(i, lr, spill, pool, debug)
+
+
+class _SpillCandidates:
+    """Assigned def LiveRanges indexed by (cpu reg family, end)
+
+    For every family we keep a heap whose top is the LiveRange ending last,
+    which is also the best one to spill. LiveRanges that were spilled or have
+    ended are dropped lazily when they surface at the top.
+    """
+
+    def __init__(self, pool: RegPool):
+        self._pool = pool
+        self._heaps: Dict[int, List[Tuple[int, int, LiveRange]]] = {}
+
+    def add(self, i: int, lr: LiveRange):
+        family = self._pool.get_cpu_reg_family(lr.reg.kind)
+        # on ties prefer the LiveRange which started later
+        heapq.heappush(self._heaps.setdefault(family, []), (-lr.last_use_pos, -i, lr))
+
+    def spill(self, reg: ir.Reg, pos: int, do_not_spill: List[LiveRange], debug):
+        heap = self._heaps.get(self._pool.get_cpu_reg_family(reg.kind), [])
+        skipped = []
+        while heap:
+            entry = heapq.heappop(heap)
+            lr = entry[2]
+            if lr.cpu_reg is ir.CPU_REG_SPILL:
+                continue
+            # everything else in the heap has ended as well
+            assert lr.last_use_pos > pos, f"failed to free up reg for {reg}"
+            if any(lr is x for x in do_not_spill):
+                skipped.append(entry)
+                continue
+            if debug:
+                debug(lr, f"spilling previously assigned {lr.cpu_reg.name}")
+            self._pool.give_back_available_reg(lr.cpu_reg)
+            lr.cpu_reg = ir.CPU_REG_SPILL
+            break
+        else:
+            assert False, f"failed to free up reg for {reg}"
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+
+
+def RegisterAssignerLinearScanHeap(live_ranges: List[LiveRange], pool: RegPool, debug=None):
+    """
+    Same as RegisterAssignerLinearScanFancy but suitable for huge Bbls
+
+    RegisterAssignerLinearScanFancy searches linearly backwards for a LiveRange to
+    spill which is quadratic for Bbls with lots of spilling.
+    Here the LiveRanges holding a cpu reg are kept in heaps (see _SpillCandidates)
+    and we spill the one ending last, which is also the classic linear scan choice.
+    So the assignment may differ from RegisterAssignerLinearScanFancy.
+    """
+    live_ranges.sort()
+    candidates = _SpillCandidates(pool)
+
+    def spill(reg: ir.Reg, _pos: int, do_not_spill: List[LiveRange]):
+        # the candidate must still be live at the current position
+        candidates.spill(reg, live_ranges[i].def_pos, do_not_spill, debug)
+
     i = 0
     while i < len(live_ranges):
         lr = live_ranges[i]
         if lr.uses:
-            i = _HandleUseLiveRangeFancy(i, lr, live_ranges, pool, debug)
+            i = _HandleUseLiveRangeFancy(i, lr, spill, pool, debug)
         else:
             if PRE_ALLOC in lr.flags or IGNORE in lr.flags:
                 i += 1
                 continue
-            i = _HandleDefLiveRangeFancy(i, lr, live_ranges, pool, debug)
+            i = _HandleDefLiveRangeFancy(i, lr, spill, pool, debug)
+            if lr.cpu_reg is not ir.CPU_REG_SPILL and lr.last_use_pos is not liveness.NO_USE:
+                candidates.add(i, lr)
 
 
 def InsSpillRegs(ins: ir.Ins, fun: ir.Fun, zero_const, reg_to_stk) -> Optional[List[ir.Ins]]:
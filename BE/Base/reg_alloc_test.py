@@ -218,6 +218,32 @@ class TestRanges(unittest.TestCase):
             # print (lr)
             assert lr.cpu_reg != ir.CPU_REG_SPILL, f"unexpected reg {lr}"
 
+    def testHeap(self):
+        num_regs = 100
+        lines = [".fun main NORMAL [U32] = []", ".bbl start"]
+        lines += [f"    mov r{i}:U32 {i}" for i in range(num_regs)]
+        lines += ["    mov sum:U32 0"]
+        lines += [f"    add sum = sum r{i}" for i in reversed(range(num_regs))]
+        lines += ["    pusharg sum", "    ret"]
+        unit = serialize.UnitParseFromAsm(io.StringIO("\n".join(lines)), False)
+        fun = unit.fun_syms["main"]
+        bbl = fun.bbls[0]
+
+        live_ranges = liveness.BblGetLiveRanges(bbl, fun, set())
+        pool = TestRegPool(MakeGenericCpuRegs(8))
+        reg_alloc.RegisterAssignerLinearScanHeap(live_ranges, pool)
+        assigned = [lr for lr in live_ranges
+                    if not lr.is_use_lr() and lr.cpu_reg is not ir.CPU_REG_SPILL]
+        spilled = [lr for lr in live_ranges
+                   if not lr.is_use_lr() and lr.cpu_reg is ir.CPU_REG_SPILL]
+        self.assertTrue(spilled)
+        for a in assigned:
+            self.assertIsNot(a.cpu_reg, ir.CPU_REG_INVALID)
+            for b in assigned:
+                if a is not b and a.cpu_reg is b.cpu_reg:
+                    self.assertTrue(a.last_use_pos <= b.def_pos or
+                                    b.last_use_pos <= a.def_pos, f"overlap {a} {b}")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -75,16 +75,10 @@ def LiveRangeShouldBeIgnored(lr: liveness.LiveRange, reg_kind_map: Dict[o.DK, in
     return lr.reg.HasCpuReg()
 
 
-def FunComputeBblRegUsageStats(fun: ir.Fun,
-                               reg_kind_map: Dict[o.DK, int]) -> Dict[REG_KIND_LAC, int]:
-    """
-    Computes maximum number of register needed for locals across all Bbls
-
-    Requires liveness.
-    """
+def _BblRegUsageStatsWithTrace(fun: ir.Fun, reg_kind_map: Dict[o.DK, int]) -> Dict[REG_KIND_LAC, int]:
+    """LiveRange object based version of FunComputeBblRegUsageStats()"""
     pool = BblRegUsageStatsRegPool(reg_kind_map)
-    for bbl in fun.bbls:
-        live_ranges = liveness.BblGetLiveRanges(bbl, fun, bbl.live_out)
+    for bbl, live_ranges in liveness.FunBblLiveRanges(fun):
         live_ranges.sort()
         if TRACE_REG_ALLOC:
             print("@" * 60)
@@ -99,6 +93,60 @@ def FunComputeBblRegUsageStats(fun: ir.Fun,
     return pool.usage()
 
 
+def FunComputeBblRegUsageStats(fun: ir.Fun,
+                               reg_kind_map: Dict[o.DK, int]) -> Dict[REG_KIND_LAC, int]:
+    """
+    Computes maximum number of register needed for locals across all Bbls
+
+    Requires liveness.
+
+    This computes the same result as running the linear scan allocator with a
+    BblRegUsageStatsRegPool over all Bbls (see _BblRegUsageStatsWithTrace) but
+    works directly on the columns of a LiveRangeTable: the number of registers
+    needed is the maximum number of overlapping LiveRanges for each REG_KIND_LAC.
+    """
+    if TRACE_REG_ALLOC:
+        return _BblRegUsageStatsWithTrace(fun, reg_kind_map)
+    table = liveness.FunGetLiveRangeTable(fun)
+    # ranges for regs that are not coming from the pool are ignored
+    reg_kinds = [None if reg.HasCpuReg() else reg_kind_map.get(reg.kind)
+                 for reg in table.regs]
+    def_pos = table.def_pos
+    last_use_pos = table.last_use_pos
+    lac = liveness.LiveRangeFlag.LAC.value
+    usage: Dict[REG_KIND_LAC, int] = {}
+    events: Dict[REG_KIND_LAC, List[int]] = collections.defaultdict(list)
+    for bbl_no in range(table.num_bbls()):
+        events.clear()
+        for n in range(table.bbl_start[bbl_no], table.bbl_start[bbl_no + 1]):
+            reg_no = table.reg[n]
+            if reg_no < 0:
+                continue
+            kind = reg_kinds[reg_no]
+            start = def_pos[n]
+            end = last_use_pos[n]
+            if kind is None or start == liveness.BEFORE_BBL or end == liveness.AFTER_BBL:
+                continue
+            # at the same position ranges ending are processed before ranges
+            # starting and ranges without use end right after they start
+            ev = events[(kind, bool(table.flags[n] & lac))]
+            ev.append(4 * start + 1)
+            ev.append(4 * start + 2 if end == liveness.NO_USE else 4 * end)
+        for key, ev in events.items():
+            ev.sort()
+            count = 0
+            peak = usage.get(key, 0)
+            for e in ev:
+                if e & 3 == 1:
+                    count += 1
+                    if count > peak:
+                        peak = count
+                else:
+                    count -= 1
+            usage[key] = peak
+    return usage
+
+
 def FunComputeRegStatsExceptLAC(fun: ir.Fun):
     """Updates Reg info: Sets def_ins, def_bbl and the flags:
 
@@ -144,7 +192,7 @@ def FunComputeRegStatsLAC(fun: ir.Fun):
     for reg in fun.regs:
         reg.flags &= ~(ir.REG_FLAG.GLOBAL | ir.REG_FLAG.LAC)
     for bbl in fun.bbls:
-        live_out = bbl.live_out.copy()
+        live_out = set(bbl.live_out)
         for ins in reversed(bbl.inss):
             if ins.opcode.is_call():
                 for reg in live_out:
@@ -4,9 +4,10 @@
 
 import collections
 import struct
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union
 
 from BE.Base import ir
+from IR import binary_ir
 from IR import opcode_tab as o
 from Util import parse
 from BE.Base import sanity
@@ -257,13 +258,18 @@ DIR_DISPATCHER = {
 }
 
 
+def _ExtractInt(v) -> int:
+    # the binary reader has already decoded the number
+    return v if isinstance(v, int) else int(v, 0)
+
+
 def ExtractBblTable(fun: ir.Fun, lst: List) -> Dict[int, ir.Bbl]:
     assert len(lst) % 2 == 0
     it = iter(lst)
     out = {}
-    for num_str in it:
+    for num in it:
         bbl_name = next(it)
-        out[int(num_str, 0)] = fun.GetBblOrAddForwardDeclaration(bbl_name)
+        out[_ExtractInt(num)] = fun.GetBblOrAddForwardDeclaration(bbl_name)
     return out
 
 
@@ -302,12 +308,12 @@ def ExtractBytes(v) -> bytes:
 
 def _GetRegOrConstOperand(fun: ir.Fun, last_kind: o.DK,
                           ok: o.OP_KIND, tc: o.TC,
-                          token: str, regs_cpu: Dict[str, ir.Reg]) -> Any:
+                          token: str, regs_cpu: Dict[str, ir.CpuReg]) -> Any:
     if ok == o.OP_KIND.REG_OR_CONST:
         ok = o.OP_KIND.CONST if parse.IsLikelyConst(token) else o.OP_KIND.REG
 
     if ok is o.OP_KIND.REG:
-        cpu_reg = None
+        cpu_reg: Optional[Union[ir.CpuReg, ir.StackSlot]] = None
         pos = token.find("@")
         if pos > 0:
             cpu_reg_name = token[pos + 1:]
@@ -355,13 +361,12 @@ def _GetRegOrConstOperand(fun: ir.Fun, last_kind: o.DK,
             assert False, f"cannot deduce type for const {token} [{tc}]"
 
 
-def _GetOperand(unit: ir.Unit, fun: ir.Fun, ok: o.OP_KIND, v: Any) -> Any:
-    if ok in o.OKS_LIST:
-        assert isinstance(
-            v, list) or v[0] == v[-1] == '"', f"operand {ok}: [{v}] expected list or quoted bytes"
-    else:
-        assert isinstance(v, str), f"bad operand {v} of type [{ok}]"
+def _GetOperand(unit: ir.Unit, fun: Optional[ir.Fun], ok: o.OP_KIND, v: Any) -> Any:
+    """Shared by the text and the binary reader
 
+    The latter passes ints and bytes which are already decoded.
+    `fun` is None for the directives preceding the first function.
+    """
     if ok is o.OP_KIND.TYPE_LIST:
         out = []
         for kind_name in v:
@@ -372,12 +377,15 @@ def _GetOperand(unit: ir.Unit, fun: ir.Fun, ok: o.OP_KIND, v: Any) -> Any:
     elif ok is o.OP_KIND.FUN:
         return unit.GetFunOrAddForwardDeclaration(v)
     elif ok is o.OP_KIND.BBL:
+        assert fun is not None, f"{ok} operand outside of a function"
         return fun.GetBblOrAddForwardDeclaration(v)
     elif ok is o.OP_KIND.BBL_TAB:
+        assert fun is not None, f"{ok} operand outside of a function"
         return ExtractBblTable(fun, v)
     elif ok is o.OP_KIND.MEM:
         return unit.GetMemOrAddForwardDeclaration(v)
     elif ok is o.OP_KIND.STK:
+        assert fun is not None, f"{ok} operand outside of a function"
         return fun.GetStk(v)
     elif ok is o.OP_KIND.FUN_KIND:
         return o.SHORT_STR_TO_FK[v]
@@ -391,17 +399,18 @@ def _GetOperand(unit: ir.Unit, fun: ir.Fun, ok: o.OP_KIND, v: Any) -> Any:
     elif ok is o.OP_KIND.MEM_KIND:
         return o.SHORT_STR_TO_MK[v]
     elif ok is o.OP_KIND.BYTES:
-        return ExtractBytes(v)
+        return v if isinstance(v, bytes) else ExtractBytes(v)
     elif ok is o.OP_KIND.JTB:
+        assert fun is not None, f"{ok} operand outside of a function"
         return fun.GetJbl(v)
     elif ok is o.OP_KIND.INT:
-        return int(v, 0)
+        return _ExtractInt(v)
     else:
         raise ir.ParseError(f"cannot read op type: {ok}")
 
 
 def RetrieveActualOperands(unit: ir.Unit, fun: ir.Fun,
-                           opc: o.Opcode, token: List, regs_cpu: Dict[str, ir.Reg]):
+                           opc: o.Opcode, token: List, regs_cpu: Dict[str, ir.CpuReg]):
     out = []
     assert len(opc.operand_kinds) == len(token) - 1
     last_type: o.DK = o.DK.INVALID
@@ -412,6 +421,11 @@ def RetrieveActualOperands(unit: ir.Unit, fun: ir.Fun,
             x = _GetRegOrConstOperand(fun, last_type, ok, tc, token, regs_cpu)
             last_type = x.kind
         else:
+            if ok in o.OKS_LIST:
+                assert isinstance(
+                    token, list) or token[0] == token[-1] == '"', f"operand {ok}: [{token}] expected list or quoted bytes"
+            else:
+                assert isinstance(token, str), f"bad operand {token} of type [{ok}]"
             x = _GetOperand(unit, fun, ok, token)
         if x is None:
             raise ir.ParseError(f"cannot read  [{ok}] in ops: {token}")
@@ -419,7 +433,7 @@ def RetrieveActualOperands(unit: ir.Unit, fun: ir.Fun,
     return out
 
 
-def ProcessLine(token: List, unit: ir.Unit, fun: Optional[ir.Fun], cpu_regs: Dict[str, ir.Reg]):
+def ProcessLine(token: List, unit: ir.Unit, fun: Optional[ir.Fun], cpu_regs: Dict[str, ir.CpuReg]):
     opc = o.Opcode.Table.get(token[0])
     if not opc:
         raise ir.ParseError(f"unknown opcode/directive: {token}")
@@ -487,6 +501,203 @@ def UnitAddParseFromAsm(unit: ir.Unit, fin, verbose=False, cpu_regs: dict[str, i
                 f"UnitParseFromAsm error in line {line_num}:\n{line}\n{token}\n{err}")
 
 
+############################################################
+# Binary IR (see IR/binary_ir.py)
+############################################################
+class _TextToken(str):
+    """A token of the binary IR which is left to the text parser"""
+    pass
+
+
+def _DecodeVarint(buf: bytes, pos: int):
+    x = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        x |= (b & 0x7f) << shift
+        if b < 0x80:
+            return x, pos
+        shift += 7
+
+
+def _DecodeZigZag(buf: bytes, pos: int):
+    x, pos = _DecodeVarint(buf, pos)
+    return (x >> 1) if not x & 1 else -((x + 1) >> 1), pos
+
+
+def _DecodeBinaryOperand(buf: bytes, pos: int, strings: List[str]):
+    tag = buf[pos]
+    pos += 1
+    if tag == binary_ir.TAG_STR:
+        index, pos = _DecodeVarint(buf, pos)
+        return strings[index], pos
+    elif tag == binary_ir.TAG_NEW_STR:
+        size, pos = _DecodeVarint(buf, pos)
+        s = str(buf[pos:pos + size], "utf8")
+        strings.append(s)
+        return s, pos + size
+    elif tag == binary_ir.TAG_INT:
+        return _DecodeZigZag(buf, pos)
+    elif tag == binary_ir.TAG_TYPED_INT:
+        kind = o.DK(buf[pos])
+        value, pos = _DecodeZigZag(buf, pos + 1)
+        return ir.InternConst(kind, value), pos
+    elif tag == binary_ir.TAG_REAL:
+        kind = o.DK(buf[pos])
+        value, = struct.unpack_from("<d", buf, pos + 1)
+        return ir.InternConst(kind, value), pos + 9
+    elif tag == binary_ir.TAG_REG_DEF:
+        kind = o.DK(buf[pos])
+        name, pos = _DecodeBinaryOperand(buf, pos + 1, strings)
+        return (name, kind), pos
+    elif tag == binary_ir.TAG_BYTES:
+        size, pos = _DecodeVarint(buf, pos)
+        return bytes(buf[pos:pos + size]), pos + size
+    elif tag == binary_ir.TAG_LIST:
+        n, pos = _DecodeVarint(buf, pos)
+        out = []
+        for _ in range(n):
+            x, pos = _DecodeBinaryOperand(buf, pos, strings)
+            out.append(x)
+        return out, pos
+    elif tag == binary_ir.TAG_TEXT:
+        s, pos = _DecodeBinaryOperand(buf, pos, strings)
+        return _TextToken(s), pos
+    else:
+        raise ParseError(f"unknown operand tag {tag}")
+
+
+def _ConstFromInt(value: int, kind: o.DK) -> ir.Const:
+    """Same as ir.ParseConst(str(value), kind)"""
+    flavor = kind.flavor()
+    if flavor is o.DK_FLAVOR_R:
+        return ir.InternConst(kind, float(value))
+    bit_width = kind.bitwidth()
+    if flavor is o.DK_FLAVOR_U:
+        assert 0 <= value < (1 << bit_width)
+    else:
+        assert -(1 << (bit_width - 1)) <= value < (1 << (bit_width - 1)
+                                                   ), f"{value} value out of bounds for {kind}"
+    return ir.InternConst(kind, value)
+
+
+def _GetBinaryRegOrConstOperand(fun: ir.Fun, last_kind: o.DK,
+                                ok: o.OP_KIND, tc: o.TC, v: Any, regs_cpu: Dict[str, ir.CpuReg]) -> Any:
+    if isinstance(v, ir.Const):
+        return v
+    elif isinstance(v, _TextToken):
+        return _GetRegOrConstOperand(fun, last_kind, ok, tc, str(v), regs_cpu)
+    elif isinstance(v, str):
+        return fun.GetReg(v)
+    elif isinstance(v, tuple):
+        reg = ir.Reg(v[0], v[1])
+        fun.AddReg(reg)
+        assert o.CheckTypeConstraint(last_kind, tc, reg.kind)
+        return reg
+    elif tc == o.TC.SAME_AS_PREV:
+        return _ConstFromInt(v, last_kind)
+    elif tc == o.TC.OFFSET:
+        return ir.OffsetConst(v)
+    elif tc == o.TC.UINT:
+        assert v >= 0
+        return ir.OffsetConst(v)
+    else:
+        assert False, f"cannot deduce type for const {v} [{tc}]"
+
+
+_REG_OR_CONST_KINDS = {o.OP_KIND.REG_OR_CONST, o.OP_KIND.REG, o.OP_KIND.CONST}
+
+
+def _ProcessBinaryRecord(opc: o.Opcode, vals: List, unit: ir.Unit, fun: Optional[ir.Fun],
+                         cpu_regs: Dict[str, ir.CpuReg]):
+    """Like ProcessLine but for a decoded binary IR record"""
+    if opc is o.LEA:
+        assert fun is not None
+        name = vals[1]
+        if not isinstance(name, str):
+            pass
+        elif name in fun.reg_syms:
+            pass  # in case the register name is shadows a global
+        elif name in unit.fun_syms:
+            opc = o.LEA_FUN
+        elif name in unit.mem_syms:
+            opc = o.LEA_MEM
+        elif name in fun.stk_syms:
+            opc = o.LEA_STK
+
+        if opc is not o.LEA_FUN and len(vals) < 3:
+            vals.append(0)
+    if len(vals) != len(opc.operand_kinds):
+        raise ir.ParseError(
+            f"operand number {len(opc.operand_kinds)} mismatch: {opc.name} {vals}")
+
+    operands = []
+    last_kind: o.DK = o.DK.INVALID
+    for ok, tc, v in zip(opc.operand_kinds, opc.constraints, vals):
+        if ok in _REG_OR_CONST_KINDS:
+            assert fun is not None, f"{opc.name} outside of a function"
+            x = _GetBinaryRegOrConstOperand(fun, last_kind, ok, tc, v, cpu_regs)
+            last_kind = x.kind
+        else:
+            x = _GetOperand(unit, fun, ok, v)
+        if x is None:
+            raise ir.ParseError(f"cannot read  [{ok}] in ops: {v}")
+        operands.append(x)
+
+    if opc.kind is o.OPC_KIND.DIRECTIVE:
+        DIR_DISPATCHER[opc.name](unit, operands)
+    else:
+        assert fun is not None
+        assert fun.bbls, f"no bbl specified to contain instruction"
+        ins = ir.Ins(opc, operands, False)
+        fun.bbls[-1].AddIns(ins)
+        sanity.InsCheckConstraints(ins)
+
+
+def _ReadVarint(fin) -> Optional[int]:
+    x = 0
+    shift = 0
+    while True:
+        b = fin.read(1)
+        if not b:
+            assert shift == 0, "truncated varint"
+            return None
+        x |= (b[0] & 0x7f) << shift
+        if b[0] < 0x80:
+            return x
+        shift += 7
+
+
+def UnitAddParseFromBinary(unit: ir.Unit, fin, cpu_regs: dict[str, ir.CpuReg] = {}):
+    """Streaming counterpart of UnitAddParseFromAsm for binary IR
+
+    `fin` must be opened in binary mode.
+    """
+    if fin.read(len(binary_ir.MAGIC)) != binary_ir.MAGIC:
+        raise ParseError("not a binary IR file")
+    strings: List[str] = []
+    record_num = 0
+    while True:
+        size = _ReadVarint(fin)
+        if size is None:
+            break
+        buf = fin.read(size)
+        fun = None if len(unit.funs) == 0 else unit.funs[-1]
+        try:
+            no, pos = _DecodeVarint(buf, 0)
+            opc = o.Opcode.TableByNo[no]
+            vals = []
+            while pos < size:
+                v, pos = _DecodeBinaryOperand(buf, pos, strings)
+                vals.append(v)
+            _ProcessBinaryRecord(opc, vals, unit, fun, cpu_regs)
+        except Exception as err:
+            raise ParseError(
+                f"UnitParseFromBinary error in record {record_num}:\n{err}")
+        record_num += 1
+
+
 def UnitSanityCheckAfterParse(unit: ir.Unit):
     for fun in unit.funs:
         assert fun.kind != o.FUN_KIND.INVALID
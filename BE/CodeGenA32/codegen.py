@@ -9,8 +9,12 @@ import os
 import stat
 import collections
 
+from typing import Optional
+
 from BE.Base import ir
+from IR import binary_ir
 from IR import opcode_tab as o
+from BE.Base import sanity
 from BE.Base import serialize
 
 from BE.CpuA32 import opcode_tab as a32
@@ -21,9 +25,12 @@ from BE.CodeGenA32 import isel_tab
 from BE.CodeGenA32 import regs
 from BE.CodeGenA32 import legalize
 from BE.CodeGenCommon import cpu_neutral
+from BE.CodeGenCommon import fun_cache
 
 from BE.Elf import enum_tab
 from BE.Elf import elf_unit
+from BE.Elf import elfhelper as elf
+from Util import timing
 
 
 ############################################################
@@ -121,6 +128,40 @@ def codegen(unit: ir.Unit) -> Unit:
 # binary emitter
 ############################################################
 
+def _FunCodeGenBinary(fun: ir.Fun, elfunit: elf_unit.Unit):
+    elfunit.FunStart(fun.name, 16, assembler.NOP_BYTES)
+    for jtb in fun.jtbs:
+        cpu_neutral.JtbCodeGenSimpleBinary(
+            elfunit, jtb, 4, enum_tab.RELOC_TYPE_ARM.ABS32)
+
+    ctx = regs.FunComputeEmitContext(fun)
+
+    # cpu instructions are collected per bbl and encoded in bulk
+    assembler.AddInss(elfunit, [tmpl.MakeInsFromTmpl(None, ctx)
+                                for tmpl in isel_tab.EmitFunProlog(ctx)])
+
+    for bbl in fun.bbls:
+        elfunit.AddLabel(bbl.name, 4, assembler.NOP_BYTES)
+        cpu_inss = []
+        for ins in bbl.inss:
+            if ins.opcode is o.NOP1:
+                isel_tab.HandlePseudoNop1(ins, ctx)
+            elif ins.opcode is o.LINE:
+                pass
+                # TODO: add line number support
+            elif ins.opcode is o.RET:
+                for tmpl in isel_tab.EmitFunEpilog(ctx):
+                    cpu_inss.append(tmpl.MakeInsFromTmpl(None, ctx))
+
+            else:
+                pattern = isel_tab.FindMatchingPattern(ins)
+                assert pattern, f"could not find pattern for\n{ins} {ins.operands}"
+                for tmpl in pattern.emit:
+                    cpu_inss.append(tmpl.MakeInsFromTmpl(ins, ctx))
+        assembler.AddInss(elfunit, cpu_inss)
+    elfunit.FunEnd()
+
+
 def EmitUnitAsBinary(unit: ir.Unit) -> elf_unit.Unit:
     elfunit = elf_unit.Unit()
     for mem in unit.mems:
@@ -130,42 +171,86 @@ def EmitUnitAsBinary(unit: ir.Unit) -> elf_unit.Unit:
         cpu_neutral.MemCodeGenBinary(
             elfunit, mem, enum_tab.RELOC_TYPE_ARM.ABS32)
 
-    sec_text = elfunit.sec_text
     for fun in unit.funs:
-        elfunit.FunStart(fun.name, 16, assembler.NOP_BYTES)
-        for jtb in fun.jtbs:
-            cpu_neutral.JtbCodeGenSimpleBinary(
-                elfunit, jtb, 4, enum_tab.RELOC_TYPE_ARM.ABS32)
-
-        ctx = regs.FunComputeEmitContext(fun)
-
-        for tmpl in isel_tab.EmitFunProlog(ctx):
-            assembler.AddIns(elfunit, tmpl.MakeInsFromTmpl(None, ctx))
-
-        for bbl in fun.bbls:
-            elfunit.AddLabel(bbl.name, 4, assembler.NOP_BYTES)
-            for ins in bbl.inss:
-                if ins.opcode is o.NOP1:
-                    isel_tab.HandlePseudoNop1(ins, ctx)
-                elif ins.opcode is o.LINE:
-                    pass
-                    # TODO: add line number support
-                elif ins.opcode is o.RET:
-                    for tmpl in isel_tab.EmitFunEpilog(ctx):
-                        assembler.AddIns(elfunit,
-                                         tmpl.MakeInsFromTmpl(None, ctx))
-
-                else:
-                    pattern = isel_tab.FindMatchingPattern(ins)
-                    assert pattern, f"could not find pattern for\n{ins} {ins.operands}"
-                    for tmpl in pattern.emit:
-                        assembler.AddIns(elfunit,
-                                         tmpl.MakeInsFromTmpl(ins, ctx))
-        elfunit.FunEnd()
+        with timing.Span(fun.name, "emit", lambda: ir.FunSizeCounters(fun)):
+            _FunCodeGenBinary(fun, elfunit)
     elfunit.AddLinkerDefs()
     return elfunit
 
 
+def _FunRegAllocAndCodeGenBinary(fun: ir.Fun, unit: ir.Unit, opt_stats) -> elf_unit.Unit:
+    sanity.FunCheck(fun, unit, check_cfg=False, check_push_pop=False, check_fallthroughs=False)
+    legalize.PhaseGlobalRegAlloc(fun, opt_stats, None)
+    legalize.PhaseFinalizeStackAndLocalRegAlloc(fun, opt_stats)
+    elfunit = elf_unit.Unit()
+    _FunCodeGenBinary(fun, elfunit)
+    return elfunit
+
+
+def EmitUnitAsBinaryParallel(unit: ir.Unit, opt_stats, jobs: int,
+                             cache: Optional[fun_cache.FunCache] = None) -> elf_unit.Unit:
+    """Combines RegAllocGlobal, RegAllocLocal and EmitUnitAsBinary
+
+    The functions are processed by `jobs` worker processes and the
+    per function machine code is spliced back together in the original order,
+    so the result is identical to the serial version.
+    With a `cache` only functions whose machine code is not cached yet get processed.
+    Must be called after LegalizeAll which performs interprocedural work.
+    """
+    elfunit = elf_unit.Unit()
+    for mem in unit.mems:
+        assert mem.kind is not o.MEM_KIND.EXTERN
+        if mem.kind == o.MEM_KIND.BUILTIN:
+            continue
+        cpu_neutral.MemCodeGenBinary(
+            elfunit, mem, enum_tab.RELOC_TYPE_ARM.ABS32)
+
+    if cache:
+        frags = fun_cache.UnitMapFunsCached(unit, _FunRegAllocAndCodeGenBinary,
+                                            opt_stats, jobs, cache)
+    else:
+        frags = cpu_neutral.UnitMapFunsParallel(unit, _FunRegAllocAndCodeGenBinary,
+                                                opt_stats, jobs)
+    for frag in frags:
+        elfunit.AddUnitFragment(frag, assembler.NOP_BYTES)
+    elfunit.AddLinkerDefs()
+    return elfunit
+
+
+def CacheVersion() -> str:
+    """Identifies the backend sources for the per function machine code cache"""
+    return fun_cache.SourceVersion([ir, o, a32, isel_tab, cpu_neutral, elf_unit])
+
+
+def EmitUnitAsExe(unit: ir.Unit, opt_stats: dict[str, int], jobs: int = 1,
+                  cache_dir: Optional[str] = None) -> elf.Executable:
+    """Runs the complete backend on a freshly parsed Unit
+
+    With a `cache_dir` the machine code of functions which were compiled before
+    (same legalized IR, same backend sources) is reused.
+    """
+    # we need to legalize all functions first as this may change the signature
+    # and fills in cpu reg usage which is used by subsequent interprocedural opts.
+    with cpu_neutral.UnitPhaseSpan("LegalizeAll", unit):
+        legalize.LegalizeAll(unit, opt_stats, None)
+    if cache_dir:
+        cache = fun_cache.FunCache(cache_dir, CacheVersion())
+        with cpu_neutral.UnitPhaseSpan("EmitUnitAsBinaryCached", unit):
+            armunit = EmitUnitAsBinaryParallel(unit, opt_stats, jobs, cache)
+    elif jobs > 1:
+        with cpu_neutral.UnitPhaseSpan("EmitUnitAsBinaryParallel", unit):
+            armunit = EmitUnitAsBinaryParallel(unit, opt_stats, jobs)
+    else:
+        with cpu_neutral.UnitPhaseSpan("RegAllocGlobal", unit):
+            legalize.RegAllocGlobal(unit, opt_stats, None)
+        with cpu_neutral.UnitPhaseSpan("RegAllocLocal", unit):
+            legalize.RegAllocLocal(unit, opt_stats, None)
+        with cpu_neutral.UnitPhaseSpan("EmitUnitAsBinary", unit):
+            armunit = EmitUnitAsBinary(unit)
+    with timing.Span("Assemble"):
+        return assembler.Assemble(armunit, True)
+
+
 if __name__ == "__main__":
     import sys
     import argparse
@@ -178,53 +263,70 @@ if __name__ == "__main__":
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         parser.add_argument('-mode', type=str, help='mode', default="binary",
                             choices=_ALLOWED_MODES)
+        parser.add_argument('-jobs', type=int, default=1,
+                            help='number of processes used for per function code generation '
+                            '(binary mode only)')
+        parser.add_argument('-cache_dir', type=str,
+                            help='directory for caching per function machine code '
+                            '(binary mode only)')
+        parser.add_argument('-timing_report', type=str,
+                            help='write per phase and per function timings (Chrome trace json)')
         parser.add_argument('input', type=str,  nargs='+', help='input file')
         parser.add_argument('output', type=str, help='output file')
         args = parser.parse_args()
 
+        if args.timing_report:
+            timing.Enable()
         unit = ir.Unit("module")
-        for input in args.input:
-            fin = sys.stdin if input == "-" else open(input)
-            serialize.UnitAddParseFromAsm(unit, fin)
-        serialize.UnitSanityCheckAfterParse(unit)
+        with timing.Span("parse"):
+            for input in args.input:
+                if input != "-" and binary_ir.IsBinaryIr(input):
+                    serialize.UnitAddParseFromBinary(unit, open(input, "rb"))
+                    continue
+                fin = sys.stdin if input == "-" else open(input)
+                serialize.UnitAddParseFromAsm(unit, fin)
+            serialize.UnitSanityCheckAfterParse(unit)
         opt_stats: dict[str, int] = collections.defaultdict(int)
 
-        if args.mode == "binary":
+        try:
+            if args.mode == "binary":
+                exe = EmitUnitAsExe(unit, opt_stats, args.jobs, args.cache_dir)
+                with timing.Span("save"):
+                    exe.save(open(args.output, "wb"))
+                os.chmod(args.output, stat.S_IREAD | stat.S_IEXEC | stat.S_IWRITE)
+                return
+
+            fout = sys.stdout if args.output == "-" else open(args.output, "w")
+
             # we need to legalize all functions first as this may change the signature
             # and fills in cpu reg usage which is used by subsequent interprocedural opts.
-            legalize.LegalizeAll(unit, opt_stats, None)
-            legalize.RegAllocGlobal(unit, opt_stats, None)
-            legalize.RegAllocLocal(unit, opt_stats, None)
-            armunit = EmitUnitAsBinary(unit)
-            exe = assembler.Assemble(armunit, True)
-            exe.save(open(args.output, "wb"))
-            os.chmod(args.output, stat.S_IREAD | stat.S_IEXEC | stat.S_IWRITE)
-            return
-
-        fout = sys.stdout if args.output == "-" else open(args.output, "w")
-
-        # we need to legalize all functions first as this may change the signature
-        # and fills in cpu reg usage which is used by subsequent interprocedural opts.
-        legalize.LegalizeAll(unit, opt_stats)
-        if args.mode == "legalize":
-            print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
-            return
-
-        legalize.RegAllocGlobal(unit, opt_stats, fout)
-        if args.mode == "reg_alloc_global":
-            print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
-            return
-
-        legalize.RegAllocLocal(unit, opt_stats)
-        if args.mode == "reg_alloc_local":
-            print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
-            return
-
-        assert args.mode == "normal"
-        EmitUnitAsText(unit, fout)
-        if False:
-            print("# STATS:")
-            for key, val in sorted(opt_stats.items()):
-                print(f"#  {key}: {val}", file=fout)
+            with cpu_neutral.UnitPhaseSpan("LegalizeAll", unit):
+                legalize.LegalizeAll(unit, opt_stats)
+            if args.mode == "legalize":
+                print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
+                return
+
+            with cpu_neutral.UnitPhaseSpan("RegAllocGlobal", unit):
+                legalize.RegAllocGlobal(unit, opt_stats, fout)
+            if args.mode == "reg_alloc_global":
+                print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
+                return
+
+            with cpu_neutral.UnitPhaseSpan("RegAllocLocal", unit):
+                legalize.RegAllocLocal(unit, opt_stats)
+            if args.mode == "reg_alloc_local":
+                print("\n".join(serialize.UnitRenderToASM(unit)), file=fout)
+                return
+
+            assert args.mode == "normal"
+            with cpu_neutral.UnitPhaseSpan("EmitUnitAsText", unit):
+                EmitUnitAsText(unit, fout)
+            if False:
+                print("# STATS:")
+                for key, val in sorted(opt_stats.items()):
+                    print(f"#  {key}: {val}", file=fout)
+        finally:
+            if args.timing_report:
+                timing.WriteReport(args.timing_report, opt_stats)
 
     main()
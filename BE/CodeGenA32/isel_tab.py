@@ -5,11 +5,12 @@
 See `ARM32.md` for more details.
 """
 
-import collections
-from typing import List, Dict, Any, Set, Optional
+from typing import List, Dict, Any, Set, Optional, Tuple
 import enum
+import os
 
 from BE.Base import ir
+from BE.CodeGenCommon import pattern_table
 from IR import opcode_tab as o
 from BE.CodeGenA32 import regs
 from BE.CpuA32 import opcode_tab as arm
@@ -434,7 +435,8 @@ class Pattern:
     See ../Docs/instruction_selection.md
     """
     # groups all the patterns for a given opcode number together
-    Table: Dict[int, List["Pattern"]] = collections.defaultdict(list)
+    # set up at the bottom of the file once all the Init functions are defined
+    Table: pattern_table.LazyPatternTable
 
     def __init__(self, opcode: o.Opcode, type_curbs: List[o.DK],
                  emit: List[InsTmpl],
@@ -467,7 +469,22 @@ class Pattern:
                 assert imm_constr is IMM_CURB.invalid, f"bad pattern for {opcode}"
 
         # we put all the patterns for given IR opcode into the same bucket
-        Pattern.Table[opcode.no].append(self)
+        Pattern.Table.Add(opcode.no, self)
+
+    def MatchesShape(self, shape: Tuple[Any, ...]) -> bool:
+        """Like MatchesTypeConstraints combined with a perfect MatchesImmConstraints but only looks at the shape
+
+        The shape is computed by _InsShape. The values of constant operands are not checked.
+        """
+        for type_constr, imm_curb, op_shape in zip(self.type_curbs, self.imm_curbs, shape[1:]):
+            if op_shape is None:
+                continue
+            kind, is_reg = op_shape
+            if type_constr is not o.DK.INVALID and kind != type_constr:
+                return False
+            if is_reg != (imm_curb is IMM_CURB.invalid):
+                return False
+        return True
 
     def MatchesTypeConstraints(self, ins: ir.Ins) -> bool:
         for type_constr, op in zip(self.type_curbs, ins.operands):
@@ -1134,17 +1151,56 @@ def InitVFP():
              InsTmpl(f"vcvt_f64_u32", [PARAM.reg0, PARAM.scratch_flt])])
 
 
-InitLoad()
-InitStore()
-InitCAS()
-InitAlu()
-InitLea()
-InitMove()
-InitCondBra()
-InitCmp()
-InitMiscBra()
-InitConv()
-InitVFP()
+# The Init functions are only run when the table is first consulted
+Pattern.Table = pattern_table.LazyPatternTable(
+    [InitLoad,
+     InitStore,
+     InitCAS,
+     InitAlu,
+     InitLea,
+     InitMove,
+     InitCondBra,
+     InitCmp,
+     InitMiscBra,
+     InitConv,
+     InitVFP],
+    {"ir": o.Opcode.TableByNo, "isa": arm.Opcode.name_to_opcode},
+    [__file__,
+     arm.__file__,
+     o.__file__,
+     pattern_table.__file__],
+    # the pickled patterns reference the classes of the imported module
+    None if __name__ == "__main__" else
+    os.path.join(os.path.dirname(__file__), "__pycache__", "a32_isel_tab.pickle"))
+
+
+def _OperandShape(op: Any) -> Optional[Tuple[o.DK, bool]]:
+    if isinstance(op, ir.Reg):
+        return op.kind, True
+    elif isinstance(op, ir.Const):
+        return op.kind, False
+    return None
+
+
+def _InsShape(ins: ir.Ins) -> Tuple[Any, ...]:
+    """The properties of `ins` which (mostly) determine which patterns can match"""
+    return (ins.opcode.no, *[_OperandShape(op) for op in ins.operands])
+
+
+# Maps an instruction shape to the patterns which can match an instruction of that shape
+# and whether the values of constant operands still need to be checked.
+# Populated on demand by FindMatchingPattern.
+_PATTERNS_BY_SHAPE: Dict[Tuple[Any, ...], Tuple[List[Pattern], bool]] = {}
+
+
+def _PatternsForShape(shape: Tuple[Any, ...]) -> Tuple[List[Pattern], bool]:
+    out = _PATTERNS_BY_SHAPE.get(shape)
+    if out is None:
+        patterns = [p for p in Pattern.Table[shape[0]] if p.MatchesShape(shape)]
+        has_const = any(op_shape is not None and not op_shape[1] for op_shape in shape[1:])
+        out = patterns, has_const
+        _PATTERNS_BY_SHAPE[shape] = out
+    return out
 
 
 def FindMatchingPattern(ins: ir.Ins) -> Optional[Pattern]:
@@ -1152,11 +1208,11 @@ def FindMatchingPattern(ins: ir.Ins) -> Optional[Pattern]:
 
     This can only be called AFTER the stack has been finalized
     """
-    patterns = Pattern.Table[ins.opcode.no]
+    patterns, has_const = _PatternsForShape(_InsShape(ins))
     # print(f"@ {ins} {ins.operands}")
     for p in patterns:
         # print(f"@trying pattern {p}")
-        if p.MatchesTypeConstraints(ins) and 0 == p.MatchesImmConstraints(ins, False):
+        if not has_const or 0 == p.MatchesImmConstraints(ins, False):
             return p
     else:
         # assert False, f"Could not find a matching patterns for {ins}. tried:\n{patterns}"
@@ -15,6 +15,7 @@ from BE.Base import optimize
 from BE.Base import serialize
 from BE.CodeGenA32 import isel_tab
 from BE.CodeGenA32 import regs
+from Util import timing
 
 _DUMMY_A32 = ir.Reg("dummy", o.DK.A32)
 _ZERO_OFFSET = ir.Const(o.DK.U32, 0)
@@ -438,27 +439,31 @@ def LegalizeAll(unit: ir.Unit, opt_stats, verbose=False):
     if seeds:
         cfg.UnitRemoveUnreachableCode(unit, seeds)
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False,
-                        check_push_pop=True, check_fallthroughs=False)
+        with timing.Span(fun.name, "optimize", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False,
+                            check_push_pop=True, check_fallthroughs=False)
 
-        if fun.kind is o.FUN_KIND.NORMAL:
-            PhaseOptimize(fun, unit, opt_stats)
+            if fun.kind is o.FUN_KIND.NORMAL:
+                PhaseOptimize(fun, unit, opt_stats)
 
     for fun in unit.funs:
-        PhaseLegalization(fun, unit, opt_stats)
+        with timing.Span(fun.name, "legalize", lambda: ir.FunSizeCounters(fun)):
+            PhaseLegalization(fun, unit, opt_stats)
 
 
 def RegAllocGlobal(unit: ir.Unit, opt_stats, fout, verbose=False):
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False,
-                        check_push_pop=False, check_fallthroughs=False)
-        PhaseGlobalRegAlloc(fun, opt_stats, fout)
+        with timing.Span(fun.name, "reg_alloc_global", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False,
+                            check_push_pop=False, check_fallthroughs=False)
+            PhaseGlobalRegAlloc(fun, opt_stats, fout)
         if verbose:
             DumpFun("after global_reg_alloc", fun)
 
 
 def RegAllocLocal(unit: ir.Unit, opt_stats, verbose=False):
     for fun in unit.funs:
-        PhaseFinalizeStackAndLocalRegAlloc(fun, opt_stats)
+        with timing.Span(fun.name, "reg_alloc_local", lambda: ir.FunSizeCounters(fun)):
+            PhaseFinalizeStackAndLocalRegAlloc(fun, opt_stats)
         if verbose:
             DumpFun("after stack finalization", fun)
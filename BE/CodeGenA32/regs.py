@@ -304,7 +304,10 @@ def _RunLinearScan(bbl: ir.Bbl, fun: ir.Fun, live_ranges: List[liveness.LiveRang
         n[0] += 1
         print(m)
 
-    reg_alloc.RegisterAssignerLinearScanFancy(live_ranges, pool, None)
+    if len(live_ranges) <= reg_alloc.MAX_LIVE_RANGES_FOR_BACKWARD_SCAN:
+        reg_alloc.RegisterAssignerLinearScanFancy(live_ranges, pool, None)
+    else:
+        reg_alloc.RegisterAssignerLinearScanHeap(live_ranges, pool, None)
 
 
 def _AssignAllocatedRegsAndReturnSpilledRegs(live_ranges) -> List[ir.Reg]:
@@ -355,14 +358,14 @@ def _ComputeRegReserve(spilled_regs: List[ir.Reg], gpr_regs_not_lac, flt_regs_no
     return new_gpr_regs_not_lac, new_flt_regs_not_lac
 
 
-def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun) -> int:
+def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun,
+                        live_ranges: List[liveness.LiveRange]) -> int:
     """Allocates regs to the intra bbl live ranges
 
     Note, this runs after global register allocation has occurred
     """
     # print ("\n".join(serialize.BblRenderToAsm(bbl)))
 
-    live_ranges = liveness.BblGetLiveRanges(bbl, fun, bbl.live_out)
     live_ranges.sort()
     for lr in live_ranges:
         assert liveness.LiveRangeFlag.IGNORE not in lr.flags
@@ -420,7 +423,10 @@ def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun) -> int:
 
 
 def FunLocalRegAlloc(fun):
-    return ir.FunGenericRewriteBbl(fun, _BblRegAllocOrSpill)
+    count = 0
+    for bbl, live_ranges in liveness.FunBblLiveRanges(fun):
+        count += _BblRegAllocOrSpill(bbl, fun, live_ranges)
+    return count
 
 
 def AssignCpuRegOrMarkForSpilling(assign_to: List[ir.Reg],
@@ -5,11 +5,12 @@
 See `ARM32.md` for more details.
 """
 
-import collections
 import enum
-from typing import List, Dict, Any, Set, Optional
+import os
+from typing import List, Dict, Any, Set, Optional, Tuple
 
 from BE.Base import ir
+from BE.CodeGenCommon import pattern_table
 from IR import opcode_tab as o
 from BE.CodeGenA64 import regs
 from BE.CpuA64 import opcode_tab as a64
@@ -343,7 +344,8 @@ class Pattern:
     See ../Docs/instruction_selection.md
     """
     # groups all the patterns for a given opcode number together
-    Table: Dict[int, List["Pattern"]] = collections.defaultdict(list)
+    # set up at the bottom of the file once all the Init functions are defined
+    Table: pattern_table.LazyPatternTable
 
     def __init__(self, opcode: o.Opcode, type_constraints: List[o.DK],
                  emit: List[InsTmpl],
@@ -377,7 +379,22 @@ class Pattern:
                 assert imm_constr is IMM_CURB.INVALID, f"bad pattern for {opcode}"
 
         # we put all the patterns for given IR opcode into the same bucket
-        Pattern.Table[opcode.no].append(self)
+        Pattern.Table.Add(opcode.no, self)
+
+    def MatchesShape(self, shape: Tuple[Any, ...]) -> bool:
+        """Like MatchesTypeCurbs combined with a perfect MatchesImmCurbs but only looks at the shape
+
+        The shape is computed by _InsShape. The values of constant operands are not checked.
+        """
+        for type_constr, imm_curb, op_shape in zip(self.type_constraints, self.imm_curbs, shape[1:]):
+            if op_shape is None:
+                continue
+            kind, is_reg = op_shape
+            if type_constr is not o.DK.INVALID and kind != type_constr:
+                return False
+            if is_reg != (imm_curb is IMM_CURB.INVALID):
+                return False
+        return True
 
     def MatchesTypeCurbs(self, ins: ir.Ins) -> bool:
         for type_constr, op in zip(self.type_constraints, ins.operands):
@@ -1294,19 +1311,58 @@ def InitVFP():
                 [InsTmpl(a64_opc, [PARAM.reg0, PARAM.reg1])])
 
 
-InitLoad()
-InitStackLoad()
-InitStore()
-InitCAS()
-InitStackStore()
-InitAlu()
-InitLea()
-InitMove()
-InitCondBra()
-InitCmp()
-InitMiscBra()
-InitConv()
-InitVFP()
+# The Init functions are only run when the table is first consulted
+Pattern.Table = pattern_table.LazyPatternTable(
+    [InitLoad,
+     InitStackLoad,
+     InitStore,
+     InitCAS,
+     InitStackStore,
+     InitAlu,
+     InitLea,
+     InitMove,
+     InitCondBra,
+     InitCmp,
+     InitMiscBra,
+     InitConv,
+     InitVFP],
+    {"ir": o.Opcode.TableByNo, "isa": a64.Opcode.name_to_opcode},
+    [__file__,
+     a64.__file__,
+     o.__file__,
+     pattern_table.__file__],
+    # the pickled patterns reference the classes of the imported module
+    None if __name__ == "__main__" else
+    os.path.join(os.path.dirname(__file__), "__pycache__", "a64_isel_tab.pickle"))
+
+
+def _OperandShape(op: Any) -> Optional[Tuple[o.DK, bool]]:
+    if isinstance(op, ir.Reg):
+        return op.kind, True
+    elif isinstance(op, ir.Const):
+        return op.kind, False
+    return None
+
+
+def _InsShape(ins: ir.Ins) -> Tuple[Any, ...]:
+    """The properties of `ins` which (mostly) determine which patterns can match"""
+    return (ins.opcode.no, *[_OperandShape(op) for op in ins.operands])
+
+
+# Maps an instruction shape to the patterns which can match an instruction of that shape
+# and whether the values of constant operands still need to be checked.
+# Populated on demand by FindMatchingPattern.
+_PATTERNS_BY_SHAPE: Dict[Tuple[Any, ...], Tuple[List[Pattern], bool]] = {}
+
+
+def _PatternsForShape(shape: Tuple[Any, ...]) -> Tuple[List[Pattern], bool]:
+    out = _PATTERNS_BY_SHAPE.get(shape)
+    if out is None:
+        patterns = [p for p in Pattern.Table[shape[0]] if p.MatchesShape(shape)]
+        has_const = any(op_shape is not None and not op_shape[1] for op_shape in shape[1:])
+        out = patterns, has_const
+        _PATTERNS_BY_SHAPE[shape] = out
+    return out
 
 
 def FindMatchingPattern(ins: ir.Ins, diagnostic: bool = False) -> Optional[Pattern]:
@@ -1314,9 +1370,14 @@ def FindMatchingPattern(ins: ir.Ins, diagnostic: bool = False) -> Optional[Patte
 
     This can only be called AFTER the stack has been finalized
     """
-    patterns = Pattern.Table[ins.opcode.no]
+    if not diagnostic:
+        patterns, has_const = _PatternsForShape(_InsShape(ins))
+        for p in patterns:
+            if not has_const or 0 == p.MatchesImmCurbs(ins, False):
+                return p
+        return None
 
-    for p in patterns:
+    for p in Pattern.Table[ins.opcode.no]:
         if diagnostic:
             print(f"@@ trying pattern {p}", end=" ")
         if not p.MatchesTypeCurbs(ins):
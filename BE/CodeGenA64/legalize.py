@@ -15,6 +15,7 @@ from BE.Base import optimize
 from BE.Base import serialize
 from BE.CodeGenA64 import isel_tab
 from BE.CodeGenA64 import regs
+from Util import timing
 
 _DUMMY_A32 = ir.Reg("dummy", o.DK.A32)
 _ZERO_OFFSET = ir.Const(o.DK.U32, 0)
@@ -413,30 +414,35 @@ def LegalizeAll(unit, opt_stats, fout, verbose=False):
     if seeds:
         cfg.UnitRemoveUnreachableCode(unit, seeds)
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False,
-                        check_push_pop=True, check_fallthroughs=False)
+        with timing.Span(fun.name, "optimize", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False,
+                            check_push_pop=True, check_fallthroughs=False)
 
-        if fun.kind is o.FUN_KIND.NORMAL:
-            PhaseOptimize(fun, unit, opt_stats, fout)
+            if fun.kind is o.FUN_KIND.NORMAL:
+                PhaseOptimize(fun, unit, opt_stats, fout)
 
     for fun in unit.funs:
-        PhaseLegalizationStep1(fun, unit, opt_stats, fout)
+        with timing.Span(fun.name, "legalize_step1", lambda: ir.FunSizeCounters(fun)):
+            PhaseLegalizationStep1(fun, unit, opt_stats, fout)
 
     for fun in unit.funs:
-        PhaseLegalizationStep2(fun, unit, opt_stats, fout)
+        with timing.Span(fun.name, "legalize_step2", lambda: ir.FunSizeCounters(fun)):
+            PhaseLegalizationStep2(fun, unit, opt_stats, fout)
 
 
 def RegAllocGlobal(unit, opt_stats, fout, verbose=False):
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False,
-                        check_push_pop=False, check_fallthroughs=False)
-        PhaseGlobalRegAlloc(fun, opt_stats, fout)
+        with timing.Span(fun.name, "reg_alloc_global", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False,
+                            check_push_pop=False, check_fallthroughs=False)
+            PhaseGlobalRegAlloc(fun, opt_stats, fout)
         if verbose:
             DumpFun("after global_reg_alloc", fun)
 
 
 def RegAllocLocal(unit, opt_stats, fout, verbose=False):
     for fun in unit.funs:
-        PhaseFinalizeStackAndLocalRegAlloc(fun, opt_stats, fout)
+        with timing.Span(fun.name, "reg_alloc_local", lambda: ir.FunSizeCounters(fun)):
+            PhaseFinalizeStackAndLocalRegAlloc(fun, opt_stats, fout)
         if verbose:
             DumpFun("after stack finalization", fun)
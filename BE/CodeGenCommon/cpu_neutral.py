@@ -1,8 +1,14 @@
 
+import collections
+
+from typing import Callable, Dict, List
+
 from IR import opcode_tab as o
 from BE.Base import serialize
 from BE.Base import ir
 from BE.Elf import elf_unit
+from Util import parallel
+from Util import timing
 
 
 def SectionNameForMem(mem: ir.Mem) -> str:
@@ -65,3 +71,41 @@ def JtbCodeGenSimpleBinary(unit: elf_unit.Unit, jtb: ir.Jtb, addr_size: int, add
         bbl = jtb.bbl_tab.get(i, jtb.def_bbl)
         unit.AddBblAddr(addr_reloc_kind, addr_size, bbl.name)
     unit.MemEnd()
+
+
+def UnitPhaseSpan(name: str, unit: ir.Unit):
+    """A timing.Span recording the size of the whole Unit before and after"""
+    return timing.Span(name, "phase", lambda: ir.UnitSizeCounters(unit))
+
+
+def _RunFunHandler(state, fun_index: int):
+    unit, fun_handler = state
+    opt_stats: Dict[str, int] = collections.defaultdict(int)
+    out = fun_handler(unit.funs[fun_index], unit, opt_stats)
+    return out, opt_stats
+
+
+def UnitMapFunsParallelWithStats(unit: ir.Unit, fun_handler: Callable, jobs: int,
+                                 indices: List[int]):
+    """Runs fun_handler(fun, unit, opt_stats) for the funs at the given `indices`
+    using `jobs` forked worker processes and yields (result, opt_stats) pairs
+    in the order of `indices`.
+
+    The workers inherit the (already legalized) unit when they are forked.
+    """
+    return parallel.ForkedMap(_RunFunHandler, (unit, fun_handler), indices, jobs)
+
+
+def UnitMapFunsParallel(unit: ir.Unit, fun_handler: Callable, opt_stats: Dict[str, int],
+                        jobs: int):
+    """Runs fun_handler(fun, unit, opt_stats) for every fun in the unit using `jobs`
+    forked worker processes and yields the (picklable) results in unit.funs order.
+
+    fun_handler must only modify the fun it was passed, changes to the
+    IR are not visible in the parent process.
+    """
+    for out, stats in UnitMapFunsParallelWithStats(unit, fun_handler, jobs,
+                                                   list(range(len(unit.funs)))):
+        for key, val in stats.items():
+            opt_stats[key] += val
+        yield out
@@ -0,0 +1,131 @@
+"""On-disk cache for the machine code the backends generate per function
+
+After LegalizeAll every function is compiled independently of the others
+(register allocation + instruction selection), so the resulting
+elf_unit.Unit fragment only depends on:
+
+* the legalized IR of the function including the register flags
+  and pre-allocated cpu registers
+* the register usage (cpu_live_in/out/clobber) of the functions it references
+* the backend sources
+
+The cache key is a sha256 over all of these. The value is the pickled
+fragment together with the opt_stats the function contributed.
+Fragments are spliced back with elf_unit.Unit.AddUnitFragment.
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from BE.Base import ir
+from BE.Base import serialize
+from BE.CodeGenCommon import cpu_neutral
+from BE.Elf import elf_unit
+from Util import cache_io
+
+
+def SourceVersion(modules: List[Any]) -> str:
+    """Hash of all the python sources living next to the given modules"""
+    h = hashlib.sha256()
+    dirs = sorted(set(os.path.dirname(os.path.abspath(m.__file__)) for m in modules))
+    for d in dirs:
+        for name in sorted(os.listdir(d)):
+            if not name.endswith(".py"):
+                continue
+            h.update(name.encode("utf8"))
+            with open(os.path.join(d, name), "rb") as fin:
+                h.update(fin.read())
+    return h.hexdigest()
+
+
+def _RenderCpuRegs(cpu_regs: List[ir.CpuReg]) -> str:
+    return " ".join(r.name for r in cpu_regs)
+
+
+def FunCacheKey(fun: ir.Fun, version: str) -> str:
+    h = hashlib.sha256()
+    h.update(version.encode("utf8"))
+    h.update(f"\nflags {fun.flags.value}\n".encode("utf8"))
+    h.update("\n".join(serialize.FunRenderToAsm(fun)).encode("utf8"))
+    for reg in fun.regs:
+        h.update(f"\n{reg.name} {reg.flags.value}".encode("utf8"))
+    seen = set()
+    for bbl in fun.bbls:
+        for ins in bbl.inss:
+            for op in ins.operands:
+                if isinstance(op, ir.Fun) and op.name not in seen:
+                    seen.add(op.name)
+                    h.update((f"\n{op.name} {op.kind.name} [{_RenderCpuRegs(op.cpu_live_in)}]"
+                              f" [{_RenderCpuRegs(op.cpu_live_out)}]"
+                              f" [{_RenderCpuRegs(op.cpu_live_clobber)}]").encode("utf8"))
+    return h.hexdigest()
+
+
+class FunCache:
+    """Maps cache keys to (fragment, opt_stats) pairs stored in `cache_dir`
+
+    Unreadable entries are treated as misses, entries are written atomically
+    so concurrent builds can share a directory.
+    """
+
+    def __init__(self, cache_dir: str, version: str):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _Path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key[2:] + ".pickle")
+
+    def Get(self, key: str) -> Optional[Tuple[elf_unit.Unit, Dict[str, int]]]:
+        try:
+            with open(self._Path(key), "rb") as fin:
+                out = pickle.load(fin)
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return out
+
+    def Put(self, key: str, frag: elf_unit.Unit, stats: Dict[str, int]):
+        cache_io.WriteCacheFile(self._Path(key), pickle.dumps((frag, dict(stats)),
+                                                              pickle.HIGHEST_PROTOCOL))
+
+
+def UnitMapFunsCached(unit: ir.Unit, fun_handler: Callable, opt_stats: Dict[str, int],
+                      jobs: int, cache: FunCache) -> Iterator[elf_unit.Unit]:
+    """Like UnitMapFunsParallel but only runs fun_handler for functions whose
+    fragment is not in the cache yet.
+
+    Results are yielded in unit.funs order. The keys are computed before
+    any fun_handler runs as the latter modifies the functions.
+    """
+    keys = [FunCacheKey(fun, cache.version) for fun in unit.funs]
+    results: List[Optional[Tuple[elf_unit.Unit, Dict[str, int]]]] = [
+        cache.Get(key) for key in keys]
+    missing = [n for n, r in enumerate(results) if r is None]
+    if jobs > 1:
+        computed = cpu_neutral.UnitMapFunsParallelWithStats(unit, fun_handler, jobs, missing)
+    else:
+        computed = _MapFunsSerial(unit, fun_handler, missing)
+    for n, (frag, stats) in zip(missing, computed):
+        cache.Put(keys[n], frag, stats)
+        results[n] = (frag, stats)
+    for r in results:
+        assert r is not None
+        frag, stats = r
+        for key, val in stats.items():
+            opt_stats[key] += val
+        yield frag
+
+
+def _MapFunsSerial(unit: ir.Unit, fun_handler: Callable, indices: List[int]):
+    for n in indices:
+        stats: Dict[str, int] = collections.defaultdict(int)
+        out = fun_handler(unit.funs[n], unit, stats)
+        yield out, stats
@@ -0,0 +1,140 @@
+"""Lazily built instruction selection pattern tables
+
+Each BE/CodeGen*/isel_tab.py describes its patterns with a bunch of Init*
+functions which together create thousands of Pattern and InsTmpl objects.
+Runs which never select instructions should not pay for this, so
+the Init* functions are only run when the table is first consulted.
+
+The fully built table is also pickled, one blob per IR opcode, so
+that later runs only unpickle the patterns of the IR opcodes they
+actually encounter. The pickle is keyed by a hash of the sources the
+patterns are derived from. Opcode objects (IR and ISA) are not pickled
+but referenced by name so identity comparisons keep working.
+"""
+
+import collections
+import hashlib
+import io
+import os
+import pickle
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from Util import cache_io
+
+
+def SourceKey(files: List[str]) -> str:
+    h = hashlib.sha256()
+    for fn in files:
+        h.update(os.path.basename(fn).encode("utf8"))
+        with open(fn, "rb") as fin:
+            h.update(fin.read())
+    return h.hexdigest()
+
+
+class _Pickler(pickle.Pickler):
+
+    def __init__(self, file, shared_ids: Dict[int, Tuple[str, Any]]):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._shared_ids = shared_ids
+
+    def persistent_id(self, obj):
+        return self._shared_ids.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, shared: Dict[str, Dict[Any, Any]]):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid):
+        namespace, key = pid
+        return self._shared[namespace][key]
+
+
+class LazyPatternTable:
+    """Maps IR opcode numbers to the list of Patterns for that opcode
+
+    Acts as a read only dict whose missing entries are empty lists.
+    `init_funs` populate the table via Add().
+    `shared` names the objects which must not be copied by the cache
+    (namespace -> key -> object), e.g. {"ir": o.Opcode.TableByNo}.
+    A `cache_path` of None disables the cache.
+    """
+
+    def __init__(self, init_funs: List[Callable], shared: Dict[str, Dict[Any, Any]],
+                 source_files: List[str], cache_path: Optional[str]):
+        self._init_funs = init_funs
+        self._shared = shared
+        self._source_files = source_files
+        self._cache_path = cache_path
+        # opcode no -> patterns, fully populated once _built is True
+        self._table: Dict[int, List[Any]] = collections.defaultdict(list)
+        self._built = False
+        # opcode no -> pickled patterns not yet in _table
+        self._blobs: Optional[Dict[int, bytes]] = None
+
+    def Add(self, opcode_no: int, pattern: Any):
+        self._table[opcode_no].append(pattern)
+
+    def _Build(self):
+        self._built = True
+        cache_path = self._cache_path
+        key = ""
+        if cache_path is not None:
+            key = SourceKey(self._source_files)
+            self._blobs = self._LoadCache(cache_path, key)
+            if self._blobs is not None:
+                return
+        for init in self._init_funs:
+            init()
+        if cache_path is not None:
+            self._WriteCache(cache_path, key)
+
+    def _LoadCache(self, cache_path: str, key: str) -> Optional[Dict[int, bytes]]:
+        try:
+            with open(cache_path, "rb") as fin:
+                cache_key, blobs = pickle.load(fin)
+        except Exception:
+            return None
+        return blobs if cache_key == key else None
+
+    def _WriteCache(self, cache_path: str, key: str):
+        """Best effort - a missing cache only costs start-up time"""
+        shared_ids = {id(obj): (namespace, k)
+                      for namespace, objs in self._shared.items()
+                      for k, obj in objs.items()}
+        blobs = {}
+        try:
+            for no, patterns in self._table.items():
+                buf = io.BytesIO()
+                _Pickler(buf, shared_ids).dump(patterns)
+                blobs[no] = buf.getvalue()
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return
+        cache_io.WriteCacheFile(cache_path,
+                                pickle.dumps((key, blobs), pickle.HIGHEST_PROTOCOL))
+
+    def Preload(self):
+        """Materializes the whole table, e.g. before forking worker processes"""
+        if not self._built:
+            self._Build()
+        if self._blobs is not None:
+            for no in list(self._blobs):
+                self.get(no)
+
+    def get(self, opcode_no: int, default=None) -> Optional[List[Any]]:
+        if not self._built:
+            self._Build()
+        patterns = self._table.get(opcode_no)
+        if patterns is None and self._blobs is not None:
+            blob = self._blobs.pop(opcode_no, None)
+            if blob is not None:
+                patterns = _Unpickler(io.BytesIO(blob), self._shared).load()
+                self._table[opcode_no] = patterns
+        return default if patterns is None else patterns
+
+    def __getitem__(self, opcode_no: int) -> List[Any]:
+        patterns = self.get(opcode_no)
+        return [] if patterns is None else patterns
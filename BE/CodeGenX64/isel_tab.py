@@ -3,11 +3,12 @@
 """Code Generation (Instruction Selection) for x86-64
 """
 
-import collections
 import enum
-from typing import List, Dict, Any, Optional
+import os
+from typing import List, Dict, Any, Optional, Tuple
 
 from BE.Base import ir
+from BE.CodeGenCommon import pattern_table
 from IR import opcode_tab as o
 from BE.CodeGenX64 import regs
 from BE.CpuX64 import opcode_tab as x64
@@ -281,6 +282,45 @@ def _ExtractTmplArgOp(ins: ir.Ins, arg: P, ctx: regs.EmitContext) -> int:
         assert False, f"could not extract op for {ins} {ins.operands}  unsupported: {arg}"
 
 
+_GPR_TMPL_ARGS = frozenset({P.reg0, P.reg1, P.reg2, P.reg01, P.tmp_gpr, P.scratch_gpr} | F_REGS)
+_FLT_TMPL_ARGS = frozenset({P.reg0, P.reg1, P.reg2, P.reg01, P.tmp_flt} | F_XREGS)
+_OFF_TMPL_ARGS = frozenset({P.spill0, P.spill1, P.spill2, P.spill01, P.num1, P.num2, P.num4,
+                            P.fun1_prel, P.mem0_num1_prel, P.mem1_num2_prel, P.jtb1_prel,
+                            P.stk1_offset2, P.stk0_offset1, P.stk1, P.frame_size})
+_IMM_TMPL_ARGS = frozenset({P.num0, P.num1, P.num2})
+_BYTE_WITH_REG_TMPL_ARGS = frozenset({P.reg0, P.tmp_gpr} | F_REGS)
+
+# x64 operand field -> (allowed template args, whether ints are allowed as well)
+# checked by InsTmpl.__init__
+_TMPL_ARG_CHECKS: Dict[x64.OK, Tuple[frozenset, bool]] = {
+    x64.OK.SIB_SCALE: (frozenset(F_SCALE), False),
+    **{ok: (_GPR_TMPL_ARGS, False) for ok in (
+        x64.OK.MODRM_REG8, x64.OK.MODRM_REG16, x64.OK.MODRM_REG32, x64.OK.MODRM_REG64,
+        x64.OK.MODRM_RM_REG8, x64.OK.MODRM_RM_REG16, x64.OK.MODRM_RM_REG32,
+        x64.OK.MODRM_RM_REG64)},
+    **{ok: (_FLT_TMPL_ARGS, False) for ok in (
+        x64.OK.MODRM_XREG32, x64.OK.MODRM_XREG64,
+        x64.OK.MODRM_RM_XREG32, x64.OK.MODRM_RM_XREG64)},
+    x64.OK.SIB_INDEX: (frozenset({F.NO_INDEX, P.reg1, P.reg2, P.tmp_gpr, P.scratch_gpr}), False),
+    x64.OK.SIB_BASE: (frozenset({P.reg01, P.reg0, P.reg1, P.reg3, P.tmp_gpr,
+                                 P.scratch_gpr} | F_REGS), False),
+    x64.OK.RIP_BASE: (frozenset({F.RIP}), False),
+    x64.OK.OFFABS32: (_OFF_TMPL_ARGS, True),
+    x64.OK.OFFABS8: (frozenset({0}), False),
+    **{ok: (_IMM_TMPL_ARGS, True) for ok in (
+        x64.OK.IMM8, x64.OK.IMM16, x64.OK.IMM32, x64.OK.IMM32_64, x64.OK.IMM64)},
+    x64.OK.OFFPCREL32: (frozenset({P.bbl0, P.bbl2, P.fun0}), False),
+    **{ok: (_BYTE_WITH_REG_TMPL_ARGS, False) for ok in (
+        x64.OK.BYTE_WITH_REG8, x64.OK.BYTE_WITH_REG16, x64.OK.BYTE_WITH_REG32,
+        x64.OK.BYTE_WITH_REG64)},
+    **{ok: (frozenset({F.RAX}), False) for ok in (
+        x64.OK.IMPLICIT_AL, x64.OK.IMPLICIT_AX, x64.OK.IMPLICIT_EAX, x64.OK.IMPLICIT_RAX)},
+    **{ok: (frozenset({F.RDX}), False) for ok in (
+        x64.OK.IMPLICIT_DX, x64.OK.IMPLICIT_EDX, x64.OK.IMPLICIT_RDX)},
+    x64.OK.IMPLICIT_CL: (frozenset({F.RCX}), False),
+}
+
+
 class InsTmpl:
     """Represents a template for an A32 instructions
 
@@ -301,46 +341,10 @@ class InsTmpl:
         for op, field in zip(args, opcode.fields):
             assert isinstance(op, (int, P, F)), (
                 f"unknown op {op} for {opcode.name} {args}")
-            if field is x64.OK.SIB_SCALE:
-                assert op in F_SCALE, f"{op}"
-            elif field in {x64.OK.MODRM_REG8, x64.OK.MODRM_REG16, x64.OK.MODRM_REG32, x64.OK.MODRM_REG64,
-                           x64.OK.MODRM_RM_REG8, x64.OK.MODRM_RM_REG16, x64.OK.MODRM_RM_REG32,
-                           x64.OK.MODRM_RM_REG64}:
-                assert op in {P.reg0, P.reg1, P.reg2, P.reg01,
-                              P.tmp_gpr, P.scratch_gpr} or op in F_REGS, f"{op}"
-            elif field in {x64.OK.MODRM_XREG32, x64.OK.MODRM_XREG64,
-                           x64.OK.MODRM_RM_XREG32, x64.OK.MODRM_RM_XREG64}:
-                assert op in {P.reg0, P.reg1, P.reg2, P.reg01,
-                              P.tmp_flt} or op in F_XREGS, f"{op}"
-            elif field is x64.OK.SIB_INDEX:
-                assert op in {F.NO_INDEX, P.reg1, P.reg2,
-                              P.tmp_gpr, P.scratch_gpr}, f"{op}"
-            elif field is x64.OK.SIB_BASE:
-                assert op in {P.reg01, P.reg0, P.reg1, P.reg3, P.tmp_gpr,
-                              P.scratch_gpr} or op in F_REGS, f"{op}"
-            elif field is x64.OK.RIP_BASE:
-                assert op in {F.RIP}, f"{op}"
-            elif field is x64.OK.OFFABS32:
-                assert isinstance(op, int) or op in {P.spill0, P.spill1, P.spill2, P.spill01, P.num1, P.num2, P.num4,                                                      P.fun1_prel, P.mem0_num1_prel, P.mem1_num2_prel, P.jtb1_prel,
-                                                     P.stk1_offset2, P.stk0_offset1, P.stk1, P.frame_size}, f"{op}"
-            elif field is x64.OK.OFFABS8:
-                assert op in {0}, f"{op}"
-            elif field in {x64.OK.IMM8, x64.OK.IMM16, x64.OK.IMM32, x64.OK.IMM32_64, x64.OK.IMM64}:
-                assert op in {P.num0, P.num1, P.num2} or isinstance(
-                    op, int), f"{op}"
-            elif field is x64.OK.OFFPCREL32:
-                assert op in {P.bbl0, P.bbl2, P.fun0}, f"{op}"
-            elif field in {x64.OK.BYTE_WITH_REG8, x64.OK.BYTE_WITH_REG16, x64.OK.BYTE_WITH_REG32,
-                           x64.OK.BYTE_WITH_REG64}:
-                assert op in {P.reg0, P.tmp_gpr} or op in F_REGS, f"{op}"
-            elif field in {x64.OK.IMPLICIT_AL, x64.OK.IMPLICIT_AX, x64.OK.IMPLICIT_EAX, x64.OK.IMPLICIT_RAX}:
-                assert op is F.RAX
-            elif field in {x64.OK.IMPLICIT_DX, x64.OK.IMPLICIT_EDX, x64.OK.IMPLICIT_RDX}:
-                assert op is F.RDX
-            elif field in {x64.OK.IMPLICIT_CL}:
-                assert op is F.RCX
-            else:
-                assert False, f"{opcode_name}  {opcode.fields} {args}  -  {op}, field={field}"
+            check = _TMPL_ARG_CHECKS.get(field)
+            assert check is not None, f"{opcode_name}  {opcode.fields} {args}  -  {op}, field={field}"
+            allowed, allow_int = check
+            assert op in allowed or allow_int and isinstance(op, int), f"{op}"
 
         self.opcode = opcode
         self.args: List[Any] = args
@@ -377,6 +381,8 @@ _ALLOWED_CURBS_REG = {C.REG, C.SP_REG, C.REG_RAX, C.REG_RCX, C.REG_RDX}
 _ALLOWED_CURBS_CONST = {C.UIMM8, C.SIMM8, C.UIMM16,
                         C.SIMM16, C.UIMM32, C.SIMM32, C.UIMM64, C.SIMM64}
 _ALLOWED_CURBS_REG_OR_CONST = _ALLOWED_CURBS_REG | _ALLOWED_CURBS_CONST
+# curbs which cannot be decided from the shape of an operand alone (see _InsShape)
+_CURBS_NEEDING_VALUE_CHECK = _ALLOWED_CURBS_CONST | {C.REG_RAX, C.REG_RCX, C.REG_RDX}
 
 
 class Pattern:
@@ -384,7 +390,8 @@ class Pattern:
     See ../Docs/instruction_selection.md
     """
     # groups all the patterns for a given opcode number together
-    Table: Dict[int, List["Pattern"]] = collections.defaultdict(list)
+    # set up at the bottom of the file once all the Init functions are defined
+    Table: pattern_table.LazyPatternTable
 
     def __init__(self, opcode: o.Opcode, type_constraints: List[o.DK],
                  op_curbs: List[C], emit: List[InsTmpl]):
@@ -412,8 +419,37 @@ class Pattern:
                 assert type_constr is o.DK.INVALID
                 assert curb is C.INVALID, f"bad pattern for {opcode}"
 
+        # if False, MatchesShape() alone determines whether the pattern matches
+        self.needs_value_check = any(c in _CURBS_NEEDING_VALUE_CHECK for c in op_curbs)
         # we put all the patterns for given IR opcode into the same bucket
-        Pattern.Table[opcode.no].append(self)
+        Pattern.Table.Add(opcode.no, self)
+
+    def MatchesShape(self, shape: Tuple[Any, ...]) -> bool:
+        """Like MatchesTypeCurbs and MatchesOpCurbs combined but only looks at the shape
+
+        The shape is computed by _InsShape. Curbs from _CURBS_NEEDING_VALUE_CHECK
+        are only checked partially.
+        """
+        for type_constr, op_curb, op_shape in zip(self.type_constraints, self.op_curbs, shape[1:]):
+            if op_curb is C.INVALID:
+                continue
+            if op_shape is None:
+                return False
+            kind, is_reg, is_spilled = op_shape
+            if type_constr is not o.DK.INVALID and kind != type_constr:
+                return False
+            if op_curb is C.REG:
+                if not is_reg or is_spilled:
+                    return False
+            elif op_curb is C.SP_REG:
+                if not is_reg or not is_spilled:
+                    return False
+            elif op_curb in _ALLOWED_CURBS_CONST:
+                if is_reg:
+                    return False
+            elif not is_reg:
+                return False
+        return True
 
     def MatchesTypeCurbs(self, ins: ir.Ins) -> bool:
         for type_constr, op in zip(self.type_constraints, ins.operands):
@@ -1469,35 +1505,68 @@ def InitBITCAST():
                  InsTmpl(f"mov_{bw_int}_mbis32_r", Spilled(P.spill0) + [P.tmp_gpr])])
 
 
+def _OperandShape(op: Any) -> Optional[Tuple[o.DK, bool, bool]]:
+    if isinstance(op, ir.Reg):
+        return op.kind, True, isinstance(op.cpu_reg, ir.StackSlot)
+    elif isinstance(op, ir.Const):
+        return op.kind, False, False
+    return None
+
+
+def _InsShape(ins: ir.Ins) -> Tuple[Any, ...]:
+    """The properties of `ins` which (mostly) determine which patterns can match"""
+    return (ins.opcode.no, *[_OperandShape(op) for op in ins.operands])
+
+
+# Maps an instruction shape to the patterns which can match an instruction of that shape.
+# Populated on demand by FindMatchingPattern.
+_PATTERNS_BY_SHAPE: Dict[Tuple[Any, ...], List[Pattern]] = {}
+
+
 def FindMatchingPattern(ins: ir.Ins) -> Optional[Pattern]:
     """Returns the best pattern matching `ins` or None
 
     This can only be called AFTER the stack has been finalized
     """
-    patterns = Pattern.Table[ins.opcode.no]
+    shape = _InsShape(ins)
+    patterns = _PATTERNS_BY_SHAPE.get(shape)
+    if patterns is None:
+        patterns = [p for p in Pattern.Table[ins.opcode.no] if p.MatchesShape(shape)]
+        _PATTERNS_BY_SHAPE[shape] = patterns
     # print(f"@@ {ins} {ins.operands}")
     for p in patterns:
         # print(f"@@ trying pattern {p}")
-        if p.MatchesTypeCurbs(ins) and p.MatchesOpCurbs(ins):
+        if not p.needs_value_check or p.MatchesOpCurbs(ins):
             return p
     # assert False, f"Could not find a matching patterns for {ins}. tried:\n{patterns}"
     return None
 
 
-InitAluInt()
-InitBitFiddle()
-InitAluFlt()
-InitMovInt()
-InitMovFlt()
-InitCondBraInt()
-InitCondBraFlt()
-InitLea()
-InitLoad()
-InitStore()
-InitCAS()
-InitCFG()
-InitCONV()
-InitBITCAST()
+# The Init functions are only run when the table is first consulted
+Pattern.Table = pattern_table.LazyPatternTable(
+    [InitAluInt,
+     InitBitFiddle,
+     InitAluFlt,
+     InitMovInt,
+     InitMovFlt,
+     InitCondBraInt,
+     InitCondBraFlt,
+     InitLea,
+     InitLoad,
+     InitStore,
+     InitCAS,
+     InitCFG,
+     InitCONV,
+     InitBITCAST],
+    {"ir": o.Opcode.TableByNo, "isa": x64.Opcode.name_to_opcode},
+    [__file__,
+     x64.__file__,
+     o.__file__,
+     pattern_table.__file__,
+     os.path.join(os.path.dirname(x64.__file__), "x86data.js")],
+    # the pickled patterns reference the classes of the imported module
+    None if __name__ == "__main__" else
+    os.path.join(os.path.dirname(__file__), "__pycache__", "x64_isel_tab.pickle"))
 
 
 def _DumpCodeSelTable():
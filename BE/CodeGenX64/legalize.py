@@ -13,6 +13,7 @@ from BE.Base import sanity
 from BE.Base import serialize
 from BE.CodeGenX64 import isel_tab
 from BE.CodeGenX64 import regs
+from Util import timing
 
 
 def DumpBbl(bbl: ir.Bbl):
@@ -134,7 +135,7 @@ def _InsRewriteDivRemShiftsCAS(ins: ir.Ins, fun: ir.Fun) -> Optional[List[ir.Ins
             return [mov, ir.Ins(o.AND, [rcx, rcx, ir.Const(dk, mask)], False), ins]
         else:
             assert isinstance(ops[2], ir.Const)
-            ops[2].value = ops[2].value & mask
+            ops[2] = ir.InternConst(ops[2].kind, ops[2].value & mask)
     elif opc in {o.CAS, o.CAS_MEM, o.CAS_STK}:
         rax = fun.FindOrAddCpuReg(regs.CPU_REGS_MAP["rax"], ops[0].kind)
         mov_src = ir.Ins(o.MOV, [rax, ops[1]], False)
@@ -272,17 +273,21 @@ def OptimizeAll(unit, opt_stats):
     if seeds:
         cfg.UnitRemoveUnreachableCode(unit, seeds)
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False, check_push_pop=True, check_fallthroughs=False)
+        with timing.Span(fun.name, "optimize", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False, check_push_pop=True,
+                            check_fallthroughs=False)
 
-        if fun.kind is o.FUN_KIND.NORMAL:
-            optimize.FunCfgInit(fun, unit)
-            optimize.FunOptBasic(fun, opt_stats, allow_conv_conversion=True)
+            if fun.kind is o.FUN_KIND.NORMAL:
+                optimize.FunCfgInit(fun, unit)
+                optimize.FunOptBasic(fun, opt_stats, allow_conv_conversion=True)
 
 
 def LegalizeAll(unit, opt_stats):
     for fun in unit.funs:
-        sanity.FunCheck(fun, unit, check_cfg=False, check_push_pop=True, check_fallthroughs=False)
-        PhaseLegalization(fun, unit, opt_stats)
+        with timing.Span(fun.name, "legalize", lambda: ir.FunSizeCounters(fun)):
+            sanity.FunCheck(fun, unit, check_cfg=False, check_push_pop=True,
+                            check_fallthroughs=False)
+            PhaseLegalization(fun, unit, opt_stats)
 
 
 def DumpRegStats(fun: ir.Fun, stats: Dict[reg_stats.REG_KIND_LAC, int], fout):
@@ -333,7 +333,8 @@ def _DumpBblWithLineNumbers(bbl):
         print(f"{n:2d}", l)
 
 
-def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun) -> int:
+def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun,
+                        live_ranges: List[liveness.LiveRange]) -> int:
     """Allocates regs to the intra bbl live ranges
 
     Note, this runs after global register allocation has occurred
@@ -342,7 +343,6 @@ def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun) -> int:
     if VERBOSE:
         _DumpBblWithLineNumbers(bbl)
 
-    live_ranges = liveness.BblGetLiveRanges(bbl, fun, bbl.live_out)
     live_ranges.sort()
     for lr in live_ranges:
         assert liveness.LiveRangeFlag.IGNORE not in lr.flags
@@ -380,7 +380,10 @@ def _BblRegAllocOrSpill(bbl: ir.Bbl, fun: ir.Fun) -> int:
 
 
 def FunLocalRegAlloc(fun):
-    return ir.FunGenericRewriteBbl(fun, _BblRegAllocOrSpill)
+    count = 0
+    for bbl, live_ranges in liveness.FunBblLiveRanges(fun):
+        count += _BblRegAllocOrSpill(bbl, fun, live_ranges)
+    return count
 
 
 @dataclasses.dataclass()
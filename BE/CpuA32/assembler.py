@@ -3,6 +3,7 @@
 """
 This files contains ELF like abstraction to help build an assembler.
 """
+import struct
 from typing import List, Dict, Any
 
 from BE.CpuA32 import opcode_tab as a32
@@ -39,6 +40,23 @@ def AddIns(unit: elf_unit.Unit, ins: a32.Ins):
     unit.sec_text.AddData(a32.Assemble(ins).to_bytes(4, byteorder='little'))
 
 
+def AddInss(unit: elf_unit.Unit, inss: List[a32.Ins]):
+    """Same as calling AddIns for each element of `inss`
+
+    But the instructions are encoded into a single buffer with
+    the per opcode encoders of a32.AssembleInto.
+    """
+    buf = bytearray()
+    for ins in inss:
+        if ins.has_reloc():
+            sym = unit.FindOrAddSymbol(ins.reloc_symbol, ins.is_local_sym)
+            unit.AddReloc(ins.reloc_kind, unit.sec_text,
+                          sym, ins.operands[ins.reloc_pos], len(buf))
+            ins.clear_reloc()
+        a32.AssembleInto(ins, buf)
+    unit.sec_text.AddData(buf)
+
+
 def HandleOpcode(mnemonic, token: List[str], unit: elf_unit.Unit):
     AddIns(unit, symbolic.InsFromSymbolized(mnemonic, token))
 
@@ -97,11 +115,10 @@ def _branch_offset(rel: elf.Reloc, sym_val: int) -> int:
 
 
 def _ApplyRelocation(rel: elf.Reloc):
+    """Patches the section data in place"""
     sec_data = rel.section.data
     sym_val = rel.symbol.st_value + rel.r_addend
-    assert rel.r_offset + 4 <= len(sec_data)
-    old_data = int.from_bytes(
-        sec_data[rel.r_offset:rel.r_offset + 4], "little")
+    old_data, = struct.unpack_from("<I", sec_data, rel.r_offset)
 
     if rel.r_type == enum_tab.RELOC_TYPE_ARM.MOVW_ABS_NC.value:
         new_data = a32.Patch(old_data, _OPCODE_MOVW, 2, sym_val & 0xffff)
@@ -119,7 +136,7 @@ def _ApplyRelocation(rel: elf.Reloc):
     else:
         assert False, f"unknown kind reloc {rel}"
 
-    sec_data[rel.r_offset:rel.r_offset + 4] = new_data.to_bytes(4, "little")
+    struct.pack_into("<I", sec_data, rel.r_offset, new_data)
     # print(f"PATCH INS {rel.r_type} {rel.r_offset:x} {sym_val:x} {old_data:x} {new_data:x} {rel.symbol.name}")
 
 
@@ -147,7 +164,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         sections.append(sec_rodata)
         seg_ro.sections.append(sec_rodata)
 
-    if len(unit.sec_data.data) + len(unit.sec_bss.data) > 0:
+    if unit.sec_data.sh_size + unit.sec_bss.sh_size > 0:
         seg_rw = elf.Segment.MakeRWSegment(65536)
         segments.append(seg_rw)
 
@@ -157,7 +174,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         seg_rw.sections.append(sec_data)
 
     sec_bss = unit.sec_bss
-    if len(sec_bss.data) > 0:
+    if sec_bss.sh_size > 0:
         sections.append(sec_bss)
         seg_rw.sections.append(sec_bss)
 
@@ -220,10 +237,10 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         _ApplyRelocation(rel)
 
     if create_sym_tab:
-        # we only put dummiess in the symtable above - do it for real now
-        sec_symtab.data = bytearray()
-        for sym in unit.symbols:
-            sec_symtab.AddData(sym.pack(which))
+        # the symtable was only sized above - fill in the preallocated buffer now
+        size = elf.Symbol.SIZE[which]
+        for n, sym in enumerate(unit.symbols):
+            sym.pack_into(which, sec_symtab.data, n * size)
 
     sym_entry = unit.global_symbol_map["_start"]
     assert sym_entry and not sym_entry.is_undefined()
@@ -31,7 +31,7 @@ Without any arguments the entire list of opcodes are shown
 """
 from Util import cgen
 
-from typing import List, Dict, Tuple, Optional, Set
+from typing import Any, List, Dict, Tuple, Optional, Set
 
 import collections
 import dataclasses
@@ -1227,6 +1227,44 @@ def Assemble(ins: Ins) -> int:
     return ins.opcode.AssembleOperandsRaw(ins.operands)
 
 
+def _MakeEncoder(opc: Opcode):
+    """Specializes Opcode.AssembleOperandsRaw for `opc`
+
+    The returned function computes the instruction word from the operands.
+    """
+    mask = opc.bit_mask
+    terms = [f"0x{opc.bit_value:08x}"]
+    for n, ok in enumerate(opc.fields):
+        shift = 0
+        # Note: going reverse is crucial (see InsertOperand)
+        for width, pos in reversed(FIELD_DETAILS[ok].ranges):
+            field_mask = (1 << width) - 1
+            assert mask & (field_mask << pos) == 0, f"mask overlap {opc.name}"
+            mask |= field_mask << pos
+            val = f"ops[{n}]" if shift == 0 else f"(ops[{n}] >> {shift})"
+            terms.append(f"({val} & 0x{field_mask:x}) << {pos}")
+            shift += width
+    assert mask == 0xffffffff, f"{opc.name} BAD MASK {mask:08x}"
+    scope: Dict[str, Any] = {}
+    exec(f"def encode(ops):\n    return {' | '.join(terms)}", scope)
+    return scope["encode"]
+
+
+_ENCODERS: Dict[Opcode, Any] = {}
+
+
+def AssembleInto(ins: Ins, buf: bytearray):
+    """Like Assemble but appends the (little endian) encoding to `buf`
+
+    Uses encoders specialized per opcode which are created on first use.
+    """
+    assert ins.reloc_kind == 0, "reloc has not been resolved"
+    encoder = _ENCODERS.get(ins.opcode)
+    if encoder is None:
+        encoder = _ENCODERS[ins.opcode] = _MakeEncoder(ins.opcode)
+    buf += encoder(ins.operands).to_bytes(4, "little")
+
+
 def Patch(data: int, opcode: Opcode, pos: int, value: int):
     """For relocation patching - note that the value is not run through the Encoder.
     But there will still be some range checking."""
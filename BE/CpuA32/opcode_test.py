@@ -129,6 +129,9 @@ def HandleOneInstruction(count: int, line: str,
     assert ins.opcode is not None and ins.operands is not None, f"unknown opcode {line}"
     data2 = a32.Assemble(ins)
     assert data == data2, f"disass mismatch [{ins.opcode.name}] {data:x} vs {data2:x}"
+    buf = bytearray()
+    a32.AssembleInto(ins, buf)
+    assert data == int.from_bytes(buf, "little"), f"bulk mismatch [{ins.opcode.name}]"
     actual_name = FixupAliases(ins.opcode, actual_name, actual_ops)
     if not actual_name.startswith(ins.opcode.official_name):
         print("BAD NAME", ins.opcode.name, actual_name, line, end="")
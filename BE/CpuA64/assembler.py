@@ -3,6 +3,7 @@
 """
 This files contains ELF like abstraction to help build an a64 assembler.
 """
+import struct
 from typing import List, Dict, Optional, Any
 
 from BE.CpuA64 import opcode_tab as a64
@@ -38,6 +39,23 @@ def AddIns(unit: elf_unit.Unit, ins: a64.Ins):
     unit.sec_text.AddData(a64.Assemble(ins).to_bytes(4, byteorder='little'))
 
 
+def AddInss(unit: elf_unit.Unit, inss: List[a64.Ins]):
+    """Same as calling AddIns for each element of `inss`
+
+    But the instructions are encoded into a single buffer with
+    the per opcode encoders of a64.AssembleInto.
+    """
+    buf = bytearray()
+    for ins in inss:
+        if ins.has_reloc():
+            sym = unit.FindOrAddSymbol(ins.reloc_symbol, ins.is_local_sym)
+            unit.AddReloc(ins.reloc_kind, unit.sec_text,
+                          sym, ins.operands[ins.reloc_pos], len(buf))
+            ins.clear_reloc()
+        a64.AssembleInto(ins, buf)
+    unit.sec_text.AddData(buf)
+
+
 def HandleOpcode(mnemonic, token: List[str], unit: elf_unit.Unit):
     AddIns(unit, symbolic.InsFromSymbolized(mnemonic, token))
 
@@ -111,12 +129,11 @@ def _RelWidth(rel_type: int):
 
 
 def _ApplyRelocation(rel: elf.Reloc):
+    """Patches the section data in place"""
     sec_data = rel.section.data
     sym_val = rel.symbol.st_value + rel.r_addend
-    width = _RelWidth(rel.r_type)
-    assert rel.r_offset + width <= len(sec_data)
-    old_data = int.from_bytes(
-        sec_data[rel.r_offset:rel.r_offset + width], "little")
+    fmt = "<Q" if _RelWidth(rel.r_type) == 8 else "<I"
+    old_data, = struct.unpack_from(fmt, sec_data, rel.r_offset)
 
     if rel.r_type == enum_tab.RELOC_TYPE_AARCH64.ADR_PREL_PG_HI21.value:
         new_data = a64.Patch(old_data, _OPCODE_ADRP, 1,
@@ -139,8 +156,7 @@ def _ApplyRelocation(rel: elf.Reloc):
     else:
         assert False, f"unknown kind reloc {rel}"
 
-    sec_data[rel.r_offset:rel.r_offset +
-             width] = new_data.to_bytes(width, "little")
+    struct.pack_into(fmt, sec_data, rel.r_offset, new_data)
     # print(f"PATCH INS {rel.r_type} {rel.r_offset:x} {sym_val:x} {old_data:x} {new_data:x} {rel.symbol.name}")
 
 
@@ -168,7 +184,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         sections.append(sec_rodata)
         seg_ro.sections.append(sec_rodata)
 
-    if len(unit.sec_data.data) + len(unit.sec_bss.data) > 0:
+    if unit.sec_data.sh_size + unit.sec_bss.sh_size > 0:
         seg_rw = elf.Segment.MakeRWSegment(65536)
         segments.append(seg_rw)
 
@@ -178,7 +194,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         seg_rw.sections.append(sec_data)
 
     sec_bss = unit.sec_bss
-    if len(sec_bss.data) > 0:
+    if sec_bss.sh_size > 0:
         sections.append(sec_bss)
         seg_rw.sections.append(sec_bss)
 
@@ -237,10 +253,10 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         _ApplyRelocation(rel)
 
     if create_sym_tab:
-        # we only put dummiess in the symtable above - do it for real now
-        sec_symtab.data = bytearray()
-        for sym in unit.symbols:
-            sec_symtab.AddData(sym.pack(which))
+        # the symtable was only sized above - fill in the preallocated buffer now
+        size = elf.Symbol.SIZE[which]
+        for n, sym in enumerate(unit.symbols):
+            sym.pack_into(which, sec_symtab.data, n * size)
 
     sym_entry = unit.global_symbol_map["_start"]
     assert sym_entry and not sym_entry.is_undefined()
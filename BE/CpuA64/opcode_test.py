@@ -9,7 +9,7 @@ import re
 import sys
 from typing import List, Dict
 
-from BE.CpuA64.opcode_tab import OK, Opcode, OPC_FLAG, CONDITION_CODES_INV_MAP, Assemble, Disassemble, Ins
+from BE.CpuA64.opcode_tab import OK, Opcode, OPC_FLAG, CONDITION_CODES_INV_MAP, Assemble, AssembleInto, Disassemble, Ins
 
 from BE.CpuA64 import symbolic
 
@@ -302,6 +302,9 @@ def main(argv):
                 # sanity check
                 data2 = Assemble(ins)
                 assert data == data2
+                buf = bytearray()
+                AssembleInto(ins, buf)
+                assert data == int.from_bytes(buf, "little")
                 HISTOGRAM[ins.opcode.NameForEnum()] += 1
                 actual_name = token[1]
                 actual_ops = []
@@ -3,6 +3,7 @@
 """
 This files contains ELF like abstraction to help build an a64 assembler.
 """
+import struct
 from typing import List, Dict, Any
 
 from BE.CpuX64 import opcode_tab as x64
@@ -79,6 +80,29 @@ def AddIns(unit: elf_unit.Unit, ins: x64.Ins):
     unit.sec_text.AddData(ins_data)
 
 
+def AddInss(unit: elf_unit.Unit, inss: List[x64.Ins]):
+    """Same as calling AddIns for each element of `inss`
+
+    But the instructions are encoded into a single buffer with
+    the per opcode encoders of x64.AssembleInto.
+    """
+    buf = bytearray()
+    for ins in inss:
+        if ins.has_reloc():
+            sym = unit.FindOrAddSymbol(ins.reloc_symbol, ins.is_local_sym)
+            kind = ins.reloc_kind
+            addend = ins.operands[ins.reloc_pos]
+            ins.clear_reloc()  # we need to clear the reloc info BEFORE assembling
+            x64.AssembleInto(ins, buf)
+            distance_to_ins_end = _RelocFieldOffsetFromEndOfIns(ins.opcode)
+            if kind in {enum_tab.RELOC_TYPE_X86_64.PC32}:
+                addend -= distance_to_ins_end
+            unit.AddReloc(kind, unit.sec_text, sym, addend, len(buf) - distance_to_ins_end)
+        else:
+            x64.AssembleInto(ins, buf)
+    unit.sec_text.AddData(buf)
+
+
 def HandleOpcode(mnemonic, token: List[str], unit: elf_unit.Unit):
     AddIns(unit, symbolic.InsFromSymbolized(mnemonic, token))
 
@@ -134,16 +158,17 @@ def _RelWidth(rel_type: int):
 
 
 def _ApplyRelocation(rel: elf.Reloc):
+    """Patches the section data in place"""
     sec_data = rel.section.data
     sym_val = rel.symbol.st_value + rel.r_addend
     width = _RelWidth(rel.r_type)
+    assert rel.r_offset + width <= len(sec_data)
     if rel.r_type == enum_tab.RELOC_TYPE_X86_64.PC32.value:
-        assert rel.r_offset + width <= len(sec_data)
         new_data = _pc_offset(rel, sym_val)
         assert -(1 << 31) <= new_data < (1 << 31), f"out of range reloc {rel.symbol.name} {new_data}"
-        sec_data[rel.r_offset:rel.r_offset + width] = new_data.to_bytes(width, "little", signed=True)
+        struct.pack_into("<i", sec_data, rel.r_offset, new_data)
     elif rel.r_type == enum_tab.RELOC_TYPE_X86_64.X_64.value:
-        sec_data[rel.r_offset:rel.r_offset + width] = sym_val.to_bytes(width, "little")
+        struct.pack_into("<Q", sec_data, rel.r_offset, sym_val)
     else:
         assert False, f"unknown kind reloc {rel}"
 
@@ -172,7 +197,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         sections.append(sec_rodata)
         seg_ro.sections.append(sec_rodata)
 
-    if len(unit.sec_data.data) + len(unit.sec_bss.data) > 0:
+    if unit.sec_data.sh_size + unit.sec_bss.sh_size > 0:
         seg_rw = elf.Segment.MakeRWSegment(65536)
         segments.append(seg_rw)
 
@@ -182,7 +207,7 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         seg_rw.sections.append(sec_data)
 
     sec_bss = unit.sec_bss
-    if len(sec_bss.data) > 0:
+    if sec_bss.sh_size > 0:
         sections.append(sec_bss)
         seg_rw.sections.append(sec_bss)
 
@@ -239,10 +264,10 @@ def Assemble(unit: elf_unit.Unit, create_sym_tab: bool) -> elf.Executable:
         _ApplyRelocation(rel)
 
     if create_sym_tab:
-        # we only put dummiess in the symtable above - do it for real now
-        sec_symtab.data = bytearray()
-        for sym in unit.symbols:
-            sec_symtab.AddData(sym.pack(which))
+        # the symtable was only sized above - fill in the preallocated buffer now
+        size = elf.Symbol.SIZE[which]
+        for n, sym in enumerate(unit.symbols):
+            sym.pack_into(which, sec_symtab.data, n * size)
 
     sym_entry = unit.global_symbol_map["_start"]
     assert sym_entry and not sym_entry.is_undefined()
@@ -57,10 +57,45 @@ def batch():
             ins2.operands), f"{ins.operands} vs {ins2.operands}"
 
 
+def section():
+    """Checks x64.DisassembleSection against x64.Disassemble and
+    x64.AssembleInto against x64.Assemble
+
+    The instructions from stdin are concatenated into a single buffer
+    which is then encoded again in bulk.
+    """
+    buf = bytearray()
+    expected = []
+    for line in sys.stdin:
+        line = line.split("#")[0].strip()
+        if not line: continue
+        data = HexToData(line)
+        expected.append((len(buf), x64.Disassemble(data)))
+        buf += bytes(data)
+    actual = list(x64.DisassembleSection(memoryview(buf)))
+    assert len(expected) == len(actual), f"{len(expected)} vs {len(actual)}"
+    for (off, ins), (off2, ins2) in zip(expected, actual):
+        assert ins is not None and ins2 is not None, f"{off:x} {off2:x}"
+        assert off == off2, f"{off:x} vs {off2:x}"
+        assert ins.opcode is ins2.opcode, f"{off:x} {ins.opcode} vs {ins2.opcode}"
+        assert ins.operands == ins2.operands, f"{off:x} {ins.operands} vs {ins2.operands}"
+    encoded = bytearray()
+    for off, ins in expected:
+        assert off == len(encoded), f"{off:x} vs {len(encoded):x}"
+        x64.AssembleInto(ins, encoded)
+        data = x64.Assemble(ins)
+        assert encoded[off:] == bytes(data), (
+            f"{off:x} {ins.opcode}: {x64.Hexify(encoded[off:])} vs {x64.Hexify(data)}")
+    assert encoded == buf
+    print(f"checked {len(actual)} instructions")
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         if sys.argv[1] == "batch":
             batch()
+        elif sys.argv[1] == "section":
+            section()
         else:
             for seq in sys.argv[1:]:
                 disass(HexToData(seq))
@@ -11,13 +11,16 @@ Enough for code generation.
 import collections
 import dataclasses
 import enum
+import hashlib
 import itertools
 import json
 import os
+import pickle
 import re
 import sys
-from typing import List, Dict, Tuple, Optional
+from typing import Any, Iterator, List, Dict, Tuple, Optional
 
+from Util import cache_io
 from Util import cgen
 
 # https://stackoverflow.com/questions/14698350/x86-64-asm-maximum-bytes-for-an-instruction/18972014
@@ -1028,6 +1031,290 @@ def InsLength(ins: Ins) -> int:
     return len(ins.opcode.data) + ins.opcode.UsesRex(ins.operands)
 
 
+# operand kind -> (Opcode attribute with the byte position, shift, rex bit)
+# for the operands that encode a register
+_REG_FIELD_PLACEMENT: Dict[OK, Tuple[str, int, int]] = {
+    **{ok: ("modrm_pos", 0, 0) for ok in (
+        OK.MODRM_RM_REG8, OK.MODRM_RM_REG16, OK.MODRM_RM_REG32, OK.MODRM_RM_REG64,
+        OK.MODRM_RM_XREG32, OK.MODRM_RM_XREG64, OK.MODRM_RM_XREG128, OK.MODRM_RM_BASE)},
+    **{ok: ("modrm_pos", 3, 2) for ok in (
+        OK.MODRM_REG8, OK.MODRM_REG16, OK.MODRM_REG32, OK.MODRM_REG64,
+        OK.MODRM_XREG32, OK.MODRM_XREG64, OK.MODRM_XREG128)},
+    OK.SIB_BASE: ("sib_pos", 0, 0),
+    OK.SIB_INDEX_AS_BASE: ("sib_pos", 3, 1),
+    OK.SIB_INDEX: ("sib_pos", 3, 1),
+    **{ok: ("byte_with_reg_pos", 0, 0) for ok in (
+        OK.BYTE_WITH_REG8, OK.BYTE_WITH_REG16, OK.BYTE_WITH_REG32, OK.BYTE_WITH_REG64)},
+}
+
+# without a rex prefix register 4-7 would select ah, ch, dh, bh
+_FORCE_REX_FIELDS = {OK.MODRM_RM_REG8, OK.MODRM_REG8, OK.BYTE_WITH_REG8}
+
+_PREFIXES = {0xf0, 0xf2, 0xf3, 0x66}
+
+
+def _MakeEncoder(opc: Opcode):
+    """Specializes Opcode.AssembleOperands for `opc`
+
+    The returned function appends the encoding of its operands to a bytearray.
+    """
+    lines = ["def encode(ops, buf):",
+             "    start = len(buf)",
+             f"    buf += {bytes(opc.data)!r}",
+             f"    rex = {0x08 if opc.rexw else 0}"]
+    for n, ok in enumerate(opc.fields):
+        if ok in OK_TO_IMPLICIT or ok is OK.RIP_BASE:
+            continue
+        placement = _REG_FIELD_PLACEMENT.get(ok)
+        if placement is not None:
+            attr, shift, rex_shift = placement
+            lines.append(f"    v = ops[{n}]")
+            if ok is OK.SIB_INDEX_AS_BASE:
+                lines.append("    assert v != 4")
+            if ok in _FORCE_REX_FIELDS:
+                lines.append("    if 4 <= v <= 7: rex |= 0x40")
+            lines.append(f"    buf[start + {getattr(opc, attr)}] |= (v & 7) << {shift}")
+            lines.append(f"    rex |= (v >> 3 & 1) << {rex_shift}")
+        elif ok is OK.SIB_SCALE:
+            lines.append(f"    assert 0 <= ops[{n}] <= 3")
+            lines.append(f"    buf[start + {opc.sib_pos}] |= ops[{n}] << 6")
+        else:
+            if ok in OK_IMM_TO_SIZE:
+                pos, width = opc.imm_pos, OK_IMM_TO_SIZE[ok][0]
+            else:
+                pos, width = opc.offset_pos, OK_OFF_TO_SIZE[ok][0]
+            size = width // 8
+            assert pos + size <= len(opc.data), f"{opc}"
+            lines.append(f"    buf[start + {pos}:start + {pos + size}] = "
+                         f"(ops[{n}] & {(1 << width) - 1}).to_bytes({size}, 'little')")
+    num_prefixes = 0
+    while opc.data[num_prefixes] in _PREFIXES:
+        num_prefixes += 1
+    lines.append("    if rex:")
+    lines.append(f"        buf.insert(start + {num_prefixes}, rex | 0x40)")
+    scope: Dict[str, Any] = {}
+    exec("\n".join(lines), scope)
+    return scope["encode"]
+
+
+_ENCODERS: Dict[Opcode, Any] = {}
+
+
+def AssembleInto(ins: Ins, buf: bytearray):
+    """Like Assemble but appends the encoding to `buf`
+
+    Uses encoders specialized per opcode which are created on first use.
+    """
+    assert not ins.has_reloc(), "reloc has not been resolved"
+    encoder = _ENCODERS.get(ins.opcode)
+    if encoder is None:
+        encoder = _ENCODERS[ins.opcode] = _MakeEncoder(ins.opcode)
+    encoder(ins.operands, buf)
+
+
+def _MakeDecoder(opc: Opcode):
+    """Specializes Opcode.DisassembleOperands for `opc`
+
+    The returned function takes the instruction bytes with the rex prefix
+    removed and the rex prefix itself (0 if absent). It returns None for
+    encodings DisassembleOperands would reject.
+    """
+    lines = ["def decode(d, rex):"]
+    ops = []
+    for n, ok in enumerate(opc.fields):
+        if ok in OK_TO_IMPLICIT or ok is OK.RIP_BASE:
+            ops.append("0")
+            continue
+        placement = _REG_FIELD_PLACEMENT.get(ok)
+        if placement is not None:
+            attr, shift, rex_shift = placement
+            lines.append(f"    v{n} = (d[{getattr(opc, attr)}] >> {shift} & 7) | "
+                         f"(rex >> {rex_shift} & 1) << 3")
+            if ok is OK.SIB_INDEX_AS_BASE:
+                lines.append(f"    if v{n} == 4: return None")
+            if ok in _FORCE_REX_FIELDS:
+                lines.append(f"    if 4 <= v{n} <= 7 and not rex: return None")
+            ops.append(f"v{n}")
+        elif ok is OK.SIB_SCALE:
+            ops.append(f"d[{opc.sib_pos}] >> 6")
+        else:
+            if ok in OK_IMM_TO_SIZE:
+                pos, (src_width, dst_width) = opc.imm_pos, OK_IMM_TO_SIZE[ok]
+            else:
+                pos, (src_width, dst_width) = opc.offset_pos, OK_OFF_TO_SIZE[ok]
+            x = f"int.from_bytes(d[{pos}:{pos + src_width // 8}], 'little', signed=True)"
+            if dst_width is not None and dst_width != 64:
+                x += f" & {(1 << dst_width) - 1}"
+            ops.append(x)
+    lines.append(f"    return [{', '.join(ops)}]")
+    scope: Dict[str, Any] = {}
+    exec("\n".join(lines), scope)
+    return scope["decode"]
+
+
+_DECODERS: Dict[Opcode, Any] = {}
+
+_PREFIX_TO_FP = {0xf0: 1 << 13, 0x66: 1 << 12, 0xf2: 1 << 11, 0xf3: 1 << 10}
+
+# fingerprint -> (position of the first byte after the fingerprint byte,
+#                 candidate opcodes for each value of that byte)
+_DISPATCH: Dict[int, Tuple[int, List[Tuple[Opcode, ...]]]] = {}
+
+
+def _KeyPos(opc: Opcode) -> int:
+    n = 0
+    while opc.data[n] in _PREFIXES:
+        n += 1
+    return n + 2 if opc.data[n] == 0x0f else n + 1
+
+
+def _MakeDispatch(fp: int) -> Tuple[int, List[Tuple[Opcode, ...]]]:
+    """Second level of the decoder's dispatch: splits the opcodes sharing a
+    fingerprint by the byte following the fingerprint byte (usually modrm)
+
+    Candidates keep their OpcodesByFP order so we pick the same opcode
+    as Opcode.FindOpcode.
+    """
+    rules = Opcode.OpcodesByFP.get(fp, [])
+    key_pos = bin(fp >> 10 & 0xf).count("1") + (fp >> 9 & 1) + 1
+    shift = 8 * key_pos
+    # (opcode, mask, data) for the byte at key_pos, (0, 0) matches everything
+    checks = [(r, r.discriminant_mask >> shift & 0xff, r.discriminant_data >> shift & 0xff)
+              if key_pos < 6 and _KeyPos(r) == key_pos else (r, 0, 0) for r in rules]
+    interned: Dict[Tuple[Opcode, ...], Tuple[Opcode, ...]] = {}
+    table = []
+    for b in range(256):
+        cands = tuple(r for r, m, d in checks if b & m == d)
+        table.append(interned.setdefault(cands, cands))
+    return key_pos, table
+
+
+def _MatchAt(data, pos: int) -> Optional[Tuple[Opcode, int, int]]:
+    """Finds the opcode of the instruction starting at data[pos]
+
+    Returns the opcode, the rex prefix (or 0) and its offset (or -1).
+    """
+    end = len(data)
+    fp = 0
+    rex = 0
+    rex_off = -1
+    n = pos
+    while True:
+        if n >= end:
+            return None
+        b = data[n]
+        if b & 0xf0 == 0x40:
+            if rex_off >= 0:
+                return None  # redundant rex prefixes are not supported
+            rex = b
+            rex_off = n - pos
+        elif b in _PREFIX_TO_FP:
+            fp |= _PREFIX_TO_FP[b]
+        elif b == 0x0f:
+            if n + 1 >= end:
+                return None
+            fp |= 1 << 9 | data[n + 1]
+            n += 2
+            break
+        else:
+            fp |= b
+            n += 1
+            break
+        n += 1
+    fp |= (rex >> 3 & 1) << 8
+    dispatch = _DISPATCH.get(fp)
+    if dispatch is None:
+        dispatch = _DISPATCH[fp] = _MakeDispatch(fp)
+    key_pos, table = dispatch
+    # n is the raw position of the byte after the fingerprint byte
+    if n >= end or n - pos - (rex_off >= 0) != key_pos:
+        cands = Opcode.OpcodesByFP.get(fp, [])
+    else:
+        cands = table[data[n]]
+    if not cands:
+        return None
+    # the discriminant reflects the first 6 instruction bytes except the rex byte
+    if rex_off < 0:
+        discriminant = int.from_bytes(data[pos:pos + 6], "little")
+    else:
+        discriminant = (int.from_bytes(data[pos:pos + rex_off], "little") |
+                        int.from_bytes(data[pos + rex_off + 1:pos + 7], "little") << 8 * rex_off)
+    for opc in cands:
+        if opc.discriminant_mask & discriminant == opc.discriminant_data:
+            if pos + len(opc.data) + (rex_off >= 0) > end:
+                return None
+            return opc, rex, rex_off
+    return None
+
+
+def FindOpcodeAt(data, pos: int = 0) -> Tuple[Optional[Opcode], int]:
+    """Like Opcode.FindOpcode but for the instruction starting at data[pos]
+
+    `data` can be bytes, bytearray or a memoryview covering many instructions.
+    Returns the opcode and the length of the instruction in bytes
+    (None, 0) if the bytes do not form a supported instruction.
+    """
+    match = _MatchAt(data, pos)
+    if match is None:
+        return None, 0
+    opc, _, rex_off = match
+    return opc, len(opc.data) + (rex_off >= 0)
+
+
+def InsLengthAt(data, pos: int = 0) -> int:
+    """Length of the instruction starting at data[pos] without decoding operands
+
+    Returns 0 if the bytes do not form a supported instruction.
+    """
+    return FindOpcodeAt(data, pos)[1]
+
+
+def DisassembleAt(data, pos: int = 0) -> Tuple[Optional[Ins], int]:
+    """Like Disassemble but for the instruction starting at data[pos]
+
+    Returns the Ins and its length in bytes or (None, 0)
+    """
+    match = _MatchAt(data, pos)
+    if match is None:
+        return None, 0
+    opc, rex, rex_off = match
+    size = len(opc.data)
+    if rex_off < 0:
+        d = data[pos:pos + size]
+    else:
+        d = bytes(data[pos:pos + rex_off]) + bytes(data[pos + rex_off + 1:pos + size + 1])
+        size += 1
+    decoder = _DECODERS.get(opc)
+    if decoder is None:
+        decoder = _DECODERS[opc] = _MakeDecoder(opc)
+    operands = decoder(d, rex)
+    if operands is None:
+        return None, 0
+    return Ins(opc, operands), size
+
+
+def DisassembleSection(data, start: int = 0, end: Optional[int] = None
+                       ) -> Iterator[Tuple[int, Optional[Ins]]]:
+    """Disassembles data[start:end], e.g. a memoryview of a .text section
+
+    Yields (offset, Ins) pairs. Bytes which do not start a supported
+    instruction are yielded as (offset, None) and skipped one at a time.
+    """
+    if end is None:
+        end = len(data)
+    if end != len(data):
+        data = memoryview(data)[:end]
+    pos = start
+    while pos < end:
+        ins, size = DisassembleAt(data, pos)
+        if ins is None:
+            yield pos, None
+            pos += 1
+        else:
+            yield pos, ins
+            pos += size
+
+
 _SUPPORTED_ENCODING_PARAMS = {
     "/0", "/1", "/2", "/3", "/4", "/5", "/6", "/7",  #
     "/r",  #
@@ -1375,6 +1662,66 @@ def LoadOpcodes(filename: str):
     CreateOpcodes(tables["instructions"], False)
 
 
+# bump when the layout of the snapshot changes
+_SNAPSHOT_VERSION = 1
+
+
+def _SnapshotKey(filename: str) -> str:
+    """The snapshot depends on x86data.js and on the code in this file"""
+    h = hashlib.sha256()
+    h.update(f"{_SNAPSHOT_VERSION}\n".encode("utf8"))
+    for fn in (filename, __file__):
+        with open(fn, "rb") as fin:
+            h.update(fin.read())
+    return h.hexdigest()
+
+
+def _SnapshotPath(module_name: str) -> str:
+    """The pickle references the classes by module name, hence one snapshot per name"""
+    return os.path.join(os.path.dirname(__file__), "__pycache__",
+                        f"x64_opcode_tab.{module_name}.pickle")
+
+
+def _ReadSnapshot(path: str, key: str):
+    try:
+        with open(path, "rb") as fin:
+            snapshot_key, opcodes, opcodes_by_fp, name_to_opcode = pickle.load(fin)
+    except Exception:
+        return None
+    if snapshot_key != key:
+        return None
+    return opcodes, opcodes_by_fp, name_to_opcode
+
+
+def _LoadSnapshot(path: str, key: str) -> bool:
+    snapshot = _ReadSnapshot(path, key)
+    if snapshot is None:
+        return False
+    opcodes, opcodes_by_fp, name_to_opcode = snapshot
+    Opcode.Opcodes = opcodes
+    Opcode.OpcodesByFP = opcodes_by_fp
+    Opcode.name_to_opcode = name_to_opcode
+    return True
+
+
+def _WriteSnapshot(path: str, key: str):
+    """Best effort - a missing snapshot only costs start-up time"""
+    data = (key, Opcode.Opcodes, Opcode.OpcodesByFP, Opcode.name_to_opcode)
+    cache_io.WriteCacheFile(path, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+def LoadOpcodesWithSnapshot(filename: str, path: str):
+    """Like LoadOpcodes but re-uses the finalized opcodes of an earlier run
+
+    The snapshot is keyed by a hash of `filename` and of this module's source
+    so it is regenerated whenever either changes.
+    """
+    key = _SnapshotKey(filename)
+    if not _LoadSnapshot(path, key):
+        LoadOpcodes(filename)
+        _WriteSnapshot(path, key)
+
+
 def _render_enum_simple(symbols, name, fout):
     print("\n%s {" % name, file=fout)
     for sym in symbols:
@@ -1516,7 +1863,12 @@ def _EmitCodeC(fout):
     cgen.RenderEnumToStringFun("OK", "EnumToString", "OK_ToStringMap",  fout)
 
 
-LoadOpcodes(os.path.join(os.path.dirname(__file__), "x86data.js"))
+if __name__ == "__main__":
+    # the generators below always work off the authoritative data
+    LoadOpcodes(os.path.join(os.path.dirname(__file__), "x86data.js"))
+else:
+    LoadOpcodesWithSnapshot(os.path.join(os.path.dirname(__file__), "x86data.js"),
+                            _SnapshotPath(__name__))
 
 if __name__ == "__main__":
     if len(sys.argv) <= 1:
@@ -1550,3 +1902,18 @@ if __name__ == "__main__":
         cgen.ReplaceContent(_EmitCodeC, sys.stdin, sys.stdout)
     elif sys.argv[1] == "gen_h":
         cgen.ReplaceContent(_EmitCodeH, sys.stdin, sys.stdout)
+    elif sys.argv[1] == "verify_snapshot":
+        # importing the module (rather than running it) creates the snapshot if needed,
+        # the check then compares what is on disk against the fresh parse above
+        from BE.CpuX64 import opcode_tab as imported
+        x86data = os.path.join(os.path.dirname(__file__), "x86data.js")
+        snapshot = _ReadSnapshot(_SnapshotPath(imported.__name__), _SnapshotKey(x86data))
+        assert snapshot is not None, "missing or stale snapshot"
+        opcodes, opcodes_by_fp, name_to_opcode = snapshot
+        assert [str(x) for x in Opcode.Opcodes] == [str(x) for x in opcodes]
+        assert Opcode.OpcodesByFP.keys() == opcodes_by_fp.keys()
+        for fp, opcs in Opcode.OpcodesByFP.items():
+            assert [x.EnumName() for x in opcs] == [
+                x.EnumName() for x in opcodes_by_fp[fp]], f"{fp}"
+        assert Opcode.name_to_opcode.keys() == name_to_opcode.keys()
+        print(f"snapshot OK: {len(Opcode.Opcodes)} opcodes")
@@ -104,6 +104,9 @@ def ProcessObjdumpFile(fin):
 
         data2 = x64.Assemble(ins)
         assert data == data2, f"{line}: {Hexify(data)} vs {Hexify(data2)} {ins.opcode}"
+        buf = bytearray()
+        x64.AssembleInto(ins, buf)
+        assert data == list(buf), f"{line}: {Hexify(data)} vs {Hexify(buf)} {ins.opcode}"
         if ins.opcode.fields == [x64.OK.OFFPCREL32] or ins.opcode.fields == [x64.OK.OFFPCREL8]:
             continue
 
@@ -0,0 +1,402 @@
+#!/bin/env python3
+
+"""Disassembles all executable sections of an ELF executable
+
+The ISA (x64, a64 or a32) is determined by the e_machine field of the header.
+The file is memory mapped and the sections are decoded straight from the
+mapping. Symbols from .symtab are emitted as labels and are used to annotate
+branch and pc relative targets.
+
+Sections are split at symbol boundaries into chunks. With -jobs the chunks of
+sections larger than -min_parallel_size (default 1MiB) are disassembled by
+several processes. The output is written chunk by chunk in address order.
+
+With -objdump the output mimics the layout of `objdump -d -M intel`
+(headers, address and byte columns, labels, target annotations).
+x64 operands use objdump's syntax, a64/a32 operands use Cwerg's names.
+
+Usage:
+./disassembler_tool.py [-objdump] [-jobs N [-min_parallel_size BYTES]] <exe> [<output>]
+"""
+
+import argparse
+import bisect
+import dataclasses
+import mmap
+import struct
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from BE.Elf import elfhelper
+from BE.Elf.enum_tab import E_MACHINE, SH_FLAGS, SH_TYPE, ST_INFO_BIND, ST_INFO_TYPE
+from BE.CpuA32 import opcode_tab as a32
+from BE.CpuA32 import symbolic as a32_symbolic
+from BE.CpuA64 import opcode_tab as a64
+from BE.CpuA64 import symbolic as a64_symbolic
+from BE.CpuX64 import assembler as x64_assembler
+from BE.CpuX64 import opcode_tab as x64
+from BE.CpuX64 import symbolic as x64_symbolic
+from Util import parallel
+
+# sections are split at symbol boundaries into chunks of at least this many
+# bytes which are the unit of work for the worker processes
+_CHUNK_SIZE = 64 * 1024
+# smaller sections are not worth forking for: every worker has to warm up the
+# lazily built decoder tables again which costs more than it saves
+_PARALLEL_MIN_SIZE = 1024 * 1024
+
+
+class Symbols:
+    """The named .symtab symbols sorted by address (one per address)"""
+
+    def __init__(self, exe: elfhelper.Executable):
+        best: Dict[int, elfhelper.Symbol] = {}
+        for sym in exe.symbols:
+            if (not sym.name or sym.name.startswith("$") or sym.section is None or
+                    sym.st_type in (ST_INFO_TYPE.SECTION, ST_INFO_TYPE.FILE)):
+                continue
+            other = best.get(sym.st_value)
+            # like objdump prefer global symbols
+            if other is None or (other.st_bind == ST_INFO_BIND.LOCAL and
+                                 sym.st_bind != ST_INFO_BIND.LOCAL):
+                best[sym.st_value] = sym
+        self.addrs: List[int] = sorted(best)
+        self.names: List[str] = [best[a].name for a in self.addrs]
+
+    def Describe(self, addr: int) -> str:
+        """Renders addr relative to the closest symbol, e.g. <main+0x10>"""
+        n = bisect.bisect_right(self.addrs, addr) - 1
+        if n < 0:
+            return ""
+        delta = addr - self.addrs[n]
+        return f"<{self.names[n]}+0x{delta:x}>" if delta else f"<{self.names[n]}>"
+
+
+# how objdump renders the padding emitted by the x64 assembler (longest first)
+_X64_NOPS: Dict[bytes, str] = {
+    bytes.fromhex("660f1f840000000000"): "nop    WORD PTR [rax+rax*1+0x0]",
+    bytes.fromhex("0f1f840000000000"): "nop    DWORD PTR [rax+rax*1+0x0]",
+    bytes.fromhex("0f1f0800000000"): "nop    DWORD PTR [rax]",
+    bytes.fromhex("660f1f440000"): "nop    WORD PTR [rax+rax*1+0x0]",
+    bytes.fromhex("0f1f440000"): "nop    DWORD PTR [rax+rax*1+0x0]",
+    bytes.fromhex("0f1f4000"): "nop    DWORD PTR [rax+0x0]",
+    bytes.fromhex("0f1f00"): "nop    DWORD PTR [rax]",
+    bytes.fromhex("6690"): "xchg   ax,ax",
+    bytes.fromhex("90"): "nop",
+}
+assert set(_X64_NOPS) == set(x64_assembler.NOP_SEQUENCES[1:])
+
+
+def _DecodeX64(data, lo: int, hi: int) -> Iterator[Tuple[int, int, Any]]:
+    """Like x64.DisassembleSection but also yields the instruction sizes
+
+    Padding nops are yielded as their objdump rendering.
+    """
+    data = data[:hi]  # instructions must not straddle chunks
+    pos = lo
+    while pos < hi:
+        for seq, text in _X64_NOPS.items():
+            if data[pos:pos + len(seq)] == seq:
+                break
+        else:
+            seq = None
+        if seq is not None:
+            yield pos, len(seq), text
+            pos += len(seq)
+            continue
+        ins, size = x64.DisassembleAt(data, pos)
+        if ins is None:
+            yield pos, 1, None
+            pos += 1
+        else:
+            yield pos, size, ins
+            pos += size
+
+
+def _MakeDecodeArm(disassemble: Callable) -> Callable:
+    def decode(data, lo: int, hi: int) -> Iterator[Tuple[int, int, Any]]:
+        end = hi - (hi - lo) % 4
+        for n, (word,) in enumerate(struct.iter_unpack("<I", data[lo:end])):
+            yield lo + 4 * n, 4, disassemble(word)
+        for pos in range(end, hi):
+            yield pos, 1, None
+    return decode
+
+
+_X64_MEM_PREFIX = {0: "", 8: "BYTE PTR ", 16: "WORD PTR ", 32: "DWORD PTR ",
+                   64: "QWORD PTR ", 128: "XMMWORD PTR "}
+
+_X64_MEM_START = {x64.OK.RIP_BASE, x64.OK.MODRM_RM_BASE, x64.OK.SIB_BASE,
+                  x64.OK.SIB_INDEX_AS_BASE}
+
+_X64_MEM_TAIL = {x64.OK.SIB_INDEX, x64.OK.SIB_SCALE, x64.OK.OFFABS8, x64.OK.OFFABS32}
+
+
+def _Hex(v: int) -> str:
+    return f"0x{v:x}" if v >= 0 else f"-0x{-v:x}"
+
+
+def _X64Target(ins: x64.Ins, addr: int, size: int) -> Optional[int]:
+    """Target of pc relative branches and rip relative memory operands"""
+    fields = ins.opcode.fields
+    for n, ok in enumerate(fields):
+        if ok in (x64.OK.OFFPCREL8, x64.OK.OFFPCREL32):
+            return addr + size + ins.operands[n]
+        if ok is x64.OK.RIP_BASE:
+            return addr + size + ins.operands[fields.index(x64.OK.OFFABS32)]
+    return None
+
+
+def _X64ObjdumpOperands(ins: x64.Ins, target_str: str) -> List[str]:
+    fields = ins.opcode.fields
+    ops = ins.operands
+    out = []
+    n = 0
+    while n < len(fields):
+        ok = fields[n]
+        if ok in (x64.OK.OFFPCREL8, x64.OK.OFFPCREL32):
+            out.append(target_str)
+        elif ok in _X64_MEM_START:
+            parts = []
+            if ok is x64.OK.SIB_INDEX_AS_BASE:
+                index = ops[n]
+            else:
+                parts.append(x64_symbolic.SymbolizeOperand(ok, ops[n], False, True))
+                index = None
+            disp = None
+            while n + 1 < len(fields) and fields[n + 1] in _X64_MEM_TAIL:
+                n += 1
+                if fields[n] is x64.OK.SIB_INDEX:
+                    index = ops[n] if ops[n] != 4 else None
+                elif fields[n] is x64.OK.SIB_SCALE:
+                    if index is not None:
+                        parts.append(f"{x64.REG_NAMES[64][index]}*{1 << ops[n]}")
+                else:
+                    disp = ops[n]
+            s = "+".join(parts)
+            if disp is not None:
+                s += _Hex(disp) if disp < 0 or not s else "+" + _Hex(disp)
+            out.append(f"{_X64_MEM_PREFIX[ins.opcode.mem_width]}[{s}]")
+        else:
+            s = x64_symbolic.SymbolizeOperand(ok, ops[n], False, True)
+            if s is not None:
+                out.append(s)
+        n += 1
+    return out
+
+
+def _RenderX64(ins: x64.Ins, addr: int, size: int, symbols: Symbols,
+               objdump: bool) -> str:
+    if isinstance(ins, str):
+        return ins if objdump else "nop"
+    target = _X64Target(ins, addr, size)
+    target_str = "" if target is None else f"{target:x} {symbols.Describe(target)}".rstrip()
+    if not objdump:
+        name, ops = x64_symbolic.InsSymbolize(ins, True)
+        out = " ".join([name] + ops)
+        return out if target is None else f"{out}  # {target_str}"
+    ops = _X64ObjdumpOperands(ins, target_str)
+    if not ops:
+        return ins.opcode.name
+    name = ins.opcode.name
+    if name == "mov" and x64.OK.IMM64 in ins.opcode.fields:
+        name = "movabs"
+    out = f"{name:6} {','.join(ops)}"
+    if target is not None and x64.OK.RIP_BASE in ins.opcode.fields:
+        out += f"        # {target_str}"
+    return out
+
+
+_A64_PCREL = {a64.OK.SIMM_PCREL_0_25, a64.OK.SIMM_PCREL_5_18, a64.OK.SIMM_PCREL_5_23,
+              a64.OK.SIMM_PCREL_5_23_29_30}
+
+
+def _SignExtend(v: int, bitwidth: int) -> int:
+    """operands hold the raw (unsigned) field bits"""
+    sign = 1 << (bitwidth - 1)
+    return ((v & ((1 << bitwidth) - 1)) ^ sign) - sign
+
+
+def _A64Target(ins: a64.Ins, addr: int) -> Tuple[int, Optional[int]]:
+    for n, ok in enumerate(ins.opcode.fields):
+        if ok in _A64_PCREL:
+            v = _SignExtend(ins.operands[n], a64.FIELD_DETAILS[ok].bitwidth)
+            if ins.opcode.name == "adrp":
+                return n, ((addr >> 12) + v) << 12
+            elif ins.opcode.name == "adr":
+                return n, addr + v
+            return n, addr + 4 * v
+    return -1, None
+
+
+def _A32Target(ins: a32.Ins, addr: int) -> Tuple[int, Optional[int]]:
+    for n, ok in enumerate(ins.opcode.fields):
+        if ok is a32.OK.SIMM_0_23:
+            v = _SignExtend(ins.operands[n], a32.FIELD_DETAILS[ok].bitwidth)
+            return n, addr + 8 + 4 * v
+    return -1, None
+
+
+def _MakeRenderArm(symbolize: Callable, find_target: Callable,
+                   objdump_name: Callable) -> Callable:
+    def render(ins, addr: int, size: int, symbols: Symbols, objdump: bool) -> str:
+        name, ops = symbolize(ins)
+        pos, target = find_target(ins, addr)
+        target_str = "" if target is None else f"{target:x} {symbols.Describe(target)}".rstrip()
+        if not objdump:
+            out = " ".join([name] + ops)
+            return out if target is None else f"{out}  # {target_str}"
+        if target is not None:
+            ops[pos] = target_str
+        name = objdump_name(ins.opcode)
+        return f"{name}\t{', '.join(ops)}" if ops else name
+    return render
+
+
+@dataclasses.dataclass
+class _Isa:
+    file_format: str
+    addr_width: int  # hex digits of label addresses in objdump mode
+    insn_width: int  # 0 for fixed width instruction which are shown as a word
+    decode: Callable
+    render: Callable
+
+
+_ISAS: Dict[int, _Isa] = {
+    E_MACHINE.X86_64: _Isa("elf64-x86-64", 16, 7, _DecodeX64, _RenderX64),
+    E_MACHINE.AARCH64: _Isa("elf64-littleaarch64", 16, 0, _MakeDecodeArm(a64.Disassemble),
+                            _MakeRenderArm(a64_symbolic.InsSymbolize, _A64Target,
+                                           lambda opc: opc.name)),
+    E_MACHINE.ARM: _Isa("elf32-littlearm", 8, 0, _MakeDecodeArm(a32.Disassemble),
+                        _MakeRenderArm(a32_symbolic.InsSymbolize, _A32Target,
+                                       lambda opc: opc.official_name)),
+}
+
+
+@dataclasses.dataclass
+class _Chunk:
+    name: str  # section name
+    offset: int  # file offset of the section
+    addr: int  # vaddr of the section
+    lo: int  # chunk covers section bytes [lo, hi)
+    hi: int
+
+
+def _RenderChunk(data, isa: _Isa, symbols: Symbols, objdump: bool, chunk: _Chunk) -> str:
+    sec_data = data[chunk.offset:chunk.offset + chunk.hi]
+    lines = []
+    k = bisect.bisect_left(symbols.addrs, chunk.addr + chunk.lo)
+    if chunk.lo == 0 and (k >= len(symbols.addrs) or symbols.addrs[k] != chunk.addr):
+        # like objdump use the section name if there is no symbol at the start
+        lines.append(f"\n{chunk.addr:0{isa.addr_width}x} <{chunk.name}>:" if objdump else
+                     f"\n{chunk.name}:")
+    for pos, size, ins in isa.decode(sec_data, chunk.lo, chunk.hi):
+        addr = chunk.addr + pos
+        while k < len(symbols.addrs) and symbols.addrs[k] <= addr:
+            if symbols.addrs[k] == addr:
+                lines.append(f"\n{addr:0{isa.addr_width}x} <{symbols.names[k]}>:" if objdump
+                             else f"\n{symbols.names[k]}:")
+            k += 1
+        raw = sec_data[pos:pos + size]
+        text = "(bad)" if ins is None else isa.render(ins, addr, size, symbols, objdump)
+        if not objdump:
+            hex_str = raw.hex(" ") if isa.insn_width else f"{int.from_bytes(raw, 'little'):08x}"
+            lines.append(f"{addr:8x}: {hex_str:30} {text}")
+        elif isa.insn_width == 0:
+            hex_str = f"{int.from_bytes(raw, 'little'):08x}" if size == 4 else raw.hex(" ")
+            lines.append(f"{addr:8x}:\t{hex_str} \t{text}")
+        else:
+            w = isa.insn_width
+            lines.append(f"{addr:8x}:\t{raw[:w].hex(' ') + ' ':{3 * w}}\t{text}")
+            for n in range(w, size, w):
+                lines.append(f"{addr + n:8x}:\t{raw[n:n + w].hex(' ')} ")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _MakeChunks(sec: elfhelper.Section, symbols: Symbols, isa: _Isa,
+                chunk_size: int) -> List[_Chunk]:
+    lo = bisect.bisect_left(symbols.addrs, sec.sh_addr)
+    hi = bisect.bisect_left(symbols.addrs, sec.sh_addr + sec.sh_size)
+    cuts = [a - sec.sh_addr for a in symbols.addrs[lo:hi]]
+    if isa.insn_width == 0:
+        # fixed width instructions can be split anywhere
+        cuts = sorted(set(cuts + list(range(chunk_size, sec.sh_size, chunk_size))))
+    out = []
+    start = 0
+    for c in cuts:
+        if c - start >= chunk_size and (isa.insn_width or c % 4 == 0):
+            out.append(_Chunk(sec.name, sec.sh_offset, sec.sh_addr, start, c))
+            start = c
+    out.append(_Chunk(sec.name, sec.sh_offset, sec.sh_addr, start, sec.sh_size))
+    return out
+
+
+def _RenderChunkWithState(state, chunk: _Chunk) -> str:
+    return _RenderChunk(*state, chunk)
+
+
+def DisassembleExe(path: str, objdump: bool = False, jobs: int = 1,
+                   min_parallel_size: int = _PARALLEL_MIN_SIZE) -> Iterator[str]:
+    """Yields the disassembly of all executable sections of the ELF file `path`
+    in pieces as they become available
+
+    Only sections of at least `min_parallel_size` bytes are split across `jobs`
+    worker processes.
+    """
+    with open(path, "rb") as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with memoryview(data) as view:
+            yield from _DisassembleMapped(path, data, view, objdump, jobs, min_parallel_size)
+
+
+def _DisassembleMapped(path: str, data, view, objdump: bool, jobs: int,
+                       min_parallel_size: int) -> Iterator[str]:
+    exe = elfhelper.Executable()
+    exe.load(data)
+    isa = _ISAS.get(exe.ehdr.e_machine)
+    assert isa is not None, f"unsupported e_machine {exe.ehdr.e_machine}"
+    symbols = Symbols(exe)
+    if objdump:
+        yield f"\n{path}:     file format {isa.file_format}\n\n"
+    else:
+        yield f"# {path} {E_MACHINE(exe.ehdr.e_machine).name}\n"
+    for sec in exe.sections:
+        if not (sec.sh_flags & SH_FLAGS.EXECINSTR.value) or sec.sh_type == SH_TYPE.NOBITS:
+            continue
+        if objdump:
+            yield f"\nDisassembly of section {sec.name}:\n"
+        else:
+            yield f"\n# section {sec.name} addr=0x{sec.sh_addr:x} size=0x{sec.sh_size:x}\n"
+        if jobs <= 1 or sec.sh_size < min_parallel_size:
+            for chunk in _MakeChunks(sec, symbols, isa, _CHUNK_SIZE):
+                yield _RenderChunk(view, isa, symbols, objdump, chunk)
+            continue
+        # a few chunks per worker are enough to balance the load
+        chunks = _MakeChunks(sec, symbols, isa, max(_CHUNK_SIZE, sec.sh_size // (4 * jobs)))
+        # the first chunk is rendered before forking so the workers inherit warm decoders
+        yield _RenderChunk(view, isa, symbols, objdump, chunks[0])
+        if len(chunks) == 1:
+            continue
+        # the workers inherit the mapped file instead of having to unpickle it
+        yield from parallel.ForkedMap(_RenderChunkWithState, (view, isa, symbols, objdump),
+                                      chunks[1:], jobs, chunksize=1)
+
+
+if __name__ == "__main__":
+    def main():
+        parser = argparse.ArgumentParser(description='disassembler_tool')
+        parser.add_argument('-objdump', action='store_true',
+                            help='mimic the output layout of `objdump -d -M intel`')
+        parser.add_argument('-jobs', type=int, default=1,
+                            help='number of processes used for disassembly')
+        parser.add_argument('-min_parallel_size', type=int, default=_PARALLEL_MIN_SIZE,
+                            help='smallest section size (in bytes) disassembled in parallel')
+        parser.add_argument('exe', type=str, help='input ELF executable')
+        parser.add_argument('output', type=str, nargs='?', default="-",
+                            help='output file')
+        args = parser.parse_args()
+        fout = sys.stdout if args.output == "-" else open(args.output, "w")
+        for text in DisassembleExe(args.exe, args.objdump, args.jobs, args.min_parallel_size):
+            fout.write(text)
+
+    main()
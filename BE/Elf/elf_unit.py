@@ -30,7 +30,7 @@ class Unit:
         sym = the_map.get(name)
         if sym is None:
             # ~0 is our undefined symbol marker. It is checked in
-            val = ~0 if sec is None else len(sec.data)
+            val = ~0 if sec is None else sec.sh_size
             sym = elf.Symbol.Init(name, is_local, sec, val)
             self.symbols.append(sym)
             the_map[name] = sym
@@ -39,7 +39,7 @@ class Unit:
             # the symbol was forward declared and now we are filling in the missing info
             assert sym.is_undefined(), f"{sym} already defined"
             sym.section = sec
-            sym.st_value = len(sec.data)
+            sym.st_value = sec.sh_size
         return sym
 
     def FindOrAddSymbol(self, name, is_local) -> elf.Symbol:
@@ -52,9 +52,10 @@ class Unit:
 
     def AddReloc(self, reloc_kind, sec: elf.Section, symbol: elf.Symbol,
                  extra: int, reloc_offset_addend=0):
+        assert sec.sh_type != elf.SH_TYPE.NOBITS, f"cannot relocate in {sec.name}"
         self.relocations.append(
             elf.Reloc.Init(reloc_kind.value, sec,
-                           len(sec.data) + reloc_offset_addend, symbol, extra))
+                           sec.sh_size + reloc_offset_addend, symbol, extra))
 
     def FunStart(self, name: str, alignment: int, padding_or_padder: Any):
         self.sec_text.PadData(alignment, padding_or_padder)
@@ -86,7 +87,12 @@ class Unit:
 
     def AddData(self, repeats: int, data: bytes):
         assert self.mem_sec is not None
-        self.mem_sec.AddData(data * repeats)
+        if self.mem_sec is self.sec_bss:
+            # do not materialize zeros which never make it into the exe
+            assert not any(data), f"non-zero data in bss"
+            self.mem_sec.AddZeros(len(data) * repeats)
+        else:
+            self.mem_sec.AddData(data * repeats)
 
     def AddFunAddr(self, reloc_type, size: int, fun_name: str):
         assert self.mem_sec is not None
@@ -112,6 +118,48 @@ class Unit:
         assert self.current_fun is not None
         self.AddSymbol(name, self.sec_text, True)
 
+    def AddUnitFragment(self, frag: "Unit", text_padding_or_padder: Any):
+        """Splice in a Unit which was generated separately, e.g. by a worker process.
+
+        The result is identical to generating the fragment's content directly into this Unit
+        provided every section of the fragment was padded to its largest alignment
+        right at the beginning (which FunStart/MemStart take care of).
+        """
+        assert self.current_fun is None and self.mem_sec is None
+        sec_map = {}
+        sec_offset = {}
+        for frag_sec, sec, padding in [(frag.sec_text, self.sec_text, text_padding_or_padder),
+                                       (frag.sec_rodata, self.sec_rodata, ZERO_BYTE),
+                                       (frag.sec_data, self.sec_data, ZERO_BYTE),
+                                       (frag.sec_bss, self.sec_bss, ZERO_BYTE)]:
+            sec.PadData(frag_sec.sh_addralign, padding)
+            sec_map[id(frag_sec)] = sec
+            sec_offset[id(frag_sec)] = sec.sh_size
+            if sec.sh_type == elf.SH_TYPE.NOBITS:
+                sec.AddZeros(frag_sec.sh_size)
+            else:
+                sec.AddData(frag_sec.data)
+        #
+        sym_map: Dict[int, elf.Symbol] = {}
+        for frag_sym in frag.symbols:
+            if frag_sym.st_bind == elf.ST_INFO_BIND.LOCAL:
+                # locals never outlive the function they were defined in
+                sym = elf.Symbol.Init(frag_sym.name, True, None, ~0)
+                self.symbols.append(sym)
+            else:
+                sym = self.FindOrAddSymbol(frag_sym.name, False)
+            if not frag_sym.is_undefined():
+                assert sym.is_undefined(), f"{sym} already defined"
+                sym.section = sec_map[id(frag_sym.section)]
+                sym.st_value = frag_sym.st_value + sec_offset[id(frag_sym.section)]
+            sym_map[id(frag_sym)] = sym
+        #
+        for frag_rel in frag.relocations:
+            self.relocations.append(
+                elf.Reloc.Init(frag_rel.r_type, sec_map[id(frag_rel.section)],
+                               frag_rel.r_offset + sec_offset[id(frag_rel.section)],
+                               sym_map[id(frag_rel.symbol)], frag_rel.r_addend))
+
     def AddLinkerDefs(self):
         """must be called last - do we really need linkerdefs?"""
         if self.sec_bss.sh_size > 0:
@@ -130,6 +178,5 @@ SECTION[rodata] {len(self.sec_rodata.data)}
 {DumpData(self.sec_rodata.data, 0, syms)}     
 SECTION[data] {len(self.sec_data.data)}
 {DumpData(self.sec_data.data, 0, syms)}    
-SECTION[bss] {len(self.sec_bss.data)}
-{DumpData(self.sec_bss.data, 0, syms)}    
+SECTION[bss] {self.sec_bss.sh_size}
 """
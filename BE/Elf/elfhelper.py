@@ -44,6 +44,7 @@ s64 -> q
 
 import dataclasses
 import io
+import os
 import struct
 from typing import List, Dict, Optional, Set, Tuple, Any
 
@@ -264,13 +265,28 @@ class Section:
     def PadData(self, n: int, padding_or_padder: Any):
         if self.sh_addralign < n:
             self.sh_addralign = n
+        if self.sh_type == SH_TYPE.NOBITS:
+            # NOBITS sections (.bss) are tracked by size only
+            self.sh_size = Align(self.sh_size, n)
+            return
         Pad(self.data, n, padding_or_padder)
         self.sh_size = len(self.data)
 
     def AddData(self, data: bytes):
+        if self.sh_type == SH_TYPE.NOBITS:
+            assert not any(data), f"non-zero data for {self.name}"
+            self.sh_size += len(data)
+            return
         self.data += data
         self.sh_size = len(self.data)
 
+    def AddZeros(self, size: int):
+        if self.sh_type == SH_TYPE.NOBITS:
+            self.sh_size += size
+            return
+        self.data += bytes(size)
+        self.sh_size = len(self.data)
+
     def SetData(self, data: bytes):
         self.data = data
         self.sh_size = len(self.data)
@@ -587,12 +603,17 @@ class Symbol:
         self.st_type = st_info & 0xf
 
     def pack(self, which):
+        out = bytearray(Symbol.SIZE[which])
+        self.pack_into(which, out, 0)
+        return bytes(out)
+
+    def pack_into(self, which, buffer, offset: int):
         st_info = (self.st_bind << 4) | self.st_type
         fmt = Symbol.FORMAT[which]
         assert self.st_value != -1, f"undefined sym {self.name}"
         if which == EI_CLASS.X_32:
-            return struct.pack(
-                fmt, self.st_name,
+            struct.pack_into(
+                fmt, buffer, offset, self.st_name,
                 self.st_value,
                 self.st_size,
                 st_info,
@@ -601,8 +622,8 @@ class Symbol:
             )
         else:
             assert which == EI_CLASS.X_64
-            return struct.pack(
-                fmt, self.st_name, st_info, self.st_other, self.st_shndx,
+            struct.pack_into(
+                fmt, buffer, offset, self.st_name, st_info, self.st_other, self.st_shndx,
                 self.st_value, self.st_size)
 
     def __str__(self):
@@ -685,6 +706,40 @@ def str_offset_to_name(offset, sec_symtab: Section):
     return name.decode("utf-8")
 
 
+# conservative value for the maximum number of buffers passed to writev
+_IOV_MAX = 1024
+
+
+def WriteBuffers(stream, buffers: List[Any]):
+    """Writes a list of bytes-like objects to stream.
+
+    If stream is backed by a file descriptor the buffers are handed to
+    the kernel via writev without concatenating them first.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fd = -1
+    if fd < 0 or not hasattr(os, "writev"):
+        for b in buffers:
+            stream.write(b)
+        return
+    stream.flush()
+    pending = [memoryview(b).cast("B") for b in buffers if len(b) > 0]
+    start = 0
+    while start < len(pending):
+        n = os.writev(fd, pending[start:start + _IOV_MAX])
+        # deal with partial writes
+        while n > 0:
+            size = len(pending[start])
+            if n >= size:
+                n -= size
+                start += 1
+            else:
+                pending[start] = pending[start][n:]
+                n = 0
+
+
 def MakeSecStrTabContents(sections: List[Section]):
     out = bytearray()
     out += b"\0"
@@ -778,23 +833,28 @@ class Executable:
         return out
 
     def save(self, stream: io.BytesIO):
-        """ Save"""
-        which = self.ehdr_ident.ei_class
+        """ Save
 
+        Section contents are not copied: the headers, padding and
+        section buffers are collected and written in one go (see WriteBuffers).
+        NOBITS sections (.bss) do not occupy any space in the file.
+        """
+        which = self.ehdr_ident.ei_class
+        buffers = []
         offset = 0
         data = self.ehdr_ident.pack()
         offset += len(data)
-        stream.write(data)
+        buffers.append(data)
         data = self.ehdr.pack(which)
         offset += len(data)
-        stream.write(data)
+        buffers.append(data)
         assert offset == self.ehdr.e_phoff
         for phdr in self.segments:
             if phdr.is_pseudo:
                 continue
             data = phdr.pack(which)
             offset += len(data)
-            stream.write(data)
+            buffers.append(data)
 
         # Note pseudo segment will be last
         for phdr in self.segments:
@@ -813,31 +873,28 @@ class Executable:
                 new_offset = shdr.sh_offset
                 if new_offset != offset:
                     assert new_offset > offset, f"offset corruption"
-                    padding = (new_offset - offset) * b"\0"
                     if False:
-                        print(f"adding {len(padding)} byte padding")
-                    offset += len(padding)
-                    stream.write(padding)
+                        print(f"adding {new_offset - offset} byte padding")
+                    buffers.append(bytes(new_offset - offset))
+                    offset = new_offset
 
                 assert shdr.sh_size == len(
                     shdr.data), f"size mismatch {shdr.sh_size:x} vs {len(shdr.data):x}"
                 offset += len(shdr.data)
-                stream.write(shdr.data)
+                buffers.append(shdr.data)
 
         # hack
         new_offset = Align(offset, 16 if which == EI_CLASS.X_64 else 4)
-        padding = (new_offset - offset) * b"\0"
-        offset += len(padding)
-        stream.write(padding)
+        buffers.append(bytes(new_offset - offset))
+        offset = new_offset
 
         assert offset == self.ehdr.e_shoff, f"e_shoff mismatch {offset:x} vs {self.ehdr.e_shoff:x}"
         for phdr in self.segments:
             if phdr.is_auxiliary:
                 continue
             for shdr in phdr.sections:
-                data = shdr.pack(which)
-                offset += len(data)
-                stream.write(data)
+                buffers.append(shdr.pack(which))
+        WriteBuffers(stream, buffers)
 
     def _load_segements(self, fin: io.BytesIO, which) -> Tuple[int, List[Segment]]:
         size = Segment.SIZE[which]
@@ -894,9 +951,9 @@ class Executable:
         for i in range(n):
             sym = Symbol()
             self.symbols.append(sym)
+            sym.unpack(which, fin.read(size))
             if len(shdrs) > sym.st_shndx > 0:
                 sym.section = shdrs[sym.st_shndx]
-            sym.unpack(which, fin.read(size))
             sym.name = str_offset_to_name(sym.st_name, strtab)
 
     def load(self, fin: io.BytesIO):
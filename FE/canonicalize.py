@@ -46,7 +46,7 @@ def _ShouldBeBoolExpanded(node, parent):
     return node.x_type.is_bool() and isinstance(parent, cwast.TOP_LEVEL_EXPRESSION_NODES)
 
 
-def FunCanonicalizeBoolExpressionsNotUsedForConditionals(fun: cwast.DefFun):
+def MakeCanonicalizeBoolExpressionsNotUsedForConditionalsRule() -> cwast.RewriteRule:
     """transform a complex bool expression e into "e ? true : false"
 
     This will make it eligible for CanonicalizeTernaryOp which is the only way currently
@@ -64,7 +64,15 @@ def FunCanonicalizeBoolExpressionsNotUsedForConditionals(fun: cwast.DefFun):
                                         x_type=ct_bool, x_eval=eval.VAL_FALSE),
                            x_srcloc=node.x_srcloc, x_type=ct_bool, x_eval=node.x_eval)
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("CanonicalizeBoolExpressionsNotUsedForConditionals", replacer,
+                             (cwast.Expr1, cwast.Expr2),
+                             creates=(cwast.ValNum,),
+                             parent_kinds=cwast.TOP_LEVEL_EXPRESSION_NODES)
+
+
+def FunCanonicalizeBoolExpressionsNotUsedForConditionals(fun: cwast.DefFun):
+    cwast.ApplyRewriteRules(
+        fun, [MakeCanonicalizeBoolExpressionsNotUsedForConditionalsRule()])
 
 
 def _RewriteExprIs(node: cwast.ExprIs, typeid_ct: cwast.CanonType):
@@ -108,13 +116,21 @@ def _RewriteExprIs(node: cwast.ExprIs, typeid_ct: cwast.CanonType):
     return out
 
 
-def FunDesugarExprIs(fun: cwast.DefFun, typeid_ct: cwast.CanonType):
+def MakeDesugarExprIsRule(typeid_ct: cwast.CanonType) -> cwast.RewriteRule:
     """Transform ExprIs comparisons for typeids"""
     def replacer(node, _parent):
         if isinstance(node, cwast.ExprIs):
             return _RewriteExprIs(node, typeid_ct)
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    # the copies of the tested expression contain Id, ExprDeref and ExprField
+    return cwast.RewriteRule("DesugarExprIs", replacer, (cwast.ExprIs,),
+                             creates=(cwast.ExprUnionTag, cwast.ValNum, cwast.Expr2,
+                                      cwast.Id, cwast.ExprDeref, cwast.ExprField))
+
+
+def FunDesugarExprIs(fun: cwast.DefFun, typeid_ct: cwast.CanonType):
+    """Transform ExprIs comparisons for typeids"""
+    cwast.ApplyRewriteRules(fun, [MakeDesugarExprIsRule(typeid_ct)])
 
 
 def MakeDefVar(name, init) -> Any:
@@ -123,7 +139,7 @@ def MakeDefVar(name, init) -> Any:
     return cwast.DefVar(name, at, init, x_srcloc=sl, x_type=init.x_type)
 
 
-def FunDesugarExpr3(fun: cwast.DefFun):
+def MakeDesugarExpr3Rule() -> cwast.RewriteRule:
     """Convert ternary operator nodes into expr with if statements
 
     Note we could implement the ternary op as a macro but would lose the ability to do
@@ -157,7 +173,13 @@ def FunDesugarExpr3(fun: cwast.DefFun):
 
         return expr
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("DesugarExpr3", replacer, (cwast.Expr3,),
+                             creates=(cwast.DefVar, cwast.TypeAuto, cwast.Id,
+                                      cwast.StmtIf, cwast.StmtReturn))
+
+
+def FunDesugarExpr3(fun: cwast.DefFun):
+    cwast.ApplyRewriteRules(fun, [MakeDesugarExpr3Rule()])
 
 
 ############################################################
@@ -288,9 +310,9 @@ def _MakeSimpleAssigmemt(kind: cwast.BINARY_EXPR_KIND, lhs, expr, sl: cwast.SrcL
 #
 
 
-def FunCanonicalizeCompoundAssignments(fun: cwast.DefFun):
+def MakeCanonicalizeCompoundAssignmentsRule() -> cwast.RewriteRule:
     """Convert StmtCompoundAssignment to StmtAssignment"""
-    def replacer(node):
+    def replacer(node, _parent):
         if not isinstance(node, cwast.StmtCompoundAssignment):
             return None
         stmts = []
@@ -305,7 +327,15 @@ def FunCanonicalizeCompoundAssignments(fun: cwast.DefFun):
         stmts.append(assignment)
         return stmts
 
-    cwast.MaybeReplaceAstRecursivelyPost(fun, replacer)
+    return cwast.RewriteRule("CanonicalizeCompoundAssignments", replacer,
+                             (cwast.StmtCompoundAssignment,),
+                             creates=(cwast.TypeAuto, cwast.Id, cwast.ExprDeref,
+                                      cwast.ExprField, cwast.Expr2))
+
+
+def FunCanonicalizeCompoundAssignments(fun: cwast.DefFun):
+    """Convert StmtCompoundAssignment to StmtAssignment"""
+    cwast.ApplyRewriteRules(fun, [MakeCanonicalizeCompoundAssignmentsRule()])
 
 
 def FunReplaceConstExpr(node: cwast.DefFun, tc: type_corpus.TypeCorpus):
@@ -344,10 +374,10 @@ def FunReplaceConstExpr(node: cwast.DefFun, tc: type_corpus.TypeCorpus):
     cwast.MaybeReplaceAstRecursively(node, replacer)
 
 
-def FunOptimizeKnownConditionals(fun: cwast.DefFun):
+def MakeOptimizeKnownConditionalsRule() -> cwast.RewriteRule:
     """Simplify If-statements where the conditional could be evaluated
     """
-    def visit(node):
+    def visit(node, _parent):
         if isinstance(node, cwast.StmtIf) and isinstance(node.cond, cwast.ValNum):
             assert isinstance(
                 node.cond.x_eval, eval.EvalNum), f"{node.cond.x_eval} {node.cond}"
@@ -357,7 +387,13 @@ def FunOptimizeKnownConditionals(fun: cwast.DefFun):
                 node.body_t.clear()
         return None
 
-    cwast.VisitAstRecursivelyPost(fun, visit)
+    return cwast.RewriteRule("OptimizeKnownConditionals", visit, (cwast.StmtIf,))
+
+
+def FunOptimizeKnownConditionals(fun: cwast.DefFun):
+    """Simplify If-statements where the conditional could be evaluated
+    """
+    cwast.ApplyRewriteRules(fun, [MakeOptimizeKnownConditionalsRule()])
 
 
 def _CovertExprIndexToExprPoiner(container: cwast.Id, expr_index, bound, mut: bool,
@@ -409,7 +445,7 @@ def _RewriteExprIndex(node: cwast.ExprIndex, uint_type: cwast.CanonType,
             return cwast.ExprDeref(expr, x_srcloc=sl, x_type=elem_ct, x_eval=node.x_eval)
 
 
-def FunReplaceExprIndex(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+def MakeReplaceExprIndexRule(tc: type_corpus.TypeCorpus) -> cwast.RewriteRule:
     """convert index expr into pointer arithmetic"""
     uint_ct: cwast.CanonType = tc.get_uint_canon_type()
 
@@ -420,7 +456,15 @@ def FunReplaceExprIndex(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
 
         return None
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("ReplaceExprIndex", replacer, (cwast.ExprIndex,),
+                             creates=(cwast.ExprPointer, cwast.ExprFront, cwast.ValNum,
+                                      cwast.ExprLen, cwast.Id, cwast.TypeAuto,
+                                      cwast.DefVar, cwast.ExprStmt, cwast.StmtReturn))
+
+
+def FunReplaceExprIndex(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+    """convert index expr into pointer arithmetic"""
+    cwast.ApplyRewriteRules(fun, [MakeReplaceExprIndexRule(tc)])
 
 
 def _GetFrontTypeForVec(ct: cwast.CanonType, tc) -> cwast.CanonType:
@@ -464,10 +508,10 @@ def _MaybeMakeImplicitConversionExplicit(orig_node, expected_ct: cwast.CanonType
                                x_srcloc=orig_node.x_srcloc, x_eval=orig_node.x_eval)
 
 
-def FunMakeImplicitConversionsExplicit(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+def MakeImplicitConversionsExplicitRule(tc: type_corpus.TypeCorpus) -> cwast.RewriteRule:
     uint_type: cwast.CanonType = tc.get_uint_canon_type()
 
-    def visitor(node: Any):
+    def visitor(node: Any, _parent: Any):
         nonlocal tc, uint_type
 
         if isinstance(node, cwast.ValPoint):
@@ -499,7 +543,16 @@ def FunMakeImplicitConversionsExplicit(fun: cwast.DefFun, tc: type_corpus.TypeCo
             node.expr_rhs = _MaybeMakeImplicitConversionExplicit(
                 node.expr_rhs, node.lhs.x_type, uint_type, tc)
 
-    cwast.VisitAstRecursivelyPost(fun, visitor)
+    # the conversions are inserted below the visited nodes
+    return cwast.RewriteRule("MakeImplicitConversionsExplicit", visitor,
+                             (cwast.ValPoint, cwast.DefVar, cwast.DefGlobal, cwast.ExprCall,
+                              cwast.ExprWrap, cwast.StmtReturn, cwast.StmtAssignment),
+                             creates=(cwast.ExprFront, cwast.ValNum, cwast.ValSpan,
+                                      cwast.TypeAuto, cwast.ExprWiden))
+
+
+def FunMakeImplicitConversionsExplicit(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+    cwast.ApplyRewriteRules(fun, [MakeImplicitConversionsExplicitRule(tc)])
 
 
 def _CloneId(node: cwast.Id) -> cwast.Id:
@@ -518,7 +571,7 @@ def _MakeUnionNarrow(union_id: cwast.Id, ct: cwast.CanonType, sl) -> Any:
     return cwast.ExprNarrow(union_id, type_expr, unchecked=True, x_type=ct, x_srcloc=sl)
 
 
-def FunDesugarTaggedUnionComparisons(fun: cwast.DefFun):
+def MakeDesugarTaggedUnionComparisonsRule() -> cwast.RewriteRule:
     def make_cmp(cmp: cwast.Expr2, union: Any, field: Any, kind) -> Any:
         """
         tagged_union_val == member_val
@@ -568,7 +621,13 @@ def FunDesugarTaggedUnionComparisons(fun: cwast.DefFun):
         if node.expr2.x_type.is_tagged_union():
             return make_cmp(node, node.expr2, node.expr1, kind)
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("DesugarTaggedUnionComparisons", replacer, (cwast.Expr2,),
+                             creates=(cwast.ExprIs, cwast.ExprNarrow, cwast.TypeAuto,
+                                      cwast.Id, cwast.Expr1, cwast.Expr2))
+
+
+def FunDesugarTaggedUnionComparisons(fun: cwast.DefFun):
+    cwast.ApplyRewriteRules(fun, [MakeDesugarTaggedUnionComparisonsRule()])
 
 
 def _IsSimpleInitializer(expr) -> bool:
@@ -581,7 +640,7 @@ def _IsSimpleInitializer(expr) -> bool:
         return False
 
 
-def FunReplaceSpanCastWithSpanVal(node, tc: type_corpus.TypeCorpus):
+def MakeReplaceSpanCastWithSpanValRule(tc: type_corpus.TypeCorpus) -> cwast.RewriteRule:
     """Eliminate Array to Span casts. """
     uint_type: cwast.CanonType = tc.get_uint_canon_type()
 
@@ -595,10 +654,16 @@ def FunReplaceSpanCastWithSpanVal(node, tc: type_corpus.TypeCorpus):
                 node.expr, node.x_type, uint_type, tc)
         return None
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(node, replacer)
+    return cwast.RewriteRule("ReplaceSpanCastWithSpanVal", replacer, (cwast.ExprAs,),
+                             creates=(cwast.ExprFront, cwast.ValNum))
 
 
-def FunRewriteComplexAssignments(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+def FunReplaceSpanCastWithSpanVal(node, tc: type_corpus.TypeCorpus):
+    """Eliminate Array to Span casts. """
+    cwast.ApplyRewriteRules(node, [MakeReplaceSpanCastWithSpanValRule(tc)])
+
+
+def MakeRewriteComplexAssignmentsRule() -> cwast.RewriteRule:
     """Rewrite assignments of recs (including unions and spans) and arrays
 
     to ensure correctness.
@@ -625,7 +690,7 @@ def FunRewriteComplexAssignments(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
 
     We reject this approach because it forces another stack variable: tmp.
     """
-    def replacer(node):
+    def replacer(node, _parent):
         if not isinstance(node, cwast.StmtAssignment):
             return None
         rhs = node.expr_rhs
@@ -656,7 +721,16 @@ def FunRewriteComplexAssignments(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
         extra.append(node)
         return extra
 
-    cwast.MaybeReplaceAstRecursivelyPost(fun, replacer)
+    # the initializers of the rhs are patched up in place
+    return cwast.RewriteRule("RewriteComplexAssignments", replacer, (cwast.StmtAssignment,),
+                             creates=(cwast.TypeAuto, cwast.Id, cwast.ValPoint, cwast.ExprWiden))
+
+
+def FunRewriteComplexAssignments(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+    """Rewrite assignments of recs (including unions and spans) and arrays
+
+    See MakeRewriteComplexAssignmentsRule"""
+    cwast.ApplyRewriteRules(fun, [MakeRewriteComplexAssignmentsRule()])
 
 
 def FunRemoveParentheses(fun: Any):
@@ -668,11 +742,15 @@ def FunRemoveParentheses(fun: Any):
     cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
 
 
-def FunRemoveUselessCast(fun):
+def MakeRemoveUselessCastRule() -> cwast.RewriteRule:
     def replacer(node, _parent):
         if isinstance(node, cwast.ExprAs):
             if node.x_type is node.expr.x_type:
                 return node.expr
         return None
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("RemoveUselessCast", replacer, (cwast.ExprAs,))
+
+
+def FunRemoveUselessCast(fun):
+    cwast.ApplyRewriteRules(fun, [MakeRemoveUselessCastRule()])
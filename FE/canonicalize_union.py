@@ -168,7 +168,7 @@ def _ConvertTaggedNarrowToUntaggedNarrow(node: cwast.ExprNarrow, tc: type_corpus
                                         x_type=untagged_ct)
 
 
-def FunSimplifyTaggedExprNarrow(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+def MakeSimplifyTaggedExprNarrowRule(tc: type_corpus.TypeCorpus) -> cwast.RewriteRule:
     """Simplifies ExprNarrow for tagged unions `u`
 
     After this only unchecked ExprNarrow will be left in the AST
@@ -232,7 +232,18 @@ def FunSimplifyTaggedExprNarrow(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
         body.append(cwast.StmtReturn(node, x_srcloc=sl, x_target=expr))
         return expr
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("SimplifyTaggedExprNarrow", replacer, (cwast.ExprNarrow,),
+                             creates=(cwast.ExprNarrow, cwast.ExprUnionUntagged, cwast.ExprIs,
+                                      cwast.TypeAuto, cwast.StmtIf, cwast.StmtTrap,
+                                      cwast.StmtReturn, cwast.DefVar, cwast.Id,
+                                      cwast.ExprDeref, cwast.ExprField))
+
+
+def FunSimplifyTaggedExprNarrow(fun: cwast.DefFun, tc: type_corpus.TypeCorpus):
+    """Simplifies ExprNarrow for tagged unions `u`
+
+    See MakeSimplifyTaggedExprNarrowRule"""
+    cwast.ApplyRewriteRules(fun, [MakeSimplifyTaggedExprNarrowRule(tc)])
 
 
 def ReplaceUnions(node: cwast.DefMod):
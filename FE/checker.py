@@ -17,21 +17,6 @@ class COMPILE_STAGE(enum.Enum):
     AFTER_DESUGAR = enum.auto()
 
 
-def _VisitAstRecursivelyWithParentAndField(node, visitor, parent, nfd=None):
-    if visitor(node, parent, nfd):
-        return
-
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is cwast.NFK.NODE:
-            child = getattr(node, f)
-            _VisitAstRecursivelyWithParentAndField(child, visitor, node, nfd)
-        else:
-            for child in getattr(node, f):
-                _VisitAstRecursivelyWithParentAndField(
-                    child, visitor, node, nfd)
-
-
 def _CheckMacroRecursively(node, seen_names: set[str]):
     def visitor(node):
         if isinstance(node, (cwast.MacroParam, cwast.MacroFor)):
@@ -60,16 +45,11 @@ def _IsPermittedNode(node, permitted, parent, toplevel_node, node_mod: cwast.Def
     return False
 
 
-def CheckAST(node_mod: cwast.DefMod, disallowed_nodes, allow_type_auto=False, pre_symbolize=False):
-    """
-    This check is run at various stages of compilation.
-
-    `disallowed_nodes` contains a set of nodes that must not appear.
-
-    `pre_symbolize` indicates that the check is running before symbolization so
-    that the fields `x_symtab`, `x_target`, `x_symbol` are not yet set.
-
+def MakeASTChecker(node_mod: cwast.DefMod, disallowed_nodes, allow_type_auto=False,
+                   pre_symbolize=False):
+    """Returns the visitor used by CheckAST for cwast.VisitAstRecursivelyFused
 
+    This allows running the check together with other verifiers in a single walk.
     """
     # this only works with pre-order traversal
     toplevel_node = None
@@ -147,4 +127,19 @@ def CheckAST(node_mod: cwast.DefMod, disallowed_nodes, allow_type_auto=False, pr
                 cwast.CompilerError(
                     node.x_srcloc, f"unexpected node for field={nfd.name} node={node.__class__.__name__} parent={parent} permitted={nfd.node_type}")
 
-    _VisitAstRecursivelyWithParentAndField(node_mod, visitor, None)
+    return visitor
+
+
+def CheckAST(node_mod: cwast.DefMod, disallowed_nodes, allow_type_auto=False, pre_symbolize=False):
+    """
+    This check is run at various stages of compilation.
+
+    `disallowed_nodes` contains a set of nodes that must not appear.
+
+    `pre_symbolize` indicates that the check is running before symbolization so
+    that the fields `x_symtab`, `x_target`, `x_symbol` are not yet set.
+
+
+    """
+    cwast.VisitAstRecursivelyFused(node_mod, [MakeASTChecker(
+        node_mod, disallowed_nodes, allow_type_auto, pre_symbolize)])
@@ -2,13 +2,14 @@
 
 """Compiler"""
 
+import io
 import logging
 import argparse
 import pathlib
 import os
 import sys
 
-from typing import Any, Optional
+from typing import Any, Optional, Callable
 
 
 from FE import canonicalize_large_args
@@ -30,6 +31,10 @@ from FE import checker
 from FE import emit_ir
 from FE import controlflow
 
+from IR import binary_ir
+from Util import parallel
+from Util import timing
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,11 +55,16 @@ def MangledGlobalName(mod_name: str, node: Any, is_cdecl: bool) -> cwast.NAME:
         return cwast.NAME.Make(f"{mod_name}/{n}{poly_suffix}")
 
 
+def _CountNodes(mods: list[cwast.DefMod]) -> int:
+    return sum(stats.ComputeNodeHistogram(mods).values())
+
+
 def SanityCheckMods(phase_name: str, stage: checker.COMPILE_STAGE, args: Any,
                     mods: list[cwast.DefMod], tc: Optional[type_corpus.TypeCorpus],
                     eliminated_node_types):
 
     logger.info(phase_name)
+    timing.Lap(phase_name, mods=len(mods))
     if args.emit_stats == phase_name:
         node_histo = stats.ComputeNodeHistogram(mods)
         stats.DumpCounter(node_histo)
@@ -82,24 +92,30 @@ def SanityCheckMods(phase_name: str, stage: checker.COMPILE_STAGE, args: Any,
 
     no_symbols = stage.value < checker.COMPILE_STAGE.AFTER_TYPIFY.value
     allow_type_auto = stage.value >= checker.COMPILE_STAGE.AFTER_DESUGAR.value
-    for mod in mods:
-        checker.CheckAST(mod, eliminated_node_types, allow_type_auto,
-                         pre_symbolize=no_symbols)
-
-        if stage.value >= checker.COMPILE_STAGE.AFTER_SYMBOLIZE.value:
-            symbolize.VerifySymbols(mod)
-
-        if stage in (checker.COMPILE_STAGE.AFTER_TYPIFY, checker.COMPILE_STAGE.AFTER_EVAL):
-            typify.VerifyTypesRecursively(
-                mod, tc, typify.VERIFIERS_BEFORE_INITIAL_TRANSFORMS)
-        elif stage.value >= checker.COMPILE_STAGE.AFTER_DESUGAR.value:
-            # desugaring eliminate implicit conversions, so we can be stricter
-            typify.VerifyTypesRecursively(
-                mod, tc, typify.VERIFIERS_AFTER_INITIAL_TRANSFORMS)
-            controlflow.ModVerifyFunFallthrus(mod)
-
-        if stage.value >= checker.COMPILE_STAGE.AFTER_EVAL.value:
-            eval.VerifyASTEvalsRecursively(mod)
+    with timing.Span(f"{phase_name}:check", "check",
+                     lambda: {"nodes": _CountNodes(mods)}):
+        for mod in mods:
+            # the pre-order verifiers are independent of each other and
+            # share a single walk
+            verifiers = [checker.MakeASTChecker(mod, eliminated_node_types, allow_type_auto,
+                                                pre_symbolize=no_symbols)]
+            if stage.value >= checker.COMPILE_STAGE.AFTER_SYMBOLIZE.value:
+                verifiers.append(symbolize.MakeSymbolVerifier())
+            cwast.VisitAstRecursivelyFused(mod, verifiers)
+
+            if stage in (checker.COMPILE_STAGE.AFTER_TYPIFY, checker.COMPILE_STAGE.AFTER_EVAL):
+                typify.VerifyTypesRecursively(
+                    mod, tc, typify.VERIFIERS_BEFORE_INITIAL_TRANSFORMS)
+            elif stage.value >= checker.COMPILE_STAGE.AFTER_DESUGAR.value:
+                # desugaring eliminate implicit conversions, so we can be stricter
+                typify.VerifyTypesRecursively(
+                    mod, tc, typify.VERIFIERS_AFTER_INITIAL_TRANSFORMS)
+                controlflow.ModVerifyFunFallthrus(mod)
+
+            # the eval verifiers come last so a broken AST is still reported
+            # by the type verifiers first
+            if stage.value >= checker.COMPILE_STAGE.AFTER_EVAL.value:
+                cwast.VisitAstRecursivelyFused(mod, eval.MakeASTEvalVerifiers())
 
     if args.stop == phase_name:
         exit(0)
@@ -117,27 +133,35 @@ def PhaseInitialLowering(mod_topo_order: list[cwast.DefMod], tc: type_corpus.Typ
     #    print (key.name, " -> ", val.name)
     # ct_bool = tc.get_bool_canon_type()
     typeid_ct = tc.get_typeid_canon_type()
+    # compatible rewrite rules are fused into a single walk of the function
+    passes_all = cwast.ScheduleRewriteRules([
+        canonicalize.MakeImplicitConversionsExplicitRule(tc),
+        canonicalize.MakeReplaceExprIndexRule(tc),
+        canonicalize.MakeDesugarTaggedUnionComparisonsRule(),
+        canonicalize.MakeReplaceSpanCastWithSpanValRule(tc),
+    ])
+    passes_fun = cwast.ScheduleRewriteRules([
+        # note: ReplaceTaggedExprNarrow introduces new ExprIs nodes
+        canonicalize_union.MakeSimplifyTaggedExprNarrowRule(tc),
+        canonicalize.MakeDesugarExprIsRule(typeid_ct),
+        controlflow.FunEliminateDefer,
+        canonicalize.MakeRemoveUselessCastRule(),
+        # this creates TernaryOps
+        canonicalize.MakeCanonicalizeBoolExpressionsNotUsedForConditionalsRule(),
+        canonicalize.MakeDesugarExpr3Rule(),
+        canonicalize.MakeOptimizeKnownConditionalsRule(),
+    ])
     for mod in mod_topo_order:
         typify.ModStripTypeNodesRecursively(mod)
         for fun in mod.body_mod:
             canonicalize.FunReplaceConstExpr(fun, tc)
-            canonicalize.FunMakeImplicitConversionsExplicit(fun, tc)
-            canonicalize.FunReplaceExprIndex(fun, tc)
-            canonicalize.FunDesugarTaggedUnionComparisons(fun)
-            canonicalize.FunReplaceSpanCastWithSpanVal(fun, tc)
+            for p in passes_all:
+                p(fun)
             if not isinstance(fun, cwast.DefFun):
                 continue
 
-            # note: ReplaceTaggedExprNarrow introduces new ExprIs nodes
-            canonicalize_union.FunSimplifyTaggedExprNarrow(fun, tc)
-            canonicalize.FunDesugarExprIs(fun, typeid_ct)
-            controlflow.FunEliminateDefer(fun)
-            canonicalize.FunRemoveUselessCast(fun)
-            # this creates TernaryOps
-            canonicalize.FunCanonicalizeBoolExpressionsNotUsedForConditionals(
-                fun)
-            canonicalize.FunDesugarExpr3(fun)
-            canonicalize.FunOptimizeKnownConditionals(fun)
+            for p in passes_fun:
+                p(fun)
             if not fun.extern:
                 controlflow.FunAddMissingReturnStmts(fun)
 
@@ -188,16 +212,39 @@ def PhaseEliminateLargeArgs(mod_topo_order: list[cwast.DefMod], tc: type_corpus.
 
 
 def PhaseLegalize(mod_topo_order: list[cwast.DefMod], tc: type_corpus.TypeCorpus):
+    passes = cwast.ScheduleRewriteRules([
+        canonicalize.MakeCanonicalizeCompoundAssignmentsRule(),
+        controlflow.MakeCanonicalizeRemoveStmtCondRule(),
+        canonicalize.MakeRewriteComplexAssignmentsRule(),
+    ])
     for mod in mod_topo_order:
         for fun in mod.body_mod:
             if not isinstance(fun, cwast.DefFun):
                 continue
-            canonicalize.FunCanonicalizeCompoundAssignments(fun)
-            controlflow.FunCanonicalizeRemoveStmtCond(fun)
-            canonicalize.FunRewriteComplexAssignments(fun, tc)
+            for p in passes:
+                p(fun)
+
+
+def _EmitDefFunText(state, fun_index: int) -> str:
+    funs, ta = state
+    fp = io.StringIO()
+    emit_ir.EmitDefFun(funs[fun_index], ta, identifier.IdGenIR(), fp)
+    return fp.getvalue()
 
 
-def PhaseEmitCode(mod_topo_order: list[cwast.DefMod], ta: type_corpus.TargetArchConfig, fp):
+def PhaseEmitCode(mod_topo_order: list[cwast.DefMod], ta: type_corpus.TargetArchConfig, fp,
+                  jobs: int = 1):
+    """Emits the IR for the fully lowered mods
+
+    With jobs > 1 the DefFuns are emitted by forked worker processes which
+    inherit the AST. Emission only reads the AST and never inserts into the
+    TypeCorpus, so the workers only need to send back the text.
+
+    Only the emission is parallel. The lowering phases before it stay serial
+    because their results are not independent per function (inlining, the
+    constant pool, the span/union/large-arg replacement types and the
+    TypeCorpus typeids are whole program).
+    """
     sig_names: set[str] = set()
     for mod in mod_topo_order:
         for fun in mod.body_mod:
@@ -208,23 +255,41 @@ def PhaseEmitCode(mod_topo_order: list[cwast.DefMod], ta: type_corpus.TargetArch
                     emit_ir.EmitFunctionHeader(sn, "SIGNATURE", fun.x_type, fp)
                     sig_names.add(sn)
 
+    fun_texts = None
+    if jobs > 1:
+        funs = [node for mod in mod_topo_order for node in mod.body_mod
+                if isinstance(node, cwast.DefFun)]
+        fun_texts = parallel.ForkedMap(_EmitDefFunText, (funs, ta), list(range(len(funs))), jobs)
+
     for mod in mod_topo_order:
         for node in mod.body_mod:
             if isinstance(node, cwast.DefGlobal):
                 emit_ir.EmitDefGlobal(node, ta, fp)
         for node in mod.body_mod:
             if isinstance(node, cwast.DefFun):
-                emit_ir.EmitDefFun(node, ta, identifier.IdGenIR(), fp)
+                if fun_texts:
+                    fp.write(next(fun_texts))
+                else:
+                    emit_ir.EmitDefFun(node, ta, identifier.IdGenIR(), fp)
+
 
+def main(argv: Optional[list[str]] = None, read_mod_fun: Optional[Callable] = None) -> int:
+    """Runs the frontend with the given command line
 
-def main() -> int:
+    `read_mod_fun` can be used to override how modules are read, see
+    mod_pool.ReadModulesRecursively.
+    """
     parser = argparse.ArgumentParser(description='cwerg frontend')
     parser.add_argument("-shake_tree",
                         action="store_true", help='remove unreachable functions')
     parser.add_argument(
         '-stdlib', help='path to stdlib directory', default="./Lib")
+    parser.add_argument(
+        '-mod_cache_dir', help='directory for caching parsed modules across invocations')
     parser.add_argument(
         '-arch', help='architecture to generated IR for', default="")
+    parser.add_argument('-binary_ir', action="store_true",
+                        help='emit binary IR (see IR/binary_ir.py) instead of text')
     parser.add_argument(
         '-dump_ast_html', help='stop at the given stage and dump ast in html format')
     parser.add_argument(
@@ -235,21 +300,34 @@ def main() -> int:
         '-stop', help='stop at the given stage')
     parser.add_argument(
         '-emit_stats', help='stop at the given stage and emit stats')
+    parser.add_argument('-jobs', type=int, default=1,
+                        help='number of processes used for per function IR emission '
+                        '(the lowering phases stay serial)')
+    parser.add_argument(
+        '-timing_report', help='write per phase timings (Chrome trace json)')
     parser.add_argument('files', metavar='F', type=str, nargs='+',
                         help='an input source file')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     logging.basicConfig(level=logging.WARN)
+    if args.timing_report:
+        timing.Enable()
     # typify.logger.setLevel(logging.INFO)
     logger.info("Start Parsing")
     assert len(args.files) == 2
-    fout = sys.stdout if args.files[1] == "-" else open(args.files[1], "w")
+    if args.binary_ir:
+        fout = binary_ir.Writer(
+            sys.stdout.buffer if args.files[1] == "-" else open(args.files[1], "wb"))
+    else:
+        fout = sys.stdout if args.files[1] == "-" else open(args.files[1], "w")
     fn = args.files[0]
     fn, ext = os.path.splitext(fn)
     assert ext in (".cw", ".cws")
     main = str(pathlib.Path(fn).resolve())
+    if read_mod_fun is None and args.mod_cache_dir:
+        read_mod_fun = mod_pool.ModCache(pathlib.Path(args.mod_cache_dir))
     mp = mod_pool.ReadModulesRecursively(
-        pathlib.Path(args.stdlib), [main], add_builtin=True)
+        pathlib.Path(args.stdlib), [main], add_builtin=True, read_mod_fun=read_mod_fun)
     eliminated_nodes: set[Any] = set()
     eliminated_nodes.add(cwast.Import)
     eliminated_nodes.add(cwast.ModParam)
@@ -388,8 +466,12 @@ def main() -> int:
     SanityCheckMods("after_name_cleanup", checker.COMPILE_STAGE.AFTER_DESUGAR,
                     args,
                     mod_topo_order, tc, eliminated_nodes)
-    PhaseEmitCode(mod_topo_order, ta, fout)
-
+    with timing.Span("emit_code"):
+        PhaseEmitCode(mod_topo_order, ta, fout, args.jobs)
+    if args.binary_ir:
+        fout.Close()
+    if args.timing_report:
+        timing.WriteReport(args.timing_report)
     return 0
 
 
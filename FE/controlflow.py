@@ -159,7 +159,7 @@ def FunEliminateDefer(fun: cwast.DefFun):
     _EliminateDeferRecursively(fun, [])
 
 
-def FunCanonicalizeRemoveStmtCond(fun: cwast.DefFun):
+def MakeCanonicalizeRemoveStmtCondRule() -> cwast.RewriteRule:
     """Convert StmtCond to nested StmtIf"""
     def replacer(node, _parent) -> Optional[list[Any]]:
         if not isinstance(node, cwast.StmtCond):
@@ -175,7 +175,13 @@ def FunCanonicalizeRemoveStmtCond(fun: cwast.DefFun):
                                     out, x_srcloc=case.x_srcloc)]
         return out
 
-    cwast.MaybeReplaceAstRecursivelyWithParentPost(fun, replacer)
+    return cwast.RewriteRule("CanonicalizeRemoveStmtCond", replacer, (cwast.StmtCond,),
+                             creates=(cwast.StmtIf,))
+
+
+def FunCanonicalizeRemoveStmtCond(fun: cwast.DefFun):
+    """Convert StmtCond to nested StmtIf"""
+    cwast.ApplyRewriteRules(fun, [MakeCanonicalizeRemoveStmtCondRule()])
 
 
 def FunAddMissingReturnStmts(fun: cwast.DefFun):
@@ -40,13 +40,17 @@ BUILT_IN_EXPR_MACROS = set([
 ALL_BUILT_IN_MACROS = BUILT_IN_STMT_MACROS | BUILT_IN_EXPR_MACROS
 
 
-@dataclasses.dataclass(eq=True, frozen=True)
+@dataclasses.dataclass(eq=True, frozen=True, slots=True)
 class NAME:
     name: str
 
     @staticmethod
     def Make(s) -> "NAME":
-        return NAME(sys.intern(s))
+        out = _NAMES.get(s)
+        if out is None:
+            out = NAME(sys.intern(s))
+            _NAMES[out.name] = out
+        return out
 
     def IsMacroCall(self):
         return self.name.endswith(MACRO_CALL_SUFFIX)
@@ -72,6 +76,8 @@ class NAME:
         return f"{self.name}"
 
 
+_NAMES: dict[str, NAME] = {}
+
 EMPTY_NAME = NAME("")
 
 ############################################################
@@ -803,7 +809,315 @@ def _CheckNodeFieldOrder(cls):
             assert optionals + flags + xs == 0
 
 
+# x_ fields which are set on few nodes only. Rather than a slot in
+# every instance they get an entry in a side table (field -> {node: value})
+# for the nodes where they differ from the default.
+# Note: such an entry keeps the node alive until the field is reset.
+_X_SIDE_TABLE: dict[str, dict[Any, Any]] = {
+    "x_import": {}, "x_poly_mod": {}, "x_module": {}, "x_symtab": {}}
+
+
+def _MakeSideTableProperty(field: str, default: Any):
+    table = _X_SIDE_TABLE[field]
+
+    def getter(node):
+        return table.get(node, default)
+
+    def setter(node, val):
+        if val is default:
+            table.pop(node, None)
+        else:
+            table[node] = val
+
+    return property(getter, setter)
+
+
+def _NodeGetState(node):
+    return [getattr(node, f) for f in node._ALL_FIELD_NAMES]
+
+
+def _NodeSetState(node, state):
+    for f, val in zip(node._ALL_FIELD_NAMES, state):
+        setattr(node, f, val)
+
+
+def _MakeSlottedClass(cls: Any):
+    """Re-creates the dataclass `cls` with a slot for each field
+
+    This avoids a per instance __dict__ which is where most of the AST memory
+    would go otherwise.
+    """
+    fields = dataclasses.fields(cls)
+    names = tuple(fd.name for fd in fields)
+    cls_dict = dict(cls.__dict__)
+    for f in names:
+        # the defaults are baked into __init__ and would clash with the slots
+        cls_dict.pop(f, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    cls_dict["__slots__"] = tuple(f for f in names if f not in _X_SIDE_TABLE)
+    cls_dict["_ALL_FIELD_NAMES"] = names
+    cls_dict["__getstate__"] = _NodeGetState
+    cls_dict["__setstate__"] = _NodeSetState
+    out = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    for fd in fields:
+        if fd.name in _X_SIDE_TABLE:
+            assert fd.default is not dataclasses.MISSING
+            setattr(out, fd.name, _MakeSideTableProperty(fd.name, fd.default))
+    return out
+
+
+# Precompiled per node class helpers for the AST walkers (see VisitAstRecursively)
+_CHILDREN_REVERSED: dict[Any, Any] = {}
+
+
+def _MakeChildrenReversedAccessor(node_fields: list[NFD]):
+    """Generates a function returning all children of a node in reverse order
+
+    e.g. `lambda n: [n.body, *n.params[::-1]]`, this is exactly the order in
+    which they need to be pushed onto the stack of a pre-order walker.
+    Returns None for node classes without children.
+    """
+    if not node_fields:
+        return None
+    parts = []
+    for nfd in reversed(node_fields):
+        if nfd.kind is NFK.NODE:
+            parts.append(f"n.{nfd.name}")
+        else:
+            parts.append(f"*n.{nfd.name}[::-1]")
+    return eval(f"lambda n: [{', '.join(parts)}]")
+
+
+class _WalkerFrames:
+    """Per node class generator functions ("frames") for one kind of AST walk
+
+    The frame of a class is the body of the recursive walker for that class
+    with the fields unrolled and the recursive calls replaced by `yield child`.
+    The driver (_RunWalkerFrames) keeps the suspended frames on an explicit stack.
+
+    The code templates use {f} for the field name, `args` for the walker
+    specific arguments, `nfd` for the NFD of the field and `frames` for the
+    table itself (frames[cls] is None for classes without children).
+    `scope_enter`/`scope_exit` code brackets list fields in NEW_SCOPE_FIELDS.
+    """
+
+    def __init__(self, node_code: str, list_code: str, prologue: str = "",
+                 scope_enter: str = "", scope_exit: str = ""):
+        self.node_code = node_code
+        self.list_code = list_code
+        self.prologue = prologue
+        self.scope_enter = scope_enter
+        self.scope_exit = scope_exit
+        self.frames: dict[Any, Any] = {}
+
+    def Add(self, cls: Any):
+        if not cls.NODE_FIELDS:
+            self.frames[cls] = None
+            return
+        params = ["node", "args", "frames=frames"]
+        lines = [self.prologue]
+        ns: dict[str, Any] = {"frames": self.frames}
+        for nfd in cls.NODE_FIELDS:
+            f = nfd.name
+            ns[f"nfd_{f}"] = nfd
+            params.append(f"nfd_{f}=nfd_{f}")
+            if nfd.kind is NFK.NODE:
+                code = self.node_code
+            elif f in NEW_SCOPE_FIELDS:
+                code = self.scope_enter + self.list_code + self.scope_exit
+            else:
+                code = self.list_code
+            lines.append(code.replace("nfd", f"nfd_{f}").format(f=f))
+        body = "\n".join(lines)
+        body = "\n".join("    " + line for line in body.splitlines() if line.strip())
+        exec(f"def frame({', '.join(params)}):\n{body}", globals(), ns)
+        self.frames[cls] = ns["frame"]
+
+
+def _RunWalkerFrames(frames: dict[Any, Any], node, args):
+    frame = frames[node.__class__]
+    if frame is None:
+        return
+    stack = [frame(node, args)]
+    pop = stack.pop
+    append = stack.append
+    while stack:
+        for child in stack[-1]:
+            append(frames[child.__class__](child, args))
+            break
+        else:
+            pop()
+
+
+_FRAMES_WITH_PARENT = _WalkerFrames("""
+child = node.{f}
+if not args(child, node) and frames[child.__class__]:
+    yield child
+""", """
+for child in node.{f}:
+    if not args(child, node) and frames[child.__class__]:
+        yield child
+""")
+
+_FRAMES_WITH_SCOPE_TRACKING = _WalkerFrames("""
+child = node.{f}
+if not visitor(child, node) and frames[child.__class__]:
+    yield child
+""", """
+for child in node.{f}:
+    if not visitor(child, node) and frames[child.__class__]:
+        yield child
+""", prologue="visitor, scope_enter, scope_exit = args",
+    scope_enter="scope_enter(node)\n", scope_exit="\nscope_exit(node)")
+
+_FRAMES_WITH_FIELD = _WalkerFrames("""
+child = node.{f}
+if not args(child, nfd) and frames[child.__class__]:
+    yield child
+""", """
+for child in node.{f}:
+    if not args(child, nfd) and frames[child.__class__]:
+        yield child
+""")
+
+_FRAMES_PRE_AND_POST = _WalkerFrames("""
+child = node.{f}
+if not visitor_pre(child):
+    if frames[child.__class__]:
+        yield child
+    visitor_post(child)
+""", """
+for child in node.{f}:
+    if not visitor_pre(child):
+        if frames[child.__class__]:
+            yield child
+        visitor_post(child)
+""", prologue="visitor_pre, visitor_post = args")
+
+_FRAMES_POST = _WalkerFrames("""
+child = node.{f}
+if frames[child.__class__]:
+    yield child
+args(child)
+""", """
+for child in node.{f}:
+    if frames[child.__class__]:
+        yield child
+    args(child)
+""")
+
+_FRAMES_WITH_PARENT_POST = _WalkerFrames("""
+child = node.{f}
+if frames[child.__class__]:
+    yield child
+args(child, node)
+""", """
+for child in node.{f}:
+    if frames[child.__class__]:
+        yield child
+    args(child, node)
+""")
+
+# frames yield (child, visitors still active for the child)
+_FRAMES_FUSED = _WalkerFrames("""
+child = node.{f}
+remaining = args
+for v in args:
+    if v(child, node, nfd):
+        remaining = tuple(x for x in remaining if x is not v)
+if remaining and frames[child.__class__]:
+    yield child, remaining
+""", """
+for child in node.{f}:
+    remaining = args
+    for v in args:
+        if v(child, node, nfd):
+            remaining = tuple(x for x in remaining if x is not v)
+    if remaining and frames[child.__class__]:
+        yield child, remaining
+""")
+
+_FRAMES_REPLACE = _WalkerFrames("""
+child = node.{f}
+new_child = args(child, node)
+if new_child:
+    node.{f} = new_child
+elif frames[child.__class__]:
+    yield child
+""", """
+new_children = []
+for child in node.{f}:
+    new_child = args(child, node)
+    if isinstance(new_child, list):
+        new_children += new_child
+    elif new_child is None:
+        new_children.append(child)
+        if frames[child.__class__]:
+            yield child
+    else:
+        new_children.append(new_child)
+node.{f} = new_children
+""")
+
+_REPLACE_POST_NODE_CODE = """
+child = node.{f}
+if frames[child.__class__]:
+    yield child
+new_child = args(child, node)
+assert not isinstance(new_child, list)
+if new_child is not None:
+    node.{f} = new_child
+"""
+
+_REPLACE_POST_LIST_CODE = """
+new_children = []
+for child in node.{f}:
+    if frames[child.__class__]:
+        yield child
+    new_child = args(child, node)
+    if new_child is None:
+        new_children.append(child)
+    elif isinstance(new_child, list):
+        for x in new_child:
+            assert not isinstance(x, list)
+        new_children += new_child
+    else:
+        new_children.append(new_child)
+node.{f} = new_children
+"""
+
+_FRAMES_REPLACE_WITH_PARENT_POST = _WalkerFrames(
+    _REPLACE_POST_NODE_CODE, _REPLACE_POST_LIST_CODE)
+
+_FRAMES_REPLACE_POST = _WalkerFrames(
+    _REPLACE_POST_NODE_CODE.replace("args(child, node)", "args(child)"),
+    _REPLACE_POST_LIST_CODE.replace("args(child, node)", "args(child)"))
+
+# frames run on a shallow clone whose children are replaced by clones
+_FRAMES_CLONE = _WalkerFrames("""
+child = _CloneNode(node.{f}, symbol_map, target_map)
+node.{f} = child
+if frames[child.__class__]:
+    yield child
+""", """
+clones = []
+for child in node.{f}:
+    child = _CloneNode(child, symbol_map, target_map)
+    clones.append(child)
+    if frames[child.__class__]:
+        yield child
+node.{f} = clones
+""", prologue="symbol_map, target_map = args")
+
+_ALL_WALKER_FRAMES = [_FRAMES_WITH_PARENT, _FRAMES_WITH_SCOPE_TRACKING, _FRAMES_WITH_FIELD,
+                      _FRAMES_PRE_AND_POST, _FRAMES_POST, _FRAMES_WITH_PARENT_POST,
+                      _FRAMES_FUSED, _FRAMES_REPLACE, _FRAMES_REPLACE_WITH_PARENT_POST,
+                      _FRAMES_REPLACE_POST, _FRAMES_CLONE]
+
+
 def NodeCommon(cls: Any):
+    cls = _MakeSlottedClass(cls)
     cls.__eq__ = lambda a, b: id(a) == id(b)
     cls.__hash__ = lambda a: id(a)
 
@@ -849,6 +1163,9 @@ def NodeCommon(cls: Any):
                 cls.STR_FIELDS.append(nfd)
             else:
                 cls.KIND_FIELDS.append(nfd)
+    _CHILDREN_REVERSED[cls] = _MakeChildrenReversedAccessor(cls.NODE_FIELDS)
+    for walker_frames in _ALL_WALKER_FRAMES:
+        walker_frames.Add(cls)
     return cls
 
 ############################################################
@@ -872,12 +1189,17 @@ def align(x, a):
     return (x + a - 1) // a * a
 
 
-@dataclasses.dataclass()
+@dataclasses.dataclass(eq=False)
 class CanonType:
-    """Canonical Type"""
+    """Canonical Type
+
+    CanonTypes are interned by the TypeCorpus so equality and hashing
+    are by identity.
+    """
     # type of node, e.g. DefRec, TypeBase, TypeUnion, TypeSpan, etc.
     node: Any
-    name: str
+    # None for structural types whose name is rendered on demand, see `name`
+    _name: Optional[str]
     #
     mut: bool = False
     dim: int = -1
@@ -897,9 +1219,30 @@ class CanonType:
     ir_regs: o.DK = o.DK.MEM
     typeid: int = -1
     union_kind: UnionKind = UnionKind.INVALID
-
-    def __hash__(self):
-        return hash(self.name)
+    # cache for union_member_set()
+    _member_set: Optional[frozenset["CanonType"]] = None
+
+    @property
+    def name(self) -> str:
+        if self._name is None:
+            self._name = self._RenderName()
+        return self._name
+
+    def _RenderName(self) -> str:
+        n = self.node
+        if n is TypePtr:
+            return f"ptr_mut<{self.children[0].name}>" if self.mut else f"ptr<{self.children[0].name}>"
+        elif n is TypeSpan:
+            return f"span_mut<{self.children[0].name}>" if self.mut else f"span<{self.children[0].name}>"
+        elif n is TypeVec:
+            return f"vec<{self.dim},{self.children[0].name}>"
+        elif n is TypeUnion:
+            extra = "_untagged" if self.untagged else ""
+            return f"sum{extra}<{','.join(x.name for x in self.children)}>"
+        elif n is TypeFun:
+            return f"fun<{','.join(x.name for x in self.children)}>"
+        else:
+            assert False, f"type without name {n}"
 
     # we need to sort the children of Unions
     def __lt__(self, other):
@@ -978,12 +1321,18 @@ class CanonType:
         return ct in self.children
 
     def tagged_union_contains(self, ct) -> bool:
-        return self.node is TypeUnion and not self.untagged and ct in self.children
+        return self.node is TypeUnion and not self.untagged and ct in self.union_member_set()
 
     def union_member_types(self) -> list["CanonType"]:
         assert self.is_union()
         return self.children
 
+    def union_member_set(self) -> frozenset["CanonType"]:
+        assert self.is_union()
+        if self._member_set is None:
+            self._member_set = frozenset(self.children)
+        return self._member_set
+
     def is_vec(self) -> bool:
         return self.node is TypeVec
 
@@ -1076,16 +1425,36 @@ class CanonType:
 NO_TYPE = CanonType(None, "@invali@d")
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class SrcLoc:
     filename: str
     # TODO: add col
     lineno: int
 
+    @staticmethod
+    def Make(filename: str, lineno: int) -> "SrcLoc":
+        """Returns the (shared) SrcLoc for the given line
+
+        There is one per line rather than one per token or node.
+        """
+        key = (filename, lineno)
+        sl = _SRCLOCS.get(key)
+        if sl is None:
+            sl = SrcLoc(filename, lineno)
+            _SRCLOCS[key] = sl
+        return sl
+
+    def __reduce__(self):
+        # unpickled SrcLocs get interned again
+        return (SrcLoc.Make, (self.filename, self.lineno))
+
     def __str__(self):
         return f"{self.filename}:{self.lineno}"
 
 
+_SRCLOCS: dict[tuple[str, int], SrcLoc] = {}
+
+
 INVALID_SRCLOC: Final[SrcLoc] = SrcLoc("@unknown@", 0)
 SRCLOC_GENERATED: Final[SrcLoc] = SrcLoc("@generated@", 0)
 
@@ -2860,112 +3229,93 @@ TOP_LEVEL_EXPRESSION_NODES = (ExprCall, StmtReturn, StmtCompoundAssignment, Stmt
 ############################################################
 
 
-def VisitAstRecursively(node, visitor):
-    if visitor(node):
-        return
+# All walkers below use an explicit stack instead of recursion so
+# deeply nested ASTs cannot exhaust the Python stack.
+# The order in which nodes are visited (and replacers are called) is the
+# same as for the straight forward recursive formulation.
 
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursively(child, visitor)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursively(child, visitor)
+
+def VisitAstRecursively(node, visitor):
+    """Pre-order walk, visitor(node) returning True skips the children of node"""
+    stack = [node]
+    pop = stack.pop
+    extend = stack.extend
+    children_reversed = _CHILDREN_REVERSED
+    while stack:
+        node = pop()
+        if visitor(node):
+            continue
+        children = children_reversed[node.__class__]
+        if children:
+            extend(children(node))
 
 
 def VisitAstRecursivelyWithScopeTracking(node, visitor, scope_enter, scope_exit, parent=None):
+    """Pre-order walk with scope_enter(node)/scope_exit(node) calls bracketing
+    the list fields in NEW_SCOPE_FIELDS"""
     if visitor(node, parent):
         return
-
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyWithScopeTracking(
-                child, visitor, scope_enter, scope_exit, node)
-        else:
-            if nfd.name in NEW_SCOPE_FIELDS:
-                scope_enter(node)
-            for child in getattr(node, f):
-                VisitAstRecursivelyWithScopeTracking(
-                    child, visitor, scope_enter, scope_exit, node)
-            if nfd.name in NEW_SCOPE_FIELDS:
-                scope_exit(node)
+    _RunWalkerFrames(_FRAMES_WITH_SCOPE_TRACKING.frames, node,
+                     (visitor, scope_enter, scope_exit))
 
 
 def VisitAstRecursivelyWithField(node, visitor, nfd=None):
+    """Pre-order walk passing the NFD of the field containing the node"""
     if visitor(node, nfd):
         return
-
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyWithField(child, visitor, nfd)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursivelyWithField(child, visitor, nfd)
+    _RunWalkerFrames(_FRAMES_WITH_FIELD.frames, node, visitor)
 
 
 def VisitAstRecursivelyPreAndPost(node, visitor_pre, visitor_post):
+    """visitor_post(node) is not called if visitor_pre(node) returns True"""
     if visitor_pre(node):
         return
-
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyPreAndPost(child, visitor_pre, visitor_post)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursivelyPreAndPost(
-                    child, visitor_pre, visitor_post)
-
+    _RunWalkerFrames(_FRAMES_PRE_AND_POST.frames, node, (visitor_pre, visitor_post))
     visitor_post(node)
 
 
 def VisitAstRecursivelyWithParent(node, visitor, parent):
+    """Pre-order walk, visitor(node, parent) returning True skips the children of node"""
     if visitor(node, parent):
         return
-
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyWithParent(child, visitor, node)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursivelyWithParent(
-                    child, visitor, node)
+    _RunWalkerFrames(_FRAMES_WITH_PARENT.frames, node, visitor)
 
 
 def VisitAstRecursivelyPost(node, visitor):
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyPost(child, visitor)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursivelyPost(child, visitor)
-
+    """Post-order walk"""
+    _RunWalkerFrames(_FRAMES_POST.frames, node, visitor)
     visitor(node)
 
 
 def VisitAstRecursivelyWithParentPost(node, visitor, parent):
+    """Post-order walk calling visitor(node, parent)"""
+    _RunWalkerFrames(_FRAMES_WITH_PARENT_POST.frames, node, visitor)
+    visitor(node, parent)
 
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            VisitAstRecursivelyWithParentPost(child, visitor, node)
-        else:
-            for child in getattr(node, f):
-                VisitAstRecursivelyWithParentPost(
-                    child, visitor, node)
 
-    visitor(node, parent)
+def VisitAstRecursivelyFused(node, visitors, parent=None, nfd=None):
+    """Pre-order walk calling each of the visitor(node, parent, nfd) for every node
+
+    This is equivalent to running the (independent) visitors one after the other
+    with a walk each but only needs a single traversal.
+    A visitor returning True skips the children of the node for that visitor only.
+    """
+    remaining = tuple(visitors)
+    for v in visitors:
+        if v(node, parent, nfd):
+            remaining = tuple(x for x in remaining if x is not v)
+    frames = _FRAMES_FUSED.frames
+    if not remaining or frames[node.__class__] is None:
+        return
+    stack = [frames[node.__class__](node, remaining)]
+    pop = stack.pop
+    append = stack.append
+    while stack:
+        for child, remaining in stack[-1]:
+            append(frames[child.__class__](child, remaining))
+            break
+        else:
+            pop()
 
 
 def MaybeReplaceAstRecursively(node, replacer):
@@ -2973,85 +3323,159 @@ def MaybeReplaceAstRecursively(node, replacer):
 
     If a node is being replace we do not recurse into its children.
     """
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            new_child = replacer(child, node)
-            if new_child:
-                setattr(node, f, new_child)
-            else:
-                MaybeReplaceAstRecursively(child, replacer)
-        else:
-            children = getattr(node, f)
-            new_children = []
-            for n, child in enumerate(children):
-                new_child = replacer(child, node)
-                if isinstance(new_child, list):
-                    new_children += new_child
-                elif new_child is None:
-                    new_children.append(child)
-                    MaybeReplaceAstRecursively(child, replacer)
-                else:
-                    new_children.append(new_child)
-            setattr(node, f, new_children)
+    _RunWalkerFrames(_FRAMES_REPLACE.frames, node, replacer)
 
 
 def MaybeReplaceAstRecursivelyPost(node, replacer):
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            MaybeReplaceAstRecursivelyPost(child, replacer)
-            new_child = replacer(child)
-            assert not isinstance(new_child, list)
-            if new_child is not None:
-                setattr(node, f, new_child)
-        else:
-            children = getattr(node, f)
-            new_children = []
-            for n, child in enumerate(children):
-                MaybeReplaceAstRecursivelyPost(child, replacer)
-                new_child = replacer(child)
-                if new_child is None:
-                    new_children.append(child)
-                elif isinstance(new_child, list):
-                    for x in new_child:
-                        assert not isinstance(x, list)
-                    new_children += new_child
-                else:
-                    new_children.append(new_child)
-            setattr(node, f, new_children)
+    """Post-order replacement, replacer(node) returns None (keep the node), a node or
+    a list of nodes (list fields only). The root node will not be replaced."""
+    _RunWalkerFrames(_FRAMES_REPLACE_POST.frames, node, replacer)
 
 
 def MaybeReplaceAstRecursivelyWithParentPost(node, replacer):
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            child = getattr(node, f)
-            MaybeReplaceAstRecursivelyWithParentPost(child, replacer)
-            new_child = replacer(child, node)
-            assert not isinstance(new_child, list)
-            if new_child is not None:
-                setattr(node, f, new_child)
+    """Like MaybeReplaceAstRecursivelyPost but calls replacer(node, parent)"""
+    _RunWalkerFrames(_FRAMES_REPLACE_WITH_PARENT_POST.frames, node, replacer)
+
+
+@dataclasses.dataclass(frozen=True)
+class RewriteRule:
+    """A post-order rewrite of the nodes of class `kinds`
+
+    replacer(node, parent) has the same contract as for
+    MaybeReplaceAstRecursivelyWithParentPost (but is only called for `kinds`)
+    and must be idempotent, i.e. must not rewrite its own result again.
+    It is also called for the root (with parent None) which cannot be replaced.
+
+    `creates` lists the classes of nodes that a rewrite creates or modifies
+    below the root of its result.
+    `parent_kinds` lists the classes of parents the decision of the rule depends on.
+
+    The rules are fused by ScheduleRewriteRules.
+    """
+    name: str
+    replacer: Any
+    kinds: tuple[Any, ...]
+    creates: tuple[Any, ...] = ()
+    parent_kinds: tuple[Any, ...] = ()
+
+
+def _RulesCanShareWalk(earlier: RewriteRule, later: RewriteRule) -> bool:
+    # `later` would not see the nodes `earlier` creates inside its results
+    if set(later.kinds) & set(earlier.creates):
+        return False
+    # `later` would see the parents before `earlier` rewrites them
+    if set(later.parent_kinds) & set(earlier.kinds):
+        return False
+    return True
+
+
+# Set to True to verify that the rewrite rules only create the nodes they declare
+# (this makes the rewrites quadratic in the nesting depth)
+CHECK_REWRITE_RULES = False
+
+
+def _CheckRewriteRuleCreates(rule: RewriteRule, old_nodes: list[Any], new_node):
+    old_ids = set(id(n) for n in old_nodes)
+
+    def visitor(n):
+        if id(n) in old_ids:
+            return True
+        assert n.__class__ in rule.creates, (
+            f"rule {rule.name} created undeclared {n.__class__.__name__}")
+
+    for root in (new_node if isinstance(new_node, list) else [new_node]):
+        # the roots of the result are rewritten by the later rules anyway
+        if id(root) in old_ids:
+            continue
+        children = _CHILDREN_REVERSED[root.__class__]
+        for child in (children(root) if children else []):
+            VisitAstRecursively(child, visitor)
+
+
+def _ApplyRewriteRules(node, parent, rules: list[RewriteRule], start: int):
+    for i in range(start, len(rules)):
+        rule = rules[i]
+        if node.__class__ not in rule.kinds:
+            continue
+        if CHECK_REWRITE_RULES:
+            old_nodes = []
+            VisitAstRecursively(node, old_nodes.append)
+        new_node = rule.replacer(node, parent)
+        if new_node is None:
+            continue
+        if CHECK_REWRITE_RULES:
+            _CheckRewriteRuleCreates(rule, old_nodes, new_node)
+        if not isinstance(new_node, list):
+            newer_node = _ApplyRewriteRules(new_node, parent, rules, i + 1)
+            return new_node if newer_node is None else newer_node
+        out = []
+        for x in new_node:
+            new_x = _ApplyRewriteRules(x, parent, rules, i + 1)
+            if new_x is None:
+                out.append(x)
+            elif isinstance(new_x, list):
+                out += new_x
+            else:
+                out.append(new_x)
+        return out
+    return None
+
+
+def _MakeRuleGroupPass(rules: list[RewriteRule]):
+    kinds = frozenset(k for r in rules for k in r.kinds)
+
+    def replacer(node, parent):
+        if node.__class__ not in kinds:
+            return None
+        return _ApplyRewriteRules(node, parent, rules, 0)
+
+    def fun_pass(node):
+        MaybeReplaceAstRecursivelyWithParentPost(node, replacer)
+        # the root is visited, too, but cannot be replaced
+        new_node = replacer(node, None)
+        assert new_node is None, f"cannot replace root {node}"
+
+    fun_pass.__name__ = "+".join(r.name for r in rules)
+    return fun_pass
+
+
+def ScheduleRewriteRules(passes: list[Any]) -> list[Any]:
+    """Fuses consecutive RewriteRules into as few walks as possible
+
+    `passes` contains RewriteRules and functions taking the root node. The
+    latter are barriers. The result is a list of functions taking the root node.
+    Running them in order has the same effect as running each of the `passes`
+    separately in order.
+
+    Within a walk each node is rewritten by all the rules (in order) before
+    its parent is processed.
+    """
+    out = []
+    group: list[RewriteRule] = []
+    for p in passes:
+        if isinstance(p, RewriteRule):
+            if all(_RulesCanShareWalk(r, p) for r in group):
+                group.append(p)
+                continue
+        if group:
+            out.append(_MakeRuleGroupPass(group))
+            group = []
+        if isinstance(p, RewriteRule):
+            group.append(p)
         else:
-            children = getattr(node, f)
-            new_children = []
-            for n, child in enumerate(children):
-                MaybeReplaceAstRecursivelyWithParentPost(child, replacer)
-                new_child = replacer(child, node)
-                if new_child is None:
-                    new_children.append(child)
-                elif isinstance(new_child, list):
-                    for x in new_child:
-                        assert not isinstance(x, list)
-                    new_children += new_child
-                else:
-                    new_children.append(new_child)
-            setattr(node, f, new_children)
+            out.append(p)
+    if group:
+        out.append(_MakeRuleGroupPass(group))
+    return out
 
 
-def CloneNodeRecursively(node, symbol_map, target_map):
+def ApplyRewriteRules(node, passes: list[Any]):
+    for p in ScheduleRewriteRules(passes):
+        p(node)
+
+
+def _CloneNode(node, symbol_map, target_map):
+    """Shallow copy of node with updated symbol and target links"""
     clone = dataclasses.replace(node)
     if isinstance(clone, DefVar):
         symbol_map[node] = clone
@@ -3064,16 +3488,13 @@ def CloneNodeRecursively(node, symbol_map, target_map):
     if NF.TARGET_ANNOTATED in clone.FLAGS:
         old_target = clone.x_target
         clone.x_target = target_map.get(old_target, old_target)
+    return clone
 
-    for nfd in node.__class__.NODE_FIELDS:
-        f = nfd.name
-        if nfd.kind is NFK.NODE:
-            setattr(clone, f, CloneNodeRecursively(
-                getattr(node, f), symbol_map, target_map))
-        else:
-            out = [CloneNodeRecursively(cc, symbol_map, target_map)
-                   for cc in getattr(node, f)]
-            setattr(clone, f, out)
+
+def CloneNodeRecursively(node, symbol_map, target_map):
+    clone = _CloneNode(node, symbol_map, target_map)
+    # the frames run on the clones whose fields still refer to the original children
+    _RunWalkerFrames(_FRAMES_CLONE.frames, clone, (symbol_map, target_map))
     return clone
 
 
@@ -0,0 +1,229 @@
+#!/bin/env python3
+
+import contextlib
+import io
+import logging
+import os
+import unittest
+
+from FE import compiler
+from FE import cwast
+from FE import parse
+
+logger = logging.getLogger(__name__)
+
+_DEPTH = 100000
+
+_TEST_MODS = ["Lib/fmt.cw", "Lib/flate.cw", "Lib/jpeg_decode.cw", "TestData/editor.cw"]
+
+# these exercise all the rewrite rules used by the compiler
+_REWRITE_TEST_MODS = ["LangTest/sum_tagged_test.cw", "LangTest/cond_test.cw",
+                      "LangTest/assign_test.cw", "LangTest/expr_test.cw"]
+
+
+def _ReadMod(fn: str) -> cwast.DefMod:
+    with open(fn, encoding="utf8") as fp:
+        return parse.ReadModFromStream(fp, fn, os.path.basename(fn)[:-3])
+
+
+def _Children(node):
+    for nfd in node.__class__.NODE_FIELDS:
+        if nfd.kind is cwast.NFK.NODE:
+            yield nfd, getattr(node, nfd.name)
+        else:
+            for child in getattr(node, nfd.name):
+                yield nfd, child
+
+
+# Straight forward recursive walkers serving as reference for the visit order
+def _RefPre(node, parent, nfd, visitor):
+    if visitor(node, parent, nfd):
+        return
+    for child_nfd, child in _Children(node):
+        _RefPre(child, node, child_nfd, visitor)
+
+
+def _RefPost(node, parent, visitor):
+    for _, child in _Children(node):
+        _RefPost(child, node, visitor)
+    visitor(node, parent)
+
+
+def _RefScopes(node, parent, log):
+    log.append(("visit", id(node), id(parent)))
+    for nfd in node.__class__.NODE_FIELDS:
+        if nfd.kind is cwast.NFK.NODE:
+            _RefScopes(getattr(node, nfd.name), node, log)
+            continue
+        if nfd.name in cwast.NEW_SCOPE_FIELDS:
+            log.append(("enter", id(node)))
+        for child in getattr(node, nfd.name):
+            _RefScopes(child, node, log)
+        if nfd.name in cwast.NEW_SCOPE_FIELDS:
+            log.append(("exit", id(node)))
+
+
+def _MakeChain(depth: int):
+    root = leaf = cwast.ValNum("1")
+    for _ in range(depth):
+        root = cwast.ExprParen(root)
+    return root, leaf
+
+
+class TestDeepNesting(unittest.TestCase):
+    """None of the walkers must be limited by the Python recursion limit"""
+
+    def setUp(self):
+        self.root, self.leaf = _MakeChain(_DEPTH)
+
+    def testVisitors(self):
+        self.assertEqual(cwast.NumberOfNodes(self.root), _DEPTH + 1)
+
+        pre = []
+        cwast.VisitAstRecursivelyWithParent(self.root, lambda n, p: pre.append(n), None)
+        self.assertIs(pre[0], self.root)
+        self.assertIs(pre[-1], self.leaf)
+
+        post = []
+        cwast.VisitAstRecursivelyPost(self.root, post.append)
+        self.assertIs(post[0], self.leaf)
+        self.assertIs(post[-1], self.root)
+
+        counts = [0, 0]
+
+        def count(i):
+            def visitor(_node, _parent, _nfd):
+                counts[i] += 1
+            return visitor
+
+        cwast.VisitAstRecursivelyFused(self.root, [count(0), count(1)])
+        self.assertEqual(counts, [_DEPTH + 1, _DEPTH + 1])
+
+    def testClone(self):
+        clone = cwast.CloneNodeRecursively(self.root, {}, {})
+        self.assertIsNot(clone, self.root)
+        self.assertEqual(cwast.NumberOfNodes(clone), _DEPTH + 1)
+
+    def testReplace(self):
+        def replacer(node):
+            if isinstance(node, cwast.ExprParen):
+                return node.expr
+            return None
+
+        # the root itself is never replaced
+        cwast.MaybeReplaceAstRecursivelyPost(self.root, replacer)
+        self.assertIs(self.root.expr, self.leaf)
+
+
+class TestVisitOrder(unittest.TestCase):
+    """The iterative walkers visit the nodes in the same order as the recursive ones"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mods = [_ReadMod(fn) for fn in _TEST_MODS]
+
+    def testPreOrder(self):
+        for mod in self.mods:
+            expected = []
+            _RefPre(mod, None, None,
+                    lambda n, p, f: expected.append((id(n), id(p), f)))
+
+            got = []
+            cwast.VisitAstRecursively(mod, lambda n: got.append(id(n)))
+            self.assertEqual(got, [x[0] for x in expected])
+
+            got = []
+            cwast.VisitAstRecursivelyWithParent(
+                mod, lambda n, p: got.append((id(n), id(p))), None)
+            self.assertEqual(got, [x[:2] for x in expected])
+
+            got = []
+            cwast.VisitAstRecursivelyWithField(
+                mod, lambda n, f: got.append(id(n)) or got.append(f))
+            self.assertEqual(got, [y for x in expected for y in (x[0], x[2])])
+
+    def testPostOrder(self):
+        for mod in self.mods:
+            expected = []
+            _RefPost(mod, None, lambda n, p: expected.append((id(n), id(p))))
+
+            got = []
+            cwast.VisitAstRecursivelyPost(mod, lambda n: got.append(id(n)))
+            self.assertEqual(got, [x[0] for x in expected])
+
+            got = []
+            cwast.VisitAstRecursivelyWithParentPost(
+                mod, lambda n, p: got.append((id(n), id(p))), None)
+            self.assertEqual(got, expected)
+
+            # the replacers are not called for the root
+            got = []
+            cwast.MaybeReplaceAstRecursivelyPost(mod, lambda n: got.append(id(n)))
+            self.assertEqual(got, [x[0] for x in expected[:-1]])
+
+    def testScopeTracking(self):
+        for mod in self.mods:
+            expected = []
+            _RefScopes(mod, None, expected)
+
+            got = []
+            cwast.VisitAstRecursivelyWithScopeTracking(
+                mod, lambda n, p: got.append(("visit", id(n), id(p))),
+                lambda n: got.append(("enter", id(n))),
+                lambda n: got.append(("exit", id(n))))
+            self.assertEqual(got, expected)
+
+    def testFusedMatchesSeparateWalks(self):
+        def make_visitor(log, prune_kinds):
+            def visitor(node, parent, nfd):
+                log.append((id(node), id(parent), nfd))
+                return isinstance(node, prune_kinds)
+            return visitor
+
+        # each visitor prunes differently, the pruning must not affect the others
+        prunes = [(), (cwast.DefFun,), (cwast.StmtIf, cwast.ExprCall), (cwast.DefMod,)]
+        for mod in self.mods:
+            expected = []
+            for prune_kinds in prunes:
+                log = []
+                _RefPre(mod, None, None, make_visitor(log, prune_kinds))
+                expected.append(log)
+
+            got = [[] for _ in prunes]
+            cwast.VisitAstRecursivelyFused(
+                mod, [make_visitor(log, p) for log, p in zip(got, prunes)])
+            self.assertEqual(got, expected)
+            self.assertEqual(len(got[3]), 1)
+
+
+class TestRewriteRuleScheduling(unittest.TestCase):
+    """Fusing the rewrite rules must not change the generated IR"""
+
+    def setUp(self):
+        self._can_share_walk = cwast._RulesCanShareWalk
+        cwast.CHECK_REWRITE_RULES = True
+
+    def tearDown(self):
+        cwast._RulesCanShareWalk = self._can_share_walk
+        cwast.CHECK_REWRITE_RULES = False
+
+    def _Compile(self, fn: str) -> str:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            compiler.main(["-arch", "x64", "-stdlib", "Lib", fn, "-"])
+        return out.getvalue()
+
+    def testFusedMatchesSequential(self):
+        for fn in _REWRITE_TEST_MODS:
+            fused = self._Compile(fn)
+            # every rule gets a walk of its own
+            cwast._RulesCanShareWalk = lambda earlier, later: False
+            sequential = self._Compile(fn)
+            cwast._RulesCanShareWalk = self._can_share_walk
+            self.assertIn(".fun main", fused)
+            self.assertTrue(fused == sequential, f"IR differs for {fn}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    unittest.main()
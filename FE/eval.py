@@ -837,15 +837,11 @@ def EvalRecursively(node) -> bool:
     return seen_change
 
 
-def VerifyASTEvalsRecursively(node):
-    """Make sure that everything that is partial evaluated as expected.
-
-    * sanity check EVAL_ANNOTATED nodes
-    * check const nodes
-    * check StaticAsserts"""
+def MakeASTEvalVerifiers() -> list[Any]:
+    """Returns the visitors used by VerifyASTEvalsRecursively for cwast.VisitAstRecursivelyFused"""
     is_const = False
 
-    def visitor(node: Any, parent: Any):
+    def visitor(node: Any, parent: Any, _nfd: Any):
         nonlocal is_const
         # logger.info(f"EVAL-VERIFY: {node}")
         if isinstance(node, cwast.ValUndef):
@@ -907,9 +903,7 @@ def VerifyASTEvalsRecursively(node):
                         #    node.x_srcloc, f"expected const node: {node} "
                         #    f"of type {node.x_type} inside {parent}")
 
-    cwast.VisitAstRecursivelyWithParent(node, visitor, None)
-
-    def visitor2(node: Any, parent: Any):
+    def visitor2(node: Any, parent: Any, _nfd: Any):
         if cwast.NF.EVAL_ANNOTATED not in node.FLAGS:
             return
         val = node.x_eval
@@ -922,7 +916,16 @@ def VerifyASTEvalsRecursively(node):
             assert isinstance(
                 parent, cwast.TypeVec), f"Unexpected parent for ValAuto: {parent}"
 
-    cwast.VisitAstRecursivelyWithParent(node, visitor2, None)
+    return [visitor, visitor2]
+
+
+def VerifyASTEvalsRecursively(node):
+    """Make sure that everything that is partial evaluated as expected.
+
+    * sanity check EVAL_ANNOTATED nodes
+    * check const nodes
+    * check StaticAsserts"""
+    cwast.VisitAstRecursivelyFused(node, MakeASTEvalVerifiers())
 
 
 def DecorateASTWithPartialEvaluation(mod_topo_order: list[cwast.DefMod]):
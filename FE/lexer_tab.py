@@ -412,7 +412,7 @@ class LexerRaw:
             self._current_line = self._fill_line()
 
     def _GetSrcLoc(self) -> cwast.SrcLoc:
-        return cwast.SrcLoc(self._fileamame, self._line_no)
+        return cwast.SrcLoc.Make(self._fileamame, self._line_no)
 
     def _fill_line(self):
         self._line_no += 1
@@ -4,7 +4,12 @@ import dataclasses
 import pathlib
 import logging
 import collections
+import hashlib
 import heapq
+import io
+import os
+import pickle
+import sys
 
 from FE import cwast
 from FE import parse_sexpr
@@ -13,6 +18,8 @@ from FE import parse
 
 from typing import Optional, Sequence, Any, Callable
 
+from Util import cache_io
+
 Path = pathlib.PurePath
 
 ModId = tuple[Path, ...]
@@ -149,15 +156,22 @@ class _ImportInfo:
         self.import_node = import_node
         # the normalized args are None initially because they have not been normalized
         self.normalized_args = import_node.args_mod
+        # the unresolved Id which stopped the last normalization attempt
+        self.blocked_on: Optional[cwast.Id] = None
 
     def HasBeenResolved(self) -> bool:
         return self.import_node.x_module != cwast.INVALID_MOD
 
+    def IsBlocked(self) -> bool:
+        """True if retrying TryToNormalizeModArgs is pointless"""
+        return self.blocked_on is not None and not self.blocked_on.x_symbol
+
     def TryToNormalizeModArgs(self) -> bool:
         for i, n in enumerate(self.normalized_args):
             while True:
                 x = _NormalizeModArgOneStep(n)
                 if not x:
+                    self.blocked_on = n
                     return False
                 elif x is n:
                     break
@@ -286,6 +300,120 @@ def _ReadMod(path: Path) -> cwast.DefMod:
     assert False, f"module {str(path)} does not exist"
 
 
+def _ModSourceFile(path: Path) -> str:
+    for ext in (EXTENSION_CW, EXTENSION_CWS):
+        fn = str(path) + ext
+        if pathlib.Path(fn).exists():
+            return fn
+    assert False, f"module {str(path)} does not exist"
+
+
+def _ParserFingerprint() -> bytes:
+    """Changes whenever the code producing or describing the parsed AST changes"""
+    h = hashlib.sha256()
+    fe_dir = pathlib.Path(__file__).parent
+    for name in ("cwast.py", "lexer_tab.py", "parse.py", "parse_sexpr.py"):
+        h.update((fe_dir / name).read_bytes())
+    h.update(sys.version.encode())
+    return h.digest()
+
+
+# module level singletons of cwast which are compared by identity (`is`) and
+# must hence survive a round trip through the cache
+_CWAST_SINGLETONS = ["EMPTY_NAME", "NO_TYPE", "INVALID_SRCLOC", "SRCLOC_GENERATED", "INVALID_MOD"]
+
+
+class _ModPickler(pickle.Pickler):
+
+    _SINGLETON_IDS = {id(getattr(cwast, name)): name for name in _CWAST_SINGLETONS}
+
+    def persistent_id(self, obj):
+        return self._SINGLETON_IDS.get(id(obj))
+
+
+class _ModUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        assert pid in _CWAST_SINGLETONS, f"unexpected persistent id {pid}"
+        return getattr(cwast, pid)
+
+
+class ModCache:
+    """On-disk cache of freshly parsed modules
+
+    Can be used as `read_mod_fun` for ReadModulesRecursively.
+    Entries are keyed by a hash of the module's source, its name and location
+    and of the parser itself, so stale entries are never used -
+    they are simply not found anymore.
+    Only the output of the parser is cached. Generic modules are specialized from
+    the cached (raw) module on every run since the specialization refers to
+    nodes of the importing modules.
+    """
+
+    def __init__(self, cache_dir: pathlib.Path, read_mod_fun: Callable = _ReadMod):
+        self._cache_dir = cache_dir
+        self._read_mod_fun = read_mod_fun
+        self._fingerprint = _ParserFingerprint()
+        self.hits = 0
+        self.misses = 0
+
+    def _CacheFile(self, path: Path, fn: str) -> pathlib.Path:
+        h = hashlib.sha256(self._fingerprint)
+        h.update(str(path).encode())
+        h.update(b"\0")
+        h.update(pathlib.Path(fn).read_bytes())
+        return self._cache_dir / (h.hexdigest() + ".pickle")
+
+    def __call__(self, path: Path) -> cwast.DefMod:
+        cache_file = self._CacheFile(path, _ModSourceFile(path))
+        try:
+            with open(cache_file, "rb") as fp:
+                mod = _ModUnpickler(fp).load()
+            self.hits += 1
+            logger.info("module cache hit for %s", path)
+            return mod
+        except Exception:
+            # missing or unreadable, e.g. truncated by a crash before the rename
+            pass
+        self.misses += 1
+        mod = self._read_mod_fun(path)
+        buf = io.BytesIO()
+        try:
+            _ModPickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump(mod)
+        except RecursionError:
+            logger.warning("module too deep to be cached: %s", path)
+            return mod
+        cache_io.WriteCacheFile(cache_file, buf.getvalue())
+        return mod
+
+
+class ModPreloader:
+    """Keeps freshly parsed modules in memory for use by forked processes
+
+    Can be used as `read_mod_fun` for ReadModulesRecursively but only in a
+    process forked after Preload() was called: the frontend modifies the modules
+    it reads, so every process must get its own (copy-on-write) copy.
+    Modules whose source has changed since preloading are read again.
+    """
+
+    def __init__(self, read_mod_fun: Callable = _ReadMod):
+        self._read_mod_fun = read_mod_fun
+        self._mods: dict[Path, tuple[int, cwast.DefMod]] = {}
+        self._pid = os.getpid()
+
+    def Preload(self, paths: Sequence[Path]):
+        for path in paths:
+            mtime = os.stat(_ModSourceFile(path)).st_mtime_ns
+            self._mods[path] = (mtime, self._read_mod_fun(path))
+
+    def __call__(self, path: Path) -> cwast.DefMod:
+        assert os.getpid() != self._pid, "preloaded modules must only be used by forked processes"
+        entry = self._mods.pop(path, None)
+        if entry is not None and entry[0] == os.stat(_ModSourceFile(path)).st_mtime_ns:
+            return entry[1]
+        return self._read_mod_fun(path)
+
+
 class _ModPoolState:
     def __init__(self):
         # all modules keyed by ModHandle
@@ -358,7 +486,8 @@ def _ResolvePolyMods(mods: list[cwast.DefMod]):
 
 
 def ReadModulesRecursively(root: Path,
-                           seed_modules: list[str], add_builtin: bool, read_mod_fun=_ReadMod) -> ModPool:
+                           seed_modules: list[str], add_builtin: bool,
+                           read_mod_fun: Optional[Callable] = None) -> ModPool:
     """Reads all the seed_modules and their imports, also instantiates generic modules
 
     Will set the following Node fields of all read Modules as a side-effect:
@@ -372,6 +501,8 @@ def ReadModulesRecursively(root: Path,
     After typing it will be replaced with the correct DefFun instance.
 
     """
+    if read_mod_fun is None:
+        read_mod_fun = _ReadMod
     state = _ModPoolState()
     out = ModPool()
 
@@ -404,11 +535,27 @@ def ReadModulesRecursively(root: Path,
     #    we then try to read each imported module - if it has not already been imported.
     #    however, for parameterized imports, this may not be possible yet.
     #  Once all imports have been resolved, the module is no longer "active"
+    #
+    # Resolving the global symbols of a module only makes progress if the module is new
+    # or if some of its imports were resolved since the last time (this includes the
+    # imports of the module a generic module was instantiated from since
+    # the module args may refer to them). So we only revisit those "dirty" modules.
+    dirty: set[ModId] = set(mi.mid for mi in active)
+    instantiated_by: dict[ModId, list[_ModInfo]] = collections.defaultdict(list)
+
+    def mark_dirty(mi: _ModInfo):
+        if mi.mid in dirty:
+            return
+        dirty.add(mi.mid)
+        for gmi in instantiated_by[mi.mid]:
+            mark_dirty(gmi)
+
     while active:
         new_active: list[_ModInfo] = []
         # this probably needs to be a fix point computation as well
         symbolize.ResolveGlobalAndImportedSymbolsOutsideFunctionsAndMacros(
-            state.AllMods(), out.builtin_symtab)
+            [mi.mod for mi in state.AllModInfos() if mi.mid in dirty], out.builtin_symtab)
+        dirty.clear()
         for mod_info in active:
             assert isinstance(mod_info, _ModInfo), mod_info
             logger.info("start resolving imports for %s", mod_info)
@@ -417,7 +564,8 @@ def ReadModulesRecursively(root: Path,
                 import_node = import_info.import_node
                 if import_info.HasBeenResolved():
                     continue
-                if import_node.args_mod and not import_info.TryToNormalizeModArgs():
+                if import_node.args_mod and (import_info.IsBlocked() or
+                                             not import_info.TryToNormalizeModArgs()):
                     num_unresolved_imports += 1
                     continue
                 pathname = import_node.path
@@ -435,7 +583,9 @@ def ReadModulesRecursively(root: Path,
                     _SpecializeGenericModule(mod, import_info.normalized_args)
                     mi = state.AddModInfo(
                         path, import_info.normalized_args, mod)
+                    instantiated_by[mod_info.mid].append(mi)
                     new_active.append(mi)
+                    dirty.add(mi.mid)
                 else:
                     # see if the module has been read already
                     mi = state.GetModInfo((path,))
@@ -443,9 +593,11 @@ def ReadModulesRecursively(root: Path,
                         mod = read_mod_fun(path)
                         mi = state.AddModInfo(path, [], mod)
                         new_active.append(mi)
+                        dirty.add(mi.mid)
                 logger.info(
                     f"in {mod_info.mod} resolving inport of {mi.mod.name}")
                 import_info.ResolveImport(mi.mod)
+                mark_dirty(mod_info)
 
             if num_unresolved_imports:
                 new_active.append(mod_info)
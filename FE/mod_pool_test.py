@@ -2,6 +2,9 @@
 
 import pathlib
 import logging
+import os
+import tempfile
+import unittest
 
 from FE import cwast
 from FE import mod_pool
@@ -10,17 +13,17 @@ from FE import symbolize
 logger = logging.getLogger(__name__)
 
 _test_mods_std = {
-    "builtin": cwast.DefMod("builtin", [], []),
-    "os": cwast.DefMod("os", [], []),
-    "math": cwast.DefMod("math", [], []),
-    "std":  cwast.DefMod("std", [], []),
+    "builtin": cwast.DefMod(cwast.NAME.Make("builtin"), [], []),
+    "os": cwast.DefMod(cwast.NAME.Make("os"), [], []),
+    "math": cwast.DefMod(cwast.NAME.Make("math"), [], []),
+    "std":  cwast.DefMod(cwast.NAME.Make("std"), [], []),
 }
 _test_mods_local = {
-    "helper": cwast.DefMod("helper", [],
+    "helper": cwast.DefMod(cwast.NAME.Make("helper"), [],
                            [cwast.Import(cwast.NAME.Make("os"), "", [])]),
-    "math":  cwast.DefMod("math", [],
+    "math":  cwast.DefMod(cwast.NAME.Make("math"), [],
                           [cwast.Import(cwast.NAME.Make("std"), "", [])]),
-    "main": cwast.DefMod("main", [],
+    "main": cwast.DefMod(cwast.NAME.Make("main"), [],
                          [cwast.Import(cwast.NAME.Make("std"), "", []),
                           cwast.Import(cwast.NAME.Make("math"), "", []),
                           # cwast.Import(cwast.NAME.Make("./math"), "", []),
@@ -28,25 +31,170 @@ _test_mods_local = {
 }
 
 
-def _ReadMod(handle, _) -> cwast.DefMod:
+def _ReadMod(handle) -> cwast.DefMod:
     name = handle.name
     dir = handle.parent.name
     mod = _test_mods_std[name] if dir == "Lib" else _test_mods_local[name]
     return mod
 
 
-def tests(cwd: str):
-    mp = mod_pool.ReadModulesRecursively(
-        pathlib.Path(cwd) / "Lib",
-        ["builtin", str(pathlib.Path("./main").resolve())],
-        False,
-        _ReadMod)
-    print([m.name for m in mp.mods_in_topo_order])
-    print("OK")
+def _ModNames(mods) -> list[str]:
+    return [str(m.name) for m in mods]
+
+
+class _ModTestCase(unittest.TestCase):
+    """Provides a scratch directory for .cw sources"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def WriteMod(self, name: str, text: str):
+        (self.root / (name + mod_pool.EXTENSION_CW)).write_text(text)
+
+    def ReadMods(self, read_mod_fun=None) -> mod_pool.ModPool:
+        return mod_pool.ReadModulesRecursively(
+            self.root, [str(self.root / "main")], False, read_mod_fun)
+
+
+class TestModPool(unittest.TestCase):
+
+    def testTopoOrder(self):
+        mp = mod_pool.ReadModulesRecursively(
+            pathlib.Path(os.getcwd()) / "Lib",
+            ["builtin", str(pathlib.Path("./main").resolve())],
+            False,
+            _ReadMod)
+        names = _ModNames(mp.mods_in_topo_order)
+        self.assertEqual(sorted(names), ["builtin", "helper", "main", "math", "os", "std"])
+        for importer, importee in [("main", "std"), ("main", "math"), ("main", "helper"),
+                                   ("helper", "os")]:
+            self.assertLess(names.index(importee), names.index(importer))
+
+
+class TestImportFixpoint(_ModTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rounds: list[list[str]] = []
+        self._orig = symbolize.ResolveGlobalAndImportedSymbolsOutsideFunctionsAndMacros
+
+        def resolve(mods, builtin_symtab):
+            self.rounds.append(sorted(_ModNames(mods)))
+            return self._orig(mods, builtin_symtab)
+
+        symbolize.ResolveGlobalAndImportedSymbolsOutsideFunctionsAndMacros = resolve
+
+    def tearDown(self):
+        symbolize.ResolveGlobalAndImportedSymbolsOutsideFunctionsAndMacros = self._orig
+        super().tearDown()
+
+    def testOnlyDirtyModsAreResolved(self):
+        self.WriteMod("helper", "module:\n\npub rec Foo:\n    x u32\n")
+        self.WriteMod("box", "module($type TYPE):\n\npub rec Box:\n    y $type\n")
+        # the args of the generic import can only be normalized once helper was
+        # imported and the symbols of main were resolved again
+        self.WriteMod("main", 'module:\n\nimport helper = "./helper"\n\n'
+                              'import box = "./box" (helper\\Foo)\n')
+        mp = self.ReadMods()
+        names = _ModNames(mp.mods_in_topo_order)
+        self.assertEqual(sorted(names[:2]), ["box/1", "helper"])
+        self.assertEqual(names[2], "main")
+        self.assertEqual(self.rounds, [
+            ["main"],
+            # main resolved its helper import, helper is new
+            ["helper", "main"],
+            # main resolved its generic import, box/1 is new
+            ["box/1", "main"],
+        ])
+
+    def testChangedDependencyMarksImporterDirty(self):
+        self.WriteMod("leaf", "module:\n\npub rec Foo:\n    x u32\n")
+        self.WriteMod("helper", 'module:\n\nimport leaf = "./leaf"\n\npub type Bar = leaf\\Foo\n')
+        self.WriteMod("box", "module($type TYPE):\n\npub rec Box:\n    y $type\n")
+        # helper\Bar only resolves once helper has imported leaf, the generic
+        # instance import of main must wait for that
+        self.WriteMod("main", 'module:\n\nimport helper = "./helper"\n\n'
+                              'import box = "./box" (helper\\Bar)\n')
+        mp = self.ReadMods()
+        self.assertEqual(sorted(_ModNames(mp.mods_in_topo_order)),
+                         ["box/1", "helper", "leaf", "main"])
+        self.assertEqual(self.rounds, [
+            ["main"],
+            # main resolved its helper import, the generic import is blocked on
+            # leaf\Foo (via helper\Bar)
+            ["helper", "main"],
+            # helper resolved its leaf import, main is clean and not resolved again
+            ["helper", "leaf"],
+            # the progress in helper unblocked the generic import of main
+            ["box/1", "main"],
+        ])
+
+    def testImportCycleTerminates(self):
+        self.WriteMod("a", 'module:\n\nimport b = "./b"\n')
+        self.WriteMod("b", 'module:\n\nimport a = "./a"\n')
+        self.WriteMod("main", 'module:\n\nimport a = "./a"\n')
+        # the fixpoint terminates, the cycle is then rejected by the topo sort
+        with self.assertRaises(AssertionError):
+            self.ReadMods()
+        self.assertEqual(len(self.rounds), 3)
+
+
+class TestModCache(_ModTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = self.root / "cache"
+        self.WriteMod("helper", "module:\n\npub global a u32 = 1\n")
+        self.WriteMod("main", 'module:\n\nimport helper = "./helper"\n\n'
+                              'global b u32 = helper\\a\n')
+
+    def ReadCached(self):
+        cache = mod_pool.ModCache(self.cache_dir)
+        mp = self.ReadMods(cache)
+        return cache, mp
+
+    def _HelperGlobals(self, mp) -> list[str]:
+        helper = [m for m in mp.mods_in_topo_order if str(m.name) == "helper"][0]
+        return [str(n.name) for n in helper.body_mod if isinstance(n, cwast.DefGlobal)]
+
+    def testHits(self):
+        cache, _ = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cache, mp = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+        self.assertEqual(_ModNames(mp.mods_in_topo_order), ["helper", "main"])
+
+    def testInvalidation(self):
+        self.ReadCached()
+        # a changed dependency is read again, its unchanged importer is not
+        self.WriteMod("helper", "module:\n\npub global a u32 = 1\n\npub global c u32 = 2\n")
+        cache, mp = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(self._HelperGlobals(mp), ["a", "c"])
+        # a changed importer
+        self.WriteMod("main", 'module:\n\nimport helper = "./helper"\n\n'
+                              'global b u32 = helper\\c\n')
+        cache, _ = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def testCorruptEntries(self):
+        self.ReadCached()
+        entries = list(self.cache_dir.iterdir())
+        self.assertEqual(len(entries), 2)
+        entries[0].write_bytes(b"garbage")
+        entries[1].write_bytes(entries[1].read_bytes()[:20])
+        cache, mp = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(self._HelperGlobals(mp), ["a"])
+        # the broken entries were replaced
+        cache, _ = self.ReadCached()
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
 
 
 if __name__ == "__main__":
-    import os
-    logging.basicConfig(level=logging.INFO)
-    logger.setLevel(logging.INFO)
-    tests(os.getcwd())
+    logging.basicConfig(level=logging.WARNING)
+    unittest.main()
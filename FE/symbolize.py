@@ -257,11 +257,11 @@ def _CheckAddressCanBeTaken(lhs):
             lhs.x_srcloc, f"in {lhs.x_srcloc} cannot take address of {lhs}")
 
 
-def VerifySymbols(node):
-    """all macros should have been resolved by now"""
+def MakeSymbolVerifier():
+    """Returns the visitor used by VerifySymbols for cwast.VisitAstRecursivelyFused"""
     in_def_macro = False
 
-    def visitor(node: Any, nfd: cwast.NFD):
+    def visitor(node: Any, _parent: Any, nfd: cwast.NFD):
         nonlocal in_def_macro
 
         if cwast.NF.TOP_LEVEL in node.FLAGS:
@@ -302,7 +302,12 @@ def VerifySymbols(node):
         if isinstance(node, cwast.ExprAddrOf):
             _CheckAddressCanBeTaken(node.expr_lhs)
 
-    cwast.VisitAstRecursivelyWithField(node, visitor, None)
+    return visitor
+
+
+def VerifySymbols(node):
+    """all macros should have been resolved by now"""
+    cwast.VisitAstRecursivelyFused(node, [MakeSymbolVerifier()])
 
 
 def _FunSetTargetField(fun):
@@ -41,13 +41,13 @@ def IsDropMutConversion(ct_src: cwast.CanonType, ct_dst: cwast.CanonType) -> boo
 
 def IsSubtypeToUnionConversion(ct_src: cwast.CanonType, ct_dst: cwast.CanonType) -> bool:
     if ct_dst.is_union():
-        dst_children = set([x.name for x in ct_dst.union_member_types()])
+        dst_children = ct_dst.union_member_set()
         if ct_src.is_union():
             if ct_dst.untagged != ct_src.untagged:
                 return False
-            return set([x.name for x in ct_src.union_member_types()]).issubset(dst_children)
+            return ct_src.union_member_set() <= dst_children
         else:
-            return ct_src.name in dst_children
+            return ct_src in dst_children
     return False
 
 
@@ -394,13 +394,37 @@ def SetAbiInfoRecursively(ct: cwast.CanonType, ta: TargetArchConfig):
     ct.Finalize(size, alignment, machines_regs)
 
 
+# types identified by their name rather than their structure
+_NOMINAL_TYPES = (cwast.TypeBase, cwast.DefRec, cwast.DefEnum, cwast.DefType)
+
+
+def _StructuralKey(ct: cwast.CanonType) -> tuple:
+    """The key under which the TypeCorpus interns `ct`
+
+    Must agree with the keys built by the TypeCorpus.Insert*Type() methods.
+    Since CanonTypes are interned, children are compared by identity.
+    """
+    n = ct.node
+    if n is cwast.TypePtr or n is cwast.TypeSpan:
+        return (n, ct.mut, ct.children[0])
+    elif n is cwast.TypeVec:
+        return (n, ct.dim, ct.children[0])
+    elif n is cwast.TypeUnion:
+        return (n, ct.untagged, ct.union_member_set())
+    elif n is cwast.TypeFun:
+        return (n, tuple(ct.children))
+    else:
+        assert n in _NOMINAL_TYPES, f"unknown type {n}"
+        return (n, ct.name)
+
+
 class TypeCorpus:
     """The type corpus uniquifies types
 
-    It does so by representing each type with a string (basically a serialized
-    version of type like "array<ptr<u32>,128>").
-    That serialized version is mapped back to a structural version expressed
-    using AST nodes.
+    Structural types (ptr, span, vec, union, fun) are keyed by their node
+    kind, flags and (already uniquified) children, nominal types by their
+    name. The string version of a type (like "vec<128,ptr<u32>>") is
+    only rendered when it is asked for.
     """
 
     def __init__(self, target_arch_config: TargetArchConfig):
@@ -409,7 +433,8 @@ class TypeCorpus:
         self._typeid_curr = 0
         # maps to ast
         self.topo_order: list[cwast.CanonType] = []
-        self.corpus: dict[str, cwast.CanonType] = {}  # name to canonical type
+        # structural key (see _StructuralKey) to canonical type
+        self.corpus: dict[tuple, cwast.CanonType] = {}
         # will be set to False by SetAbiInfoForall() after which the AbiInfo
         # will be set as soon as a new CanonType is created.
         self._initial_typing = True
@@ -454,14 +479,19 @@ class TypeCorpus:
             SetAbiInfoRecursively(ct, self._target_arch_config)
         self._initial_typing = False
 
+    def Contains(self, ct: cwast.CanonType) -> bool:
+        return self.corpus.get(_StructuralKey(ct)) is ct
+
     def _insert(self, ct: cwast.CanonType) -> cwast.CanonType:
         """The only type not finalized here are Recs"""
-        assert ct.name not in self.corpus, f"duplicate insertion of type: {ct.name}"
+        key = _StructuralKey(ct)
+        assert key not in self.corpus, f"duplicate insertion of type: {ct.name}"
 
         # print(f">>>>>>>> ",  ct.name,  ct.typeid, ct.original_type)
-        self.corpus[ct.name] = ct
+        self.corpus[key] = ct
         self.topo_order.append(ct)
-        assert STRINGIFIEDTYPE_RE.fullmatch(
+        # the names of structural types are composed of checked names
+        assert ct.node not in _NOMINAL_TYPES or STRINGIFIEDTYPE_RE.fullmatch(
             ct.name), f"bad type name [{ct.name}]"
         if not self._initial_typing:
             SetAbiInfoRecursively(ct, self._target_arch_config)
@@ -476,25 +506,25 @@ class TypeCorpus:
         return self._insert(ct)
 
     def InsertPtrType(self, mut: bool, ct: cwast.CanonType) -> cwast.CanonType:
-        name = f"ptr_mut<{ct.name}>" if mut else f"ptr<{ct.name}>"
-        if name in self.corpus:
-            return self.corpus[name]
-        ct = cwast.CanonType(cwast.TypePtr, name, mut=mut, children=[ct])
+        out = self.corpus.get((cwast.TypePtr, mut, ct))
+        if out is not None:
+            return out
+        ct = cwast.CanonType(cwast.TypePtr, None, mut=mut, children=[ct])
         return self._insert(ct)
 
     def InsertSpanType(self, mut: bool, ct: cwast.CanonType) -> cwast.CanonType:
-        name = f"span_mut<{ct.name}>" if mut else f"span<{ct.name}>"
-        if name in self.corpus:
-            return self.corpus[name]
-        ct = cwast.CanonType(cwast.TypeSpan, name, mut=mut, children=[ct])
+        out = self.corpus.get((cwast.TypeSpan, mut, ct))
+        if out is not None:
+            return out
+        ct = cwast.CanonType(cwast.TypeSpan, None, mut=mut, children=[ct])
         return self._insert(ct)
 
     def InsertVecType(self, dim: int, ct: cwast.CanonType) -> cwast.CanonType:
         assert isinstance(dim, int)
-        name = f"vec<{dim},{ct.name}>"
-        if name in self.corpus:
-            return self.corpus[name]
-        ct = cwast.CanonType(cwast.TypeVec, name, dim=dim, children=[ct])
+        out = self.corpus.get((cwast.TypeVec, dim, ct))
+        if out is not None:
+            return out
+        ct = cwast.CanonType(cwast.TypeVec, None, dim=dim, children=[ct])
         return self._insert(ct)
 
     def InsertRecType(self, name: str, ast_node: cwast.DefRec, process_children) -> cwast.CanonType:
@@ -531,32 +561,29 @@ class TypeCorpus:
                     pp.add(cc)
             else:
                 pp.add(c)
-        sorted_children = sorted(pp)
-        sorted_names = [x.name for x in sorted(sorted_children)]
-        extra = "_untagged" if untagged else ""
-        name = f"sum{extra}<{','.join(sorted_names)}>"
-        if name in self.corpus:
-            return self.corpus[name]
-        ct = cwast.CanonType(cwast.TypeUnion, name,
-                             children=sorted_children, untagged=untagged)
+        members = frozenset(pp)
+        out = self.corpus.get((cwast.TypeUnion, untagged, members))
+        if out is not None:
+            return out
+        # the order of the children determines the name and the union tags
+        ct = cwast.CanonType(cwast.TypeUnion, None,
+                             children=sorted(pp), untagged=untagged)
         if not untagged:
             ct.set_union_kind()
         return self._insert(ct)
 
     def InsertFunType(self, params: list[cwast.CanonType],
                       result: cwast.CanonType) -> cwast.CanonType:
-        x = [p.name for p in params]
-        x.append(result.name)
-        name = f"fun<{','.join(x)}>"
-        if name in self.corpus:
-            return self.corpus[name]
-        ct = cwast.CanonType(cwast.TypeFun, name, children=params + [result])
+        children = params + [result]
+        out = self.corpus.get((cwast.TypeFun, tuple(children)))
+        if out is not None:
+            return out
+        ct = cwast.CanonType(cwast.TypeFun, None, children=children)
         return self._insert(ct)
 
     def InsertWrappedTypePrep(self, name: str) -> cwast.CanonType:
         """Note: we re-use the original ast node"""
         name = f"wrapped<{name}>"
-        assert name not in self.corpus
         ct = cwast.CanonType(cwast.DefType, name)
         return self._insert(ct)
 
@@ -1127,7 +1127,7 @@ def VerifyTypesRecursively(node, tc: type_corpus.TypeCorpus, verifier_table):
         if cwast.NF.TYPE_ANNOTATED in node.FLAGS:
             ct: cwast.CanonType = node.x_type
             assert not ct.desugared, f"desugared node {node}"
-            assert ct.name in tc.corpus, f"bad type annotation for {
+            assert tc.Contains(ct), f"bad type annotation for {
                 node}: {node.x_type}"
 
             verifier_table[type(node)](node, tc)
@@ -1287,8 +1287,8 @@ def main(argv: list[str]):
     for mod in mp.mods_in_topo_order:
         VerifyTypesRecursively(mod, tc, VERIFIERS_BEFORE_INITIAL_TRANSFORMS)
 
-    for t, n in tc.corpus.items():
-        logger.info("%s %s %d %d", t, n.ir_regs, n.size, n.alignment)
+    for ct in tc.corpus.values():
+        logger.info("%s %s %d %d", ct.name, ct.ir_regs, ct.size, ct.alignment)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+#!/bin/env python3
+# (c) Robert Muth - see LICENSE for more info
+
+"""Compact binary encoding of the Cwerg IR
+
+The encoding mirrors the textual IR line by line: every directive or
+instruction becomes one record so a reader can build exactly the same unit
+as the text parser (BE/Base/serialize.py: UnitAddParseFromBinary).
+
+File layout:
+
+    MAGIC record*
+
+Record layout:
+
+    varint(len(payload)) payload
+
+    payload: varint(opcode.no) operand*
+
+The number of operands follows from the opcode (see IR/opcode_tab.py).
+Each operand starts with a tag byte:
+
+    TAG_STR       varint(index)        previously seen name
+    TAG_NEW_STR   varint(len) utf8     new name, gets the next index
+    TAG_INT       zigzag varint        plain decimal number
+    TAG_TYPED_INT kind zigzag varint   number with data kind, e.g. `5:U32`
+    TAG_REAL      kind f64             floating point number with data kind
+    TAG_REG_DEF   kind name-operand    register definition, e.g. `x:S32`
+    TAG_BYTES     varint(len) bytes    payload of `.data`
+    TAG_LIST      varint(n) operand*   bracketed lists
+    TAG_TEXT      name-operand         any other token, kept verbatim
+
+Kinds are encoded as the value of the o.DK enum.
+"""
+
+import struct
+from typing import Any, List
+
+from IR import opcode_tab as o
+from Util import parse
+
+MAGIC = b"CWIRB\x01"
+
+EXTENSION = ".irb"
+
+TAG_STR = 0
+TAG_NEW_STR = 1
+TAG_INT = 2
+TAG_TYPED_INT = 3
+TAG_REAL = 4
+TAG_REG_DEF = 5
+TAG_BYTES = 6
+TAG_LIST = 7
+TAG_TEXT = 8
+
+_STRUCT_FMT = {
+    "u8": "<B",
+    "s8": "<b",
+    "u16": "<H",
+    "s16": "<h",
+    "u32": "<I",
+    "s32": "<i",
+    "u64": "<Q",
+    "s64": "<q",
+    "f32": "<f",
+    "f64": "<d",
+}
+
+
+def IsBinaryIr(path: str) -> bool:
+    with open(path, "rb") as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def EncodeVarint(out: bytearray, x: int):
+    assert x >= 0
+    while x >= 0x80:
+        out.append((x & 0x7f) | 0x80)
+        x >>= 7
+    out.append(x)
+
+
+def EncodeZigZag(out: bytearray, x: int):
+    EncodeVarint(out, (x << 1) if x >= 0 else ((-x << 1) - 1))
+
+
+def _ExtractBytes(v) -> bytes:
+    """Same as serialize.ExtractBytes in the backend"""
+    if isinstance(v, list):
+        return b"".join(_ExtractBytes(x) for x in v)
+
+    if v[0] == '"':
+        assert '"' == v[-1]
+        return parse.EscapedStringToBytes(v[1:-1])
+    else:
+        num = v.split(":")
+        if len(num) == 1:
+            num.append("u8")
+        fmt = _STRUCT_FMT[num[1]]
+        if num[1][0] == "f":
+            val = float(num[0])
+        else:
+            val = int(num[0], 0)
+        return struct.pack(fmt, val)
+
+
+def _NormalizeIntConst(value_str: str, kind: o.DK) -> int:
+    """Same checks and sign conversion as ir.ParseConst in the backend"""
+    bit_width = kind.bitwidth()
+    x = int(value_str, 0)
+    if kind.flavor() is o.DK_FLAVOR_U:
+        assert 0 <= x < (1 << bit_width), f"{x} value out of bounds for {kind}"
+        return x
+    # unsigned hex numbers may represent signed values
+    if value_str.startswith("0x") and x >= (1 << (bit_width - 1)):
+        x = x - (1 << bit_width)
+    assert -(1 << (bit_width - 1)) <= x < (1 << (bit_width - 1)
+                                           ), f"{x} value out of bounds for {kind}"
+    return x
+
+
+def _IsDecimal(token: str) -> bool:
+    return token.isdecimal() or (token[0] == "-" and token[1:].isdecimal())
+
+
+class Writer:
+    """Converts textual IR into binary IR
+
+    This is a file-like object accepting text (e.g. via `print(..., file=writer)`)
+    which writes the encoded records to `fout`, a binary stream.
+    Call Close() when done.
+    """
+
+    def __init__(self, fout):
+        self._fout = fout
+        self._strings: dict[str, int] = {}
+        self._pending = ""
+        fout.write(MAGIC)
+
+    def write(self, text: str):
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self.WriteLine(line)
+
+    def flush(self):
+        pass
+
+    def Close(self):
+        if self._pending:
+            self.WriteLine(self._pending)
+            self._pending = ""
+        self._fout.flush()
+
+    def WriteLine(self, line: str):
+        token: List[Any] = []
+        in_list = False
+        for t in parse.ParseLine(line):
+            if t.startswith("#"):
+                break
+            elif t == "]":
+                in_list = False
+            elif t == "[":
+                in_list = True
+                token.append([])
+            elif in_list:
+                token[-1].append(t)
+            else:
+                token.append(t)
+        if not token:
+            return
+        opc = o.Opcode.Table.get(token[0])
+        assert opc is not None, f"unknown opcode/directive: {token}"
+        payload = bytearray()
+        EncodeVarint(payload, opc.no)
+        for ok, v in zip(opc.operand_kinds, token[1:]):
+            if ok is o.OP_KIND.BYTES:
+                data = _ExtractBytes(v)
+                payload.append(TAG_BYTES)
+                EncodeVarint(payload, len(data))
+                payload += data
+            elif ok in (o.OP_KIND.REG, o.OP_KIND.CONST, o.OP_KIND.REG_OR_CONST):
+                self._EncodeRegOrConst(payload, v)
+            else:
+                self._EncodeGeneric(payload, v)
+        # operands beyond the ones the opcode expects (e.g. the optional `lea` offset)
+        for v in token[1 + len(opc.operand_kinds):]:
+            self._EncodeGeneric(payload, v)
+        record = bytearray()
+        EncodeVarint(record, len(payload))
+        record += payload
+        self._fout.write(record)
+
+    def _EncodeName(self, out: bytearray, s: str):
+        index = self._strings.get(s)
+        if index is not None:
+            out.append(TAG_STR)
+            EncodeVarint(out, index)
+        else:
+            self._strings[s] = len(self._strings)
+            data = s.encode("utf8")
+            out.append(TAG_NEW_STR)
+            EncodeVarint(out, len(data))
+            out += data
+
+    def _EncodeGeneric(self, out: bytearray, v: Any):
+        if isinstance(v, list):
+            out.append(TAG_LIST)
+            EncodeVarint(out, len(v))
+            for x in v:
+                self._EncodeGeneric(out, x)
+        elif _IsDecimal(v):
+            out.append(TAG_INT)
+            EncodeZigZag(out, int(v))
+        else:
+            self._EncodeName(out, v)
+
+    def _EncodeRegOrConst(self, out: bytearray, v: str):
+        assert isinstance(v, str), f"unexpected operand {v}"
+        pos = v.find(":")
+        if parse.IsLikelyConst(v):
+            if pos < 0:
+                if _IsDecimal(v):
+                    out.append(TAG_INT)
+                    EncodeZigZag(out, int(v))
+                else:
+                    out.append(TAG_TEXT)
+                    self._EncodeName(out, v)
+                return
+            kind = o.SHORT_STR_TO_RK.get(v[pos + 1:])
+            assert kind is not None, f"bad kind name [{v}]"
+            if kind.flavor() is o.DK_FLAVOR_R:
+                out.append(TAG_REAL)
+                out.append(kind.value)
+                out += struct.pack("<d", parse.ParseReal(v[:pos]))
+            else:
+                out.append(TAG_TYPED_INT)
+                out.append(kind.value)
+                EncodeZigZag(out, _NormalizeIntConst(v[:pos], kind))
+        elif "@" in v:
+            # cpu register annotations are rare and left to the text parser
+            out.append(TAG_TEXT)
+            self._EncodeName(out, v)
+        elif pos >= 0:
+            kind = o.SHORT_STR_TO_RK.get(v[pos + 1:])
+            assert kind is not None, f"bad kind name [{v}]"
+            out.append(TAG_REG_DEF)
+            out.append(kind.value)
+            self._EncodeName(out, v[:pos])
+        else:
+            self._EncodeName(out, v)
+
+
+if __name__ == "__main__":
+    import sys
+
+    def main():
+        """Converts textual IR on stdin to binary IR on stdout"""
+        writer = Writer(sys.stdout.buffer)
+        for line in sys.stdin:
+            writer.WriteLine(line)
+        writer.Close()
+
+    main()
@@ -0,0 +1,32 @@
+"""Helpers for the on-disk caches"""
+
+import contextlib
+import os
+import tempfile
+
+
+def WriteCacheFile(path, data: bytes) -> bool:
+    """Best effort write of a cache entry, returns False if it could not be written
+
+    The data is written to a temporary file in the same directory which is
+    then renamed, so concurrent readers never observe a partial entry.
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            fout.write(data)
+        # mkstemp creates the file with mode 0600 which breaks shared cache dirs
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException as e:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        if isinstance(e, OSError):
+            return False
+        raise
+    return True
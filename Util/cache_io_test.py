@@ -0,0 +1,43 @@
+#!/bin/env python3
+
+import os
+import stat
+import tempfile
+import unittest
+
+from Util import cache_io
+
+
+class TestWriteCacheFile(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def testWrite(self):
+        path = os.path.join(self.root, "sub", "entry")
+        self.assertTrue(cache_io.WriteCacheFile(path, b"data"))
+        with open(path, "rb") as fin:
+            self.assertEqual(fin.read(), b"data")
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+        # replacing an entry leaves no temporary files behind
+        self.assertTrue(cache_io.WriteCacheFile(path, b"new"))
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["entry"])
+
+    def testFailure(self):
+        blocker = os.path.join(self.root, "file")
+        with open(blocker, "w"):
+            pass
+        # the parent of the entry is not a directory
+        self.assertFalse(cache_io.WriteCacheFile(os.path.join(blocker, "entry"), b"data"))
+        # the entry is a directory which cannot be replaced
+        os.mkdir(os.path.join(self.root, "dir"))
+        self.assertFalse(cache_io.WriteCacheFile(os.path.join(self.root, "dir"), b"data"))
+        self.assertEqual(sorted(os.listdir(self.root)), ["dir", "file"])
+
+
+if __name__ == '__main__':
+    unittest.main()
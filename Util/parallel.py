@@ -0,0 +1,35 @@
+"""Process pools whose workers inherit large read-only state by forking"""
+
+import multiprocessing
+
+from typing import Any, Callable, Iterator, Optional
+
+# Set by ForkedMap right before the worker processes are forked so that
+# they inherit the state instead of having to unpickle it
+_FORKED_STATE: Optional[tuple[Callable, Any]] = None
+
+
+def _RunForked(item):
+    handler, state = _FORKED_STATE
+    return handler(state, item)
+
+
+def ForkedMap(handler: Callable, state: Any, items: list, jobs: int,
+              chunksize: int = 0) -> Iterator:
+    """Yields handler(state, item) for all `items` (in order) computed by `jobs`
+    forked worker processes
+
+    Only the items and the results are pickled. Changes the handler makes
+    to the state are not visible in the parent process.
+    By default every worker gets a few chunks of items to balance the load.
+    """
+    global _FORKED_STATE
+    assert _FORKED_STATE is None
+    _FORKED_STATE = (handler, state)
+    if chunksize == 0:
+        chunksize = max(1, len(items) // (4 * jobs))
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            yield from pool.imap(_RunForked, items, chunksize)
+    finally:
+        _FORKED_STATE = None
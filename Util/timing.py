@@ -0,0 +1,101 @@
+"""Phase timing instrumentation shared by the front- and backends
+
+Recording is off by default and costs next to nothing in that state.
+After Enable() every Span() and Lap() adds a "complete" event which
+WriteReport() dumps in the Chrome trace event format, i.e. the report is
+plain JSON which can also be loaded into chrome://tracing or ui.perfetto.dev.
+
+Spans can carry counters: `counters` is a zero argument callable returning
+a dict, e.g. {"inss": 100, "bbls": 10}, which gets evaluated before and
+after the span and is recorded as `inss_in`, `inss_out`, etc.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+from typing import Any, Callable, Optional
+
+_events: Optional[list[dict[str, Any]]] = None
+_start = 0.0
+_lap_start = 0.0
+
+
+def Enable():
+    global _events, _start, _lap_start
+    _events = []
+    _start = time.perf_counter()
+    _lap_start = _start
+
+
+def IsEnabled() -> bool:
+    return _events is not None
+
+
+def _Now() -> float:
+    return time.perf_counter()
+
+
+def _AddEvent(name: str, cat: str, start: float, end: float, args: dict[str, Any]):
+    assert _events is not None
+    _events.append({"name": name, "cat": cat, "ph": "X",
+                    "ts": round((start - _start) * 1e6, 1),
+                    "dur": round((end - start) * 1e6, 1),
+                    "pid": os.getpid(), "tid": 0, "args": args})
+
+
+@contextlib.contextmanager
+def Span(name: str, cat: str = "phase",
+         counters: Optional[Callable[[], dict[str, int]]] = None):
+    """Records the wall time of the enclosed block"""
+    global _lap_start
+    if _events is None:
+        yield
+        return
+    args: dict[str, Any] = {}
+    if counters:
+        for k, v in counters().items():
+            args[f"{k}_in"] = v
+    start = _Now()
+    end = None
+    try:
+        yield
+        end = _Now()
+        if counters:
+            for k, v in counters().items():
+                args[f"{k}_out"] = v
+    finally:
+        if end is None:
+            # the block raised, the "out" counters may not be computable
+            end = _Now()
+            args["error"] = True
+        _AddEvent(name, cat, start, end, args)
+        # do not charge the counter computation to the next lap
+        _lap_start = _Now()
+
+
+def Lap(name: str, cat: str = "phase", **args):
+    """Records the wall time since the last Lap() or Span() ended
+
+    This is convenient for long straight-line drivers.
+    """
+    global _lap_start
+    if _events is None:
+        return
+    end = _Now()
+    _AddEvent(name, cat, _lap_start, end, args)
+    _lap_start = end
+
+
+def ResetLap():
+    global _lap_start
+    _lap_start = _Now()
+
+
+def WriteReport(path: str, counters: Optional[dict[str, int]] = None):
+    assert _events is not None
+    report = {"traceEvents": _events, "displayTimeUnit": "ms",
+              "otherData": {"counters": dict(sorted((counters or {}).items()))}}
+    with open(path, "w") as fout:
+        json.dump(report, fout, indent=1)
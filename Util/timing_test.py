@@ -0,0 +1,58 @@
+#!/bin/env python3
+
+import json
+import os
+import tempfile
+import unittest
+
+from Util import timing
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        timing.Enable()
+
+    def tearDown(self):
+        timing._events = None
+
+    def _Report(self, counters=None):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "report.json")
+            timing.WriteReport(path, counters)
+            with open(path) as fin:
+                return json.load(fin)
+
+    def testReportFormat(self):
+        size = {"inss": 10}
+        with timing.Span("fun", "optimize", lambda: dict(size)):
+            size["inss"] = 7
+        timing.Lap("rest", mods=3)
+        report = self._Report({"b": 2, "a": 1})
+        self.assertEqual(report["displayTimeUnit"], "ms")
+        self.assertEqual(list(report["otherData"]["counters"].items()), [("a", 1), ("b", 2)])
+        span, lap = report["traceEvents"]
+        self.assertEqual(set(span.keys()), {"name", "cat", "ph", "ts", "dur", "pid", "tid", "args"})
+        self.assertEqual((span["name"], span["cat"], span["ph"]), ("fun", "optimize", "X"))
+        self.assertEqual(span["args"], {"inss_in": 10, "inss_out": 7})
+        self.assertEqual((lap["name"], lap["cat"], lap["args"]), ("rest", "phase", {"mods": 3}))
+        self.assertGreaterEqual(lap["ts"], span["ts"] + span["dur"])
+
+    def testSpanRecordedOnError(self):
+        with self.assertRaises(ValueError):
+            with timing.Span("broken", counters=lambda: {"inss": 1}):
+                raise ValueError()
+        event, = self._Report()["traceEvents"]
+        self.assertEqual(event["name"], "broken")
+        self.assertEqual(event["args"], {"inss_in": 1, "error": True})
+
+    def testDisabled(self):
+        timing._events = None
+        with timing.Span("ignored"):
+            pass
+        timing.Lap("ignored")
+        self.assertFalse(timing.IsEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/bin/env python3
+"""
+A long lived compile server for the Python frontend and backends of Cwerg
+
+Start it with:
+
+  `./cwerg.py -serve /tmp/cwerg.sock`
+
+and have the driver use it with:
+
+  `./cwerg.py -server /tmp/cwerg.sock FE/TestData/hello_world_test.cw hello.exe`
+
+At startup the server imports the frontend and all backends, builds the
+(otherwise lazily built) instruction selection tables and parses the stdlib.
+Each request is then handled by a forked child process which runs the frontend
+and backend in-process, handing the IR over in memory. Children share the warm
+state with the server via copy-on-write but cannot modify it, which matters
+because the compiler phases freely mutate the ASTs and some module level tables.
+Requests are served in parallel.
+
+Protocol: the client sends a single line of json and closes its writing end.
+The server answers with a single line of json: {"status": int, "log": str}.
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import logging
+import os
+import pathlib
+import socketserver
+import stat
+import sys
+import traceback
+from typing import Any
+
+from BE.Base import ir
+from BE.Base import serialize
+from BE.CodeGenA32 import codegen as codegen_a32
+from BE.CodeGenA32 import isel_tab as isel_tab_a32
+from BE.CodeGenA64 import codegen as codegen_a64
+from BE.CodeGenA64 import isel_tab as isel_tab_a64
+from BE.CodeGenX64 import codegen as codegen_x64
+from BE.CodeGenX64 import isel_tab as isel_tab_x64
+from FE import compiler
+from FE import mod_pool
+
+logger = logging.getLogger(__name__)
+
+_CODEGEN_MAP: dict[str, Any] = {
+    "x64": codegen_x64,
+    "a64": codegen_a64,
+    "a32": codegen_a32,
+}
+
+
+def Compile(request: dict[str, Any], read_mod_fun) -> None:
+    """Compiles request["input"] (a .cw file) into the executable request["output"]
+
+    request["syslibs"] are the assembly files linked into every executable.
+    """
+    arch = request["arch"]
+    ir_text = io.StringIO()
+    with contextlib.redirect_stdout(ir_text):
+        status = compiler.main(["-arch", arch, "-stdlib", request["stdlib"],
+                                request["input"], "-"], read_mod_fun)
+    assert status == 0, f"frontend failed with status {status}"
+    ir_text.seek(0)
+    unit = ir.Unit("module")
+    for fn in request["syslibs"]:
+        with open(fn) as fin:
+            serialize.UnitAddParseFromAsm(unit, fin)
+    serialize.UnitAddParseFromAsm(unit, ir_text)
+    serialize.UnitSanityCheckAfterParse(unit)
+    opt_stats: dict[str, int] = collections.defaultdict(int)
+    exe = _CODEGEN_MAP[arch].EmitUnitAsExe(unit, opt_stats, request.get("jobs", 1))
+    output = request["output"]
+    with open(output, "wb") as fout:
+        exe.save(fout)
+    os.chmod(output, stat.S_IREAD | stat.S_IEXEC | stat.S_IWRITE)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Runs in a child process forked for the request"""
+
+    def handle(self):
+        log = io.StringIO()
+        status = 0
+        try:
+            request = json.loads(self.rfile.readline())
+            logger.info("compiling %s", request["input"])
+            with contextlib.redirect_stderr(log):
+                Compile(request, self.server.preloaded_mods)
+        except BaseException:
+            # this includes SystemExit from argparse and the frontend's error reporting
+            log.write(traceback.format_exc())
+            status = 1
+        response = {"status": status, "log": log.getvalue()}
+        self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+
+
+class CompileServer(socketserver.ForkingUnixStreamServer):
+
+    def __init__(self, socket_path: str, stdlib: pathlib.Path):
+        # otherwise every forked child would build the tables from scratch
+        for isel_tab in (isel_tab_x64, isel_tab_a64, isel_tab_a32):
+            isel_tab.Pattern.Table.Preload()
+        self.preloaded_mods = mod_pool.ModPreloader()
+        self.preloaded_mods.Preload(
+            [p.with_suffix("") for p in sorted(stdlib.resolve().glob("*" + mod_pool.EXTENSION_CW))])
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+
+def Serve(socket_path: str, stdlib: str):
+    with CompileServer(socket_path, pathlib.Path(stdlib)) as server:
+        logger.info("serving on %s", socket_path)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    def main():
+        parser = argparse.ArgumentParser(description='Cwerg compile server')
+        parser.add_argument('-stdlib', help='path to stdlib directory',
+                            default=os.path.dirname(os.path.realpath(__file__)) + "/FE/Lib")
+        parser.add_argument('socket', type=str, help='path of the unix socket to listen on')
+        args = parser.parse_args()
+        logging.basicConfig(level=logging.INFO)
+        Serve(args.socket, args.stdlib)
+
+    main()
@@ -102,6 +102,27 @@ make build_compiler
     return f"{be} -mode binary {' '.join(syslibs)} {input} {output}"
 
 
+def CompileViaServer(socket_path: str, arch: str, input: str, output: str) -> int:
+    """Have a compile server (see compile_server.py) do the work"""
+    import json
+    import socket
+    request = {
+        "arch": arch,
+        "stdlib": STD_LIB_DIR,
+        "syslibs": SYSLIB_MAP[arch],
+        "input": os.path.abspath(input),
+        "output": os.path.abspath(output),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode("utf8") + b"\n")
+        conn.shutdown(socket.SHUT_WR)
+        with conn.makefile("rb") as fin:
+            response = json.loads(fin.readline())
+    sys.stderr.write(response["log"])
+    return response["status"]
+
+
 def Diagnostics():
     print(LINES)
     print("Diagnostics")
@@ -167,10 +188,16 @@ def main():
     parser.add_argument('-diag', help='show diagnostics and exit',
                         action='store_true')
 
+    parser.add_argument('-serve', help='run a compile server listening on the given unix socket')
+
     args, remainder = parser.parse_known_args()
     if args.diag:
         Diagnostics()
         return 0
+    if args.serve:
+        import compile_server
+        compile_server.Serve(args.serve, STD_LIB_DIR)
+        return 0
 
     parser = argparse.ArgumentParser(description='Cwerg compiler driver',
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -178,6 +205,7 @@ def main():
     # replicated args here so it appears in the help text
     parser.add_argument('-diag', help='show diagnostics and exit',
                         action='store_true')
+    parser.add_argument('-serve', help='run a compile server listening on the given unix socket')
     #
     parser.add_argument('-fe', help=f"frontend to use",
                         default="c++", choices=["py", "c++"])
@@ -189,6 +217,8 @@ def main():
                         action='store_true')
     parser.add_argument('-dry_run', help='show but do not execute commands',
                         action='store_true')
+    parser.add_argument('-server', help='unix socket of a compile server to use instead of '
+                        'running the frontend and backend (-fe and -be are ignored)')
     # parser.add_argument('-tmp', help='directry for temp files', default="/tmp")
 
     parser.add_argument('input', metavar='input-src', type=str,
@@ -197,10 +227,17 @@ def main():
                         help='the output executable')
     args = parser.parse_args(remainder)
 
-    intermeditate_file = args.output + ".ir"
-
     arch = DEFAULT_ARCH if args.arch == "auto" else args.arch
 
+    if args.server:
+        if args.v or args.dry_run:
+            print(f"compile {args.input} -> {args.output} via server {args.server}")
+        if args.dry_run:
+            return 0
+        return CompileViaServer(args.server, arch, args.input, args.output)
+
+    intermeditate_file = args.output + ".ir"
+
     fe_cmd = GetFeCommand(args.fe, arch, args.input, intermeditate_file)
     if args.v or args.dry_run:
         print(fe_cmd)